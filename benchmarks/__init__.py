@@ -0,0 +1,14 @@
+# -*- coding: utf-8; -*-
+"""Performance benchmarks for NightLightPi.
+
+Every benchmark module exposes a run function returning a dict of
+results and can be executed directly, for example:
+
+    python -m benchmarks.bench_scheduler
+
+None of the benchmarks need Raspberry Pi hardware. benchmarks.suite runs
+them all and saves the results as JSON for comparing between commits:
+
+    python -m benchmarks.suite --compare benchmarks/results/<commit>.json
+
+"""
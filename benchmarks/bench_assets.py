@@ -0,0 +1,78 @@
+# -*- coding: utf-8; -*-
+"""Menu switch latency with and without the precompiled display assets.
+
+Switching between the three menus is timed on a simulated SSD1306, first
+the way the light used to do it, decoding the image with PIL and packing
+it into pages, then by sending the frame straight from the mapped asset
+pack. Preparing the frame and sending it are reported separately, since
+sending over the simulated I2C bus costs the same either way. The time
+to compile the pack and to map an existing one is also reported.
+
+"""
+
+import shutil
+import statistics
+import tempfile
+import time
+from os.path import dirname
+from os.path import join
+
+from nightlightpi.assets import AssetPack
+from nightlightpi.assets import compile_assets
+from nightlightpi.display import DiffingDisplay
+from nightlightpi.display import image_to_pages
+from nightlightpi.display import open_image
+from nightlightpi.simulated import SimulatedSSD1306
+
+
+IMAGES = join(dirname(dirname(__file__)), "images")
+MENUS = [join(IMAGES, name) for name in ("menu_off.ppm", "menu_temperature.ppm", "menu_rainbow.ppm")]
+
+
+def _switch(prepare, switches):
+    display = DiffingDisplay(SimulatedSSD1306())
+    prepared = []
+    sent = []
+    for switch in range(switches):
+        path = MENUS[switch % len(MENUS)]
+        started = time.perf_counter()
+        frame = prepare(path)
+        ready = time.perf_counter()
+        display.show_buffer(frame)
+        done = time.perf_counter()
+        prepared.append((ready - started) * 1e6)
+        sent.append((done - ready) * 1e6)
+    return {"prepare_us": statistics.median(prepared),
+            "send_us": statistics.median(sent),
+            "switch_us": statistics.median(p + s for p, s in zip(prepared, sent))}
+
+
+def run(switches=300):
+    directory = tempfile.mkdtemp()
+    try:
+        path = join(directory, "assets.bin")
+        started = time.perf_counter()
+        compile_assets(MENUS, path)
+        compiled = time.perf_counter()
+        pack = AssetPack(path)
+        mapped = time.perf_counter()
+        try:
+            results = {"compile_ms": (compiled - started) * 1000,
+                       "map_ms": (mapped - compiled) * 1000,
+                       "decoded": _switch(lambda menu: image_to_pages(open_image(menu)), switches),
+                       "precompiled": _switch(pack.frame, switches)}
+        finally:
+            pack.close()
+    finally:
+        shutil.rmtree(directory)
+    results["speedup"] = results["decoded"]["switch_us"] / results["precompiled"]["switch_us"]
+    return results
+
+
+def main():
+    for name, result in run().items():
+        print("{0}: {1}".format(name, result))
+
+
+if __name__ == "__main__":
+    main()
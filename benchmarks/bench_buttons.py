@@ -0,0 +1,70 @@
+# -*- coding: utf-8; -*-
+"""Button press to LED latency, with bouncing contacts.
+
+A simulated light is started in Temperature mode and the light button
+is pressed repeatedly, each press and release being a short burst of
+edges as a real switch produces. The light button can be held, so a
+press is acted on when it is released. Measured is the time from the
+first edge of a release to the strip being written with the next mode, along
+with the edge, bounce and gesture counts reported by the buttons.
+
+"""
+
+import time
+from unittest.mock import patch
+
+from benchmarks.bench_nightlight import _summary
+from benchmarks.bench_startup import simulated_data
+from nightlightpi.config import load_config
+from nightlightpi.simulated import FakeBroker
+
+
+def _light():
+    from nightlightpi.nightlight import NightLight
+    data = simulated_data()
+    data["timing"]["menu_button_pressed_time_in_seconds"] = 0.02
+    with patch("nightlightpi.config.load_valid_yaml", return_value=data):
+        config = load_config()
+    with patch("nightlightpi.simulated.default_broker", return_value=FakeBroker()):
+        return NightLight(config)
+
+
+def run(presses=100):
+    light = _light()
+    GPIO = light.GPIO
+    pin = light.config.inputs.button_light
+    sink = light.LEDStrip.sink
+    latencies = []
+    try:
+        light.start()
+        time.sleep(0.1)
+        for _ in range(presses):
+            for level in (GPIO.LOW, GPIO.HIGH, GPIO.LOW, GPIO.HIGH, GPIO.LOW):
+                GPIO.set_level(pin, level)
+            time.sleep(0.025)
+            frames = sink.frames
+            started = time.perf_counter()
+            for level in (GPIO.HIGH, GPIO.LOW, GPIO.HIGH):
+                GPIO.set_level(pin, level)
+            while sink.frames == frames:
+                time.sleep(0.00005)
+            latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.025)
+        stats = light.buttons.stats()
+    finally:
+        light.stop()
+        if light.is_alive():
+            light.join()
+    result = _summary(latencies)
+    result.update(edges=stats["edges"], bounces=stats["bounces"],
+                  gestures=stats["gestures"])
+    return result
+
+
+def main():
+    for name, value in run().items():
+        print("{0}: {1}".format(name, value))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8; -*-
+"""Cost of mapping a temperature to a colour against the number of bands.
+
+Compares the linear scan lightTemperature used to do with the compiled
+ColourMap in bands and gradient mode.
+
+"""
+
+import timeit
+
+from nightlightpi.colourmap import ColourMap
+
+
+def linear_colour(temperature, ranges, colours):
+    if temperature <= ranges[0]:
+        return colours[0]
+    if temperature >= ranges[-1]:
+        return colours[-1]
+    match = None
+    for boundary in range(len(ranges) - 1):
+        if ranges[boundary] < temperature <= ranges[boundary + 1]:
+            match = colours[boundary + 1]
+    return match
+
+
+def run(band_counts=(4, 16, 64, 256), lookups=20000):
+    results = {}
+    for count in band_counts:
+        ranges = [10 + 30 * i / count for i in range(count)]
+        colours = [(i % 256, (i * 7) % 256, (i * 13) % 256) for i in range(count + 1)]
+        temperatures = [10 + (i % 300) / 10 for i in range(lookups)]
+        bands = ColourMap(ranges, colours)
+        gradient = ColourMap(ranges, colours, mode="gradient")
+        results[count] = {
+            "linear_ns": _per_lookup(lambda t: linear_colour(t, ranges, colours), temperatures),
+            "bands_ns": _per_lookup(bands.colour, temperatures),
+            "gradient_ns": _per_lookup(gradient.colour, temperatures),
+        }
+    return results
+
+
+def _per_lookup(lookup, temperatures):
+    elapsed = timeit.timeit(lambda: [lookup(t) for t in temperatures], number=1)
+    return elapsed / len(temperatures) * 1e9
+
+
+def main():
+    print("{0:>6} {1:>10} {2:>10} {3:>12}".format("bands", "linear ns", "bands ns", "gradient ns"))
+    for count, r in run().items():
+        print("{0:>6} {1:>10.0f} {2:>10.0f} {3:>12.0f}".format(
+            count, r["linear_ns"], r["bands_ns"], r["gradient_ns"]))
+
+
+if __name__ == "__main__":
+    main()
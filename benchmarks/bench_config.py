@@ -0,0 +1,77 @@
+# -*- coding: utf-8; -*-
+"""Cold against warm config loading.
+
+Cold loads validate the sample config against the schema with pykwalify,
+warm loads read the cached Config pickle instead. Each is measured in a
+fresh interpreter, including the time to import nightlightpi.config, and
+again within this process where the imports are already done.
+
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import join
+
+from benchmarks.bench_startup import ROOT
+from benchmarks.bench_startup import simulated_config
+from nightlightpi.config import ENVCACHEPATH
+from nightlightpi.config import ENVCONFIGPATH
+from nightlightpi.config import load_config
+
+
+LOAD = """
+import time
+started = time.perf_counter()
+from nightlightpi.config import load_config
+load_config()
+print(time.perf_counter() - started)
+"""
+
+
+def _subprocess(env, runs):
+    times = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", LOAD], cwd=ROOT, env=env,
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        times.append(float(result.stdout.split()[-1]) * 1000)
+    return min(times)
+
+
+def _in_process(env, runs):
+    previous = dict(os.environ)
+    os.environ.update(env)
+    try:
+        load_config()
+        start = time.perf_counter()
+        for _ in range(runs):
+            load_config()
+        return (time.perf_counter() - start) / runs * 1000
+    finally:
+        os.environ.clear()
+        os.environ.update(previous)
+
+
+def run(runs=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = join(tmp, "nightlightpi.yaml")
+        simulated_config(path)
+        cold = {ENVCONFIGPATH: path, ENVCACHEPATH: ""}
+        warm = {ENVCONFIGPATH: path, ENVCACHEPATH: join(tmp, "config.pickle")}
+        results = {"cold_process_ms": _subprocess(dict(os.environ, **cold), runs),
+                   "cold_load_ms": _in_process(cold, runs)}
+        _in_process(warm, 1)
+        results["warm_process_ms"] = _subprocess(dict(os.environ, **warm), runs)
+        results["warm_load_ms"] = _in_process(warm, runs * 20)
+    return results
+
+
+def main():
+    for name, ms in run().items():
+        print("{0}: {1:.2f}".format(name, ms))
+
+
+if __name__ == "__main__":
+    main()
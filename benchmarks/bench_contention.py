@@ -0,0 +1,116 @@
+# -*- coding: utf-8; -*-
+"""Lock contention between many writers and the rainbow animation.
+
+A simulated light with a 300 LED strip runs the rainbow at 60 frames a
+second while a number of writer threads change what it shows, each
+about once a millisecond. It is run twice for each number of writers:
+
+- device: every writer draws to the strip itself, filling and sending
+  the whole frame with the strip lock held, as the light did before it
+  shared its state as snapshots
+- snapshot: every writer publishes a new reading with state.update and
+  asks for a redraw, which the scheduler thread composes from the latest
+  snapshot and swaps in
+
+Measured are the time spent waiting for the strip lock, as recorded by
+the metrics, and the rainbow frames missed against the target rate.
+
+"""
+
+import threading
+import time
+from unittest.mock import patch
+
+from benchmarks.bench_startup import simulated_data
+from nightlightpi.config import load_config
+from nightlightpi.simulated import FakeBroker
+
+
+FPS = 60
+
+
+def _light():
+    from nightlightpi.nightlight import NightLight
+    data = simulated_data()
+    data["led_strip"]["length"] = 300
+    data["led_strip"]["light"] = 300
+    data["timing"]["rainbow_fps"] = FPS
+    data["metrics"] = {"enable": True, "port": None}
+    with patch("nightlightpi.config.load_valid_yaml", return_value=data):
+        config = load_config()
+    with patch("nightlightpi.simulated.default_broker", return_value=FakeBroker()):
+        return NightLight(config)
+
+
+def _device_writer(light, index):
+    strip = light.LEDStrip
+    lock = light.LEDStrip_lock
+    colour = (index * 16 % 256, 128, 255 - index * 16 % 256)
+
+    def write(count):
+        with lock:
+            strip.fill(colour, 0, strip.length, 50 + count % 50)
+            strip.show(force=True)
+    return write
+
+
+def _snapshot_writer(light, index):
+    def write(count):
+        light.state.update(temperature=15.0 + (index + count) % 100 / 10.0, humidity=40.0)
+        light.commands.submit('redraw', light.showSensorData)
+    return write
+
+
+def contention(mode, writers, seconds=1.0, interval=0.001):
+    light = _light()
+    make_writer = _device_writer if mode == "device" else _snapshot_writer
+    stopping = threading.Event()
+    writes = [0] * writers
+
+    def loop(index):
+        write = make_writer(light, index)
+        while not stopping.is_set():
+            write(writes[index])
+            writes[index] += 1
+            time.sleep(interval)
+
+    threads = [threading.Thread(target=loop, args=(index,)) for index in range(writers)]
+    try:
+        light.setLightMode(light.light_mode_index["Rainbow"])
+        light.start()
+        time.sleep(0.2)
+        frames = light.rainbow.frames_shown
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stopping.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        shown = light.rainbow.frames_shown - frames
+        wait = light.metrics.timer("nightlight_strip_lock_wait_seconds", "")
+    finally:
+        light.stop()
+        if light.is_alive():
+            light.join()
+    return {"writes": sum(writes),
+            "lock_waits": wait.count,
+            "lock_wait_total_ms": wait.total * 1000,
+            "lock_wait_max_ms": wait.max * 1000,
+            "missed_frames": max(0, int(FPS * elapsed) - shown)}
+
+
+def run(writers=(1, 4, 16), seconds=1.0):
+    return {mode: {str(count): contention(mode, count, seconds) for count in writers}
+            for mode in ("device", "snapshot")}
+
+
+def main():
+    for mode, results in run().items():
+        for writers, result in results.items():
+            print("{0} {1} writers: {2}".format(mode, writers, result))
+
+
+if __name__ == "__main__":
+    main()
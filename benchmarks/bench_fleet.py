@@ -0,0 +1,78 @@
+# -*- coding: utf-8; -*-
+"""CPU and memory used by each light added to a fleet.
+
+Fleets of simulated lights sharing one simulated MQTT connection are
+built from the sample config, every light running its rainbow at
+rainbow_fps. Memory is the Python heap allocated building the fleet,
+measured with tracemalloc, and CPU is the process time used while the
+fleet runs for a few seconds, both divided by the number of lights.
+
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+from os.path import join
+
+from benchmarks.bench_startup import simulated_config
+from benchmarks.bench_startup import simulated_data
+from nightlightpi.config import ENVCONFIGPATH
+from nightlightpi.config import load_config
+from nightlightpi.fleet import Fleet
+
+
+def _load(devices, rainbow_fps):
+    data = simulated_data()
+    data["mqtt"]["enable"] = True
+    data["timing"]["rainbow_fps"] = rainbow_fps
+    data["fleet"] = [{"name": "light{0}".format(i)} for i in range(devices)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = join(tmp, "nightlightpi.yaml")
+        simulated_config(path, data)
+        previous = os.environ.get(ENVCONFIGPATH)
+        os.environ[ENVCONFIGPATH] = path
+        try:
+            return load_config()
+        finally:
+            if previous is None:
+                del os.environ[ENVCONFIGPATH]
+            else:
+                os.environ[ENVCONFIGPATH] = previous
+
+
+def _measure(devices, rainbow_fps, seconds):
+    config = _load(devices, rainbow_fps)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    fleet = Fleet(config)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    for light in fleet.lights:
+        light.setLightMode(light.light_mode_order.index("Rainbow"))
+    cpu = time.process_time()
+    fleet.start()
+    time.sleep(seconds)
+    fleet.stop()
+    fleet.join()
+    cpu = time.process_time() - cpu
+    return {"kib_per_light": memory / 1024.0 / devices,
+            "cpu_percent_per_light": 100.0 * cpu / seconds / devices,
+            "cpu_percent": 100.0 * cpu / seconds,
+            "jobs_run": fleet.scheduler.jobs_run}
+
+
+def run(sizes=(1, 4, 16, 32), rainbow_fps=30, seconds=2.0):
+    # Import the display and font modules first so the smallest fleet is
+    # not charged for them.
+    Fleet(_load(1, rainbow_fps)).stop()
+    return {"{0} lights".format(size): _measure(size, rainbow_fps, seconds) for size in sizes}
+
+
+def main():
+    for name, result in run().items():
+        print("{0}: {1}".format(name, result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8; -*-
+"""Frames per second against strip length for the APA102 engine.
+
+Each frame fills the strip with one colour and sends it to a fake SPI
+sink. The per-pixel path reproduces how the APA102_Pi library was used
+before: setPixelRGB once per LED into a list, then a copy of the list
+handed to the SPI driver.
+
+"""
+
+import time
+from math import ceil
+
+from nightlightpi.ledstrip import APA102Engine
+from nightlightpi.ledstrip import wheel
+
+
+class FakeSPISink:
+
+    def __init__(self):
+        self.transfers = 0
+        self.bytes = 0
+
+    def write(self, frame):
+        self.transfers += 1
+        self.bytes += len(frame)
+
+
+class PerPixelStrip:
+    """The APA102_Pi data layout, updated one pixel at a time."""
+
+    def __init__(self, length, sink, global_brightness=31):
+        self.length = length
+        self.sink = sink
+        self.global_brightness = global_brightness
+        self.leds = [0xE0, 0, 0, 0] * length
+
+    def setPixelRGB(self, led, colour, percent):
+        level = ceil(percent * self.global_brightness / 100.0)
+        start = 4 * led
+        self.leds[start] = (level & 0x1F) | 0xE0
+        self.leds[start + 3] = (colour & 0xFF0000) >> 16
+        self.leds[start + 2] = (colour & 0x00FF00) >> 8
+        self.leds[start + 1] = colour & 0x0000FF
+
+    def show(self):
+        self.sink.write([0] * 4)
+        self.sink.write(list(self.leds))
+        for _ in range((self.length + 15) // 16):
+            self.sink.write([0])
+
+
+def _per_pixel_fps(length, frames):
+    strip = PerPixelStrip(length, FakeSPISink(), 30)
+    start = time.perf_counter()
+    for frame in range(frames):
+        r, g, b = wheel(frame % 256)
+        colour = (r << 16) | (g << 8) | b
+        for pixel in list(range(length))[-length:length]:
+            strip.setPixelRGB(pixel, colour, 6)
+        strip.show()
+    return frames / (time.perf_counter() - start)
+
+
+def _engine_fps(length, frames):
+    sink = FakeSPISink()
+    strip = APA102Engine(length, sink, global_brightness=30)
+    start = time.perf_counter()
+    for frame in range(frames):
+        strip.fill(wheel(frame % 256), 0, length, 6)
+        strip.show()
+    elapsed = time.perf_counter() - start
+    return frames / elapsed, sink.transfers // frames
+
+
+def run(lengths=(10, 100, 1000, 5000), frames=200):
+    results = {}
+    for length in lengths:
+        engine_fps, transfers = _engine_fps(length, frames)
+        per_pixel_fps = _per_pixel_fps(length, frames)
+        results[length] = {
+            "per_pixel_fps": per_pixel_fps,
+            "engine_fps": engine_fps,
+            "speedup": engine_fps / per_pixel_fps,
+            "spi_transfers_per_frame": transfers,
+        }
+    return results
+
+
+def main():
+    print("{0:>8} {1:>14} {2:>14} {3:>9}".format("length", "per pixel fps", "engine fps", "speedup"))
+    for length, r in run().items():
+        print("{0:>8} {1:>14.0f} {2:>14.0f} {3:>8.1f}x".format(
+            length, r["per_pixel_fps"], r["engine_fps"], r["speedup"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8; -*-
+"""MQTT handler latency under a message flood, with and without the log pipeline.
+
+Brightness commands are fed to on_mqtt_message as fast as possible, as
+paho's network thread would during a flood, and every call is timed.
+Each message logs at least one line, written to a stream that takes
+write_delay seconds per write, like a journal on a slow SD card.
+
+- sync: a plain StreamHandler on the root logger, so the handler waits
+  for every line to be written, as with logging.basicConfig
+- async: the nightlightpi.logs pipeline, with the default rate limits
+
+"""
+
+import logging
+import statistics
+import time
+from unittest.mock import patch
+
+from benchmarks.bench_startup import simulated_data
+from nightlightpi import logs
+from nightlightpi.config import load_config
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.simulated import SimulatedMessage
+
+
+class SlowStream:
+
+    def __init__(self, write_delay):
+        self.write_delay = write_delay
+        self.lines = 0
+
+    def write(self, text):
+        time.sleep(self.write_delay)
+        self.lines += text.count("\n")
+
+    def flush(self):
+        pass
+
+
+def _light():
+    from nightlightpi.nightlight import NightLight
+    data = simulated_data()
+    data["mqtt"]["enable"] = True
+    with patch("nightlightpi.config.load_valid_yaml", return_value=data):
+        config = load_config()
+    with patch("nightlightpi.simulated.default_broker", return_value=FakeBroker()):
+        return NightLight(config)
+
+
+def flood(mode, messages=2000, write_delay=0.0002):
+    light = _light()
+    topic = light.config.mqtt.brightness_topic + "/set"
+    stream = SlowStream(write_delay)
+    root = logging.getLogger()
+    previous = (root.handlers[:], root.level)
+    pipeline = None
+    if mode == "sync":
+        root.handlers[:] = [logging.StreamHandler(stream)]
+        root.setLevel(logging.INFO)
+    else:
+        pipeline = logs.start_logging(logging.INFO, handlers=[logging.StreamHandler(stream)])
+    latencies = []
+    try:
+        light.start()
+        for count in range(messages):
+            message = SimulatedMessage(topic, str(count % 100).encode("ascii"), 0, False)
+            started = time.perf_counter()
+            light.on_mqtt_message(None, None, message)
+            latencies.append((time.perf_counter() - started) * 1e6)
+    finally:
+        light.stop()
+        if light.is_alive():
+            light.join()
+        if pipeline is not None:
+            logs.stop_logging()
+        root.handlers[:], level = previous
+        root.setLevel(level)
+    latencies.sort()
+    result = {"median_us": statistics.median(latencies),
+              "p99_us": latencies[int(0.99 * (len(latencies) - 1))],
+              "max_us": latencies[-1],
+              "lines_written": stream.lines}
+    if pipeline is not None:
+        result.update(pipeline.stats())
+    return result
+
+
+def run(messages=2000):
+    return {mode: flood(mode, messages) for mode in ("sync", "async")}
+
+
+def main():
+    for mode, result in run().items():
+        print("{0}: {1}".format(mode, result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8; -*-
+"""Overhead of the metrics instrumentation.
+
+The cost of timing a block and acquiring a timed lock is measured on its
+own, then setStripRGB on a simulated light is timed with metrics
+disabled and enabled, forcing a write each call so the strip path is
+exercised in full. Rendering the whole registry, as a scrape of the
+HTTP endpoint does, is timed last.
+
+"""
+
+import threading
+import time
+from unittest.mock import patch
+
+from benchmarks.bench_startup import simulated_data
+from nightlightpi.config import load_config
+from nightlightpi.metrics import Metrics
+
+
+def _per_call_us(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def primitives(calls=200000):
+    results = {}
+    for enabled in (False, True):
+        metrics = Metrics(enabled)
+        timer = metrics.timer("t", "T")
+        lock = metrics.lock("l", "L")
+        name = "enabled" if enabled else "disabled"
+
+        def timed():
+            with timer.time():
+                pass
+
+        def locked():
+            with lock:
+                pass
+
+        results["timer_" + name + "_us"] = _per_call_us(timed, calls)
+        results["lock_" + name + "_us"] = _per_call_us(locked, calls)
+    plain = threading.Lock()
+
+    def unlocked():
+        with plain:
+            pass
+
+    results["lock_plain_us"] = _per_call_us(unlocked, calls)
+    return results
+
+
+def _light(enabled):
+    from nightlightpi.nightlight import NightLight
+    data = simulated_data()
+    data["metrics"] = {"enable": enabled, "port": None}
+    with patch("nightlightpi.config.load_valid_yaml", return_value=data):
+        return NightLight(load_config())
+
+
+def strip_writes(calls=20000):
+    results = {}
+    for enabled in (False, True):
+        light = _light(enabled)
+        try:
+            results["set_strip_" + ("enabled" if enabled else "disabled") + "_us"] = _per_call_us(
+                lambda: light.setStripRGB((255, 128, 0), force=True), calls)
+            if enabled:
+                results["render_us"] = _per_call_us(light.metrics.render, 1000)
+        finally:
+            light.stop()
+    results["set_strip_overhead_us"] = results["set_strip_enabled_us"] - results["set_strip_disabled_us"]
+    return results
+
+
+def run():
+    results = primitives()
+    results.update(strip_writes())
+    return results
+
+
+def main():
+    for name, us in run().items():
+        print("{0}: {1:.3f}".format(name, us))
+
+
+if __name__ == "__main__":
+    main()
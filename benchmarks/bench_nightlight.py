@@ -0,0 +1,156 @@
+# -*- coding: utf-8; -*-
+"""The NightLight control loop end to end, on simulated hardware.
+
+A NightLight is built from the sample config with every device
+simulated: APA102 strip, SSD1306 display, DHT sensor and GPIO, and an
+in-process MQTT broker. Measured are:
+
+- startup, from constructing the light to its first LED frame, with the
+  modules already imported (bench_startup measures a cold start)
+- the frame rate achieved in Rainbow mode against rainbow_fps
+- display latency, rendering the temperature screen and sending it
+- MQTT command to LED latency, from publishing a light mode on the
+  broker to the strip being written by the scheduler thread
+- steady state CPU use and resident memory while the rainbow runs
+
+"""
+
+import resource
+import statistics
+import time
+from unittest.mock import patch
+
+from benchmarks.bench_startup import simulated_data
+from nightlightpi.config import load_config
+from nightlightpi.memory import rss_kib
+from nightlightpi.simulated import FakeBroker
+
+
+def _light(rainbow_fps=30):
+    from nightlightpi.nightlight import NightLight
+    data = simulated_data()
+    data["mqtt"]["enable"] = True
+    data["timing"]["rainbow_fps"] = rainbow_fps
+    with patch("nightlightpi.config.load_valid_yaml", return_value=data):
+        config = load_config()
+    broker = FakeBroker()
+    with patch("nightlightpi.simulated.default_broker", return_value=broker):
+        started = time.perf_counter()
+        light = NightLight(config)
+    light.link.wait_connected(5)
+    return light, broker, started
+
+
+def _stop(light):
+    light.stop()
+    if light.is_alive():
+        light.join()
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {"median_ms": statistics.median(samples),
+            "p95_ms": samples[int(0.95 * (len(samples) - 1))],
+            "max_ms": samples[-1]}
+
+
+def startup(runs=5):
+    times = []
+    for _ in range(runs):
+        light, _, started = _light()
+        times.append((light.LEDStrip.sink.first_write_at - started) * 1000)
+        _stop(light)
+    return {"first_frame_ms": min(times)}
+
+
+def rainbow(fps=60, seconds=2.0):
+    light, _, _ = _light(rainbow_fps=fps)
+    try:
+        light.setLightMode(light.light_mode_index["Rainbow"])
+        light.start()
+        time.sleep(seconds)
+        stats = light.rainbow.stats()
+    finally:
+        _stop(light)
+    return {"target_fps": stats["target_fps"], "achieved_fps": stats["achieved_fps"]}
+
+
+def display(frames=200):
+    light, _, _ = _light()
+    render = []
+    send = []
+    try:
+        for frame in range(frames):
+            light.temperature = 15.0 + (frame % 100) / 10.0
+            light.humidity = 40.0 + frame % 20
+            started = time.perf_counter()
+            image = light.temperature_renderer.render(light.temperature, light.humidity)
+            rendered = time.perf_counter()
+            light.displayImage(image)
+            sent = time.perf_counter()
+            render.append((rendered - started) * 1000)
+            send.append((sent - rendered) * 1000)
+    finally:
+        _stop(light)
+    return {"render": _summary(render), "send": _summary(send),
+            "total": _summary([r + s for r, s in zip(render, send)])}
+
+
+def command_to_led(commands=200):
+    light, broker, _ = _light()
+    sink = light.LEDStrip.sink
+    latencies = []
+    try:
+        light.start()
+        time.sleep(0.1)
+        for command in range(commands):
+            mode = b"Off" if command % 2 == 0 else b"Temperature"
+            frames = sink.frames
+            started = time.perf_counter()
+            broker._publish(light.config.mqtt.light_topic + "/set", mode, 0, False)
+            while sink.frames == frames:
+                time.sleep(0.00005)
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        _stop(light)
+    return _summary(latencies)
+
+
+def steady_state(seconds=5.0, fps=30):
+    light, _, _ = _light(rainbow_fps=fps)
+    try:
+        light.setLightMode(light.light_mode_index["Rainbow"])
+        light.start()
+        time.sleep(0.5)
+        rss_start = rss_kib()
+        cpu = time.process_time()
+        time.sleep(seconds)
+        cpu = time.process_time() - cpu
+        rss_end = rss_kib()
+    finally:
+        _stop(light)
+    return {"cpu_percent": 100.0 * cpu / seconds,
+            "rss_kib": rss_end,
+            "rss_growth_kib": None if rss_start is None else rss_end - rss_start,
+            "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def run(quick=False):
+    scale = 0.25 if quick else 1.0
+    # Build one light first so the first measurement is not charged for
+    # importing the display modules.
+    _stop(_light()[0])
+    return {"startup": startup(runs=2 if quick else 5),
+            "rainbow": rainbow(seconds=2.0 * scale),
+            "display": display(frames=int(200 * scale)),
+            "command_to_led": command_to_led(commands=int(200 * scale)),
+            "steady_state": steady_state(seconds=5.0 * scale)}
+
+
+def main():
+    for name, result in run().items():
+        print("{0}: {1}".format(name, result))
+
+
+if __name__ == "__main__":
+    main()
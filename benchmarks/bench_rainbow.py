@@ -0,0 +1,68 @@
+# -*- coding: utf-8; -*-
+"""Achieved against target frame rate for the rainbow animation.
+
+The animation runs on a real scheduler against a fake SPI sink. Also
+reports the time taken to precompute the frames and the cost of one
+frame compared with computing the wheel colour and filling the strip
+every frame.
+
+"""
+
+import threading
+import time
+
+from benchmarks.bench_ledstrip import FakeSPISink
+from nightlightpi.ledstrip import APA102Engine
+from nightlightpi.ledstrip import wheel
+from nightlightpi.rainbow import RainbowAnimation
+from nightlightpi.scheduler import Scheduler
+
+
+def _achieved(length, fps, spread, seconds):
+    strip = APA102Engine(length, FakeSPISink())
+    started = time.perf_counter()
+    rainbow = RainbowAnimation(strip, fps=fps, spread=spread)
+    precompute = time.perf_counter() - started
+    scheduler = Scheduler()
+    rainbow.start(scheduler)
+    loop = threading.Thread(target=scheduler.run)
+    loop.start()
+    time.sleep(seconds)
+    scheduler.stop()
+    loop.join()
+    stats = rainbow.stats()
+    stats["precompute_ms"] = precompute * 1000
+    return stats
+
+
+def _frame_cost(length, frames=2000):
+    strip = APA102Engine(length, FakeSPISink())
+    rainbow = RainbowAnimation(strip, spread=False)
+    start = time.perf_counter()
+    for _ in range(frames):
+        rainbow.step()
+    precomputed = (time.perf_counter() - start) / frames
+    start = time.perf_counter()
+    for frame in range(frames):
+        strip.fill(wheel(frame & 255))
+        strip.show()
+    computed = (time.perf_counter() - start) / frames
+    return {"precomputed_us": precomputed * 1e6, "computed_us": computed * 1e6}
+
+
+def run(lengths=(10, 300), rates=(30, 60, 120), seconds=1.0):
+    results = {}
+    for length in lengths:
+        for fps in rates:
+            results["{0} leds @ {1} fps".format(length, fps)] = _achieved(length, fps, True, seconds)
+        results["{0} leds frame cost".format(length)] = _frame_cost(length)
+    return results
+
+
+def main():
+    for name, result in run().items():
+        print("{0}: {1}".format(name, result))
+
+
+if __name__ == "__main__":
+    main()
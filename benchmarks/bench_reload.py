@@ -0,0 +1,77 @@
+# -*- coding: utf-8; -*-
+"""Latency of live config reloads.
+
+A simulated light is started with its config file watched, then the file
+is rewritten with a new max_brightness again and again. Each reload is
+timed from the rename of the new file to the change being applied on the
+scheduler thread, with inotify and with polling. The frames written to
+the strip per reload show whether a reload causes any flicker, it should
+be at most the one frame with the new brightness.
+
+"""
+
+import os
+import statistics
+import tempfile
+import time
+from os.path import join
+from unittest.mock import patch
+
+from benchmarks.bench_startup import simulated_config
+from benchmarks.bench_startup import simulated_data
+from nightlightpi.config import ENVCACHEPATH
+from nightlightpi.config import load_config
+
+
+def _reloads(tmp, use_inotify, count):
+    from nightlightpi.nightlight import NightLight
+    path = join(tmp, "nightlightpi.yaml")
+    data = simulated_data()
+    simulated_config(path, data)
+    light = NightLight(load_config(path))
+    light.daemon = True
+    light.start()
+    light.watchConfig(path, use_inotify=use_inotify, poll_interval=0.05)
+    time.sleep(0.2)
+    sink = light.LEDStrip.sink
+    latencies = []
+    frames = []
+    try:
+        for i in range(count):
+            data["led_strip"]["max_brightness"] = 10 + i % 20
+            before = light.reloads
+            start_frames = sink.frames
+            tmp_path = path + ".tmp"
+            simulated_config(tmp_path, data)
+            started = time.perf_counter()
+            os.replace(tmp_path, path)
+            while light.reloads == before:
+                time.sleep(0.0005)
+            latencies.append((time.perf_counter() - started) * 1000)
+            frames.append(sink.frames - start_frames)
+    finally:
+        light.stop()
+    return {"mode": light.watcher.mode,
+            "median_ms": statistics.median(latencies),
+            "max_ms": max(latencies),
+            "frames_per_reload": max(frames)}
+
+
+def run(count=20):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        with patch.dict("os.environ", {ENVCACHEPATH: join(tmp, "config.pickle")}):
+            for name, use_inotify in (("inotify", True), ("poll", False)):
+                results[name] = _reloads(tmp, use_inotify, count)
+    return results
+
+
+def main():
+    for name, result in run().items():
+        print("{0} ({1}): median {2:.1f} ms, max {3:.1f} ms, {4} frame(s) per reload".format(
+            name, result["mode"], result["median_ms"], result["max_ms"],
+            result["frames_per_reload"]))
+
+
+if __name__ == "__main__":
+    main()
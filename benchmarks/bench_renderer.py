@@ -0,0 +1,79 @@
+# -*- coding: utf-8; -*-
+"""Compare the cached temperature renderer against the original path.
+
+The original displayTemperature opened the background from disk, loaded
+two TrueType fonts and rasterised the text for every frame. Both paths
+are timed for frames per second, and tracemalloc reports the peak
+Python heap used while rendering a frame.
+
+"""
+
+import time
+import tracemalloc
+from os.path import dirname
+from os.path import join
+
+from PIL import Image
+from PIL import ImageDraw
+from PIL import ImageFont
+
+from nightlightpi.renderer import DEFAULT_FONT
+from nightlightpi.renderer import TemperatureRenderer
+
+
+BACKGROUND = join(dirname(dirname(__file__)), "images", "temperature.ppm")
+
+
+def render_uncached(temperature, humidity, background=BACKGROUND, width=128, height=64):
+    """Render a frame the way displayTemperature originally did."""
+    padding = 2
+    padding_x = 38
+    image = Image.open(background).convert("1")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(DEFAULT_FONT, 30)
+    font_small = ImageFont.truetype(DEFAULT_FONT, 14)
+    temperature_string = "{0:0.1f}°".format(temperature)
+    temperature_width = draw.textlength(temperature_string, font=font)
+    x = ((width - padding_x) - temperature_width) / 2 + padding_x
+    # Pillow of the time truncated text coordinates to whole pixels.
+    draw.text((int(x), padding), temperature_string, font=font, fill=255)
+    humidity_string = "{0:0.1f}%".format(humidity)
+    humidity_width = draw.textlength(humidity_string, font=font_small)
+    ascent, descent = font_small.getmetrics()
+    x = ((width - padding_x) - humidity_width) / 2 + padding_x
+    y = (height - padding) - (ascent + descent)
+    draw.text((int(x), y), humidity_string, font=font_small, fill=255)
+    return image
+
+
+def _measure(render, frames):
+    readings = [(18.0 + (i % 80) / 10, 40.0 + (i % 200) / 10) for i in range(frames)]
+    start = time.perf_counter()
+    for temperature, humidity in readings:
+        render(temperature, humidity)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    render(21.5, 48.0)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"frames_per_second": frames / elapsed, "peak_python_bytes_per_frame": peak}
+
+
+def run(frames=500):
+    renderer = TemperatureRenderer(BACKGROUND)
+    uncached = _measure(render_uncached, frames)
+    cached = _measure(renderer.render, frames)
+    return {
+        "uncached": uncached,
+        "cached": cached,
+        "speedup": cached["frames_per_second"] / uncached["frames_per_second"],
+    }
+
+
+def main():
+    for name, results in run().items():
+        print("{0}: {1}".format(name, results))
+
+
+if __name__ == "__main__":
+    main()
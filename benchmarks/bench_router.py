@@ -0,0 +1,95 @@
+# -*- coding: utf-8; -*-
+"""Messages per second dispatched from the MQTT on_message callback.
+
+Compares the old if/elif chain, which rebuilt each /set topic string and
+scanned the light modes for every message, with TopicRouter. Messages
+are SimulatedMessage instances as a fake client would deliver them. The
+fleet case routes through a wildcard filter for many lights sharing one
+connection.
+
+"""
+
+import time
+
+from nightlightpi.config import MQTTConfig
+from nightlightpi.router import TopicRouter
+from nightlightpi.simulated import SimulatedMessage
+
+
+LIGHT_MODE_ORDER = ("Temperature", "Rainbow", "Off")
+
+
+def _mqtt_config():
+    mqtt = MQTTConfig()
+    mqtt.display_topic = "nightlight/display"
+    mqtt.light_topic = "nightlight/light"
+    mqtt.brightness_topic = "nightlight/brightness"
+    return mqtt
+
+
+def _messages(count):
+    samples = [("nightlight/display/set", b"Off"),
+               ("nightlight/light/set", b"Off"),
+               ("nightlight/brightness/set", b"10"),
+               ("nightlight/light/set", b"Rainbow")]
+    return [SimulatedMessage(*samples[i % len(samples)], qos=0, retain=False)
+            for i in range(count)]
+
+
+def _if_chain(mqtt, messages):
+    handled = []
+    for message in messages:
+        topic = message.topic
+        payload = message.payload.decode("utf-8")
+        if topic == mqtt.display_topic + "/set":
+            handled.append(payload)
+        elif topic == mqtt.light_topic + "/set":
+            for index, mode in enumerate(LIGHT_MODE_ORDER):
+                if payload == mode:
+                    handled.append(index)
+        elif topic == mqtt.brightness_topic + "/set":
+            handled.append(payload)
+
+
+def _router(mqtt, messages):
+    handled = []
+    mode_index = {mode: index for index, mode in enumerate(LIGHT_MODE_ORDER)}
+    router = TopicRouter.from_config(mqtt, {
+        "display": lambda topic, payload: handled.append(payload),
+        "light": lambda topic, payload: handled.append(mode_index.get(payload)),
+        "brightness": lambda topic, payload: handled.append(payload)})
+    for message in messages:
+        router.dispatch(message.topic, message.payload.decode("utf-8"))
+
+
+def _fleet(lights, messages):
+    handled = []
+    router = TopicRouter()
+    router.add("nightlights/+/light/set", lambda topic, payload: handled.append(topic))
+    router.add("nightlights/all/#", lambda topic, payload: handled.append(topic))
+    topics = ["nightlights/light{0}/light/set".format(i) for i in range(lights)]
+    for i in range(messages):
+        router.dispatch(topics[i % lights], "Off")
+
+
+def _rate(function, *args, count):
+    start = time.perf_counter()
+    function(*args)
+    return count / (time.perf_counter() - start)
+
+
+def run(count=200000, lights=100):
+    mqtt = _mqtt_config()
+    messages = _messages(count)
+    return {"if_chain_msgs_per_s": _rate(_if_chain, mqtt, messages, count=count),
+            "router_msgs_per_s": _rate(_router, mqtt, messages, count=count),
+            "fleet_{0}_lights_msgs_per_s".format(lights): _rate(_fleet, lights, count, count=count)}
+
+
+def main():
+    for name, rate in run().items():
+        print("{0}: {1:,.0f}".format(name, rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8; -*-
+"""Measure how much CPU the control loop uses while the light idles.
+
+A NightLight is built from the sample config on the simulated backend,
+as bench_nightlight does, and left in Rainbow mode with a frame every
+timing.speed_in_seconds and a sensor reading every
+temperature.update_seconds. Frames are counted as the rainbow steps, as
+the strip skips sending those identical to the last. The simulated run
+drives the light's scheduler on a simulated clock and reports CPU
+seconds needed per simulated minute, the realtime run reports the share
+of a core the light uses while sleeping between frames.
+
+"""
+
+import time
+from unittest.mock import patch
+
+from benchmarks.bench_startup import simulated_data
+from nightlightpi.config import load_config
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.scheduler import SimulatedClock
+from nightlightpi.simulated import FakeBroker
+
+
+def _light(speed_in_seconds, update_seconds, scheduler=None):
+    from nightlightpi.nightlight import NightLight
+    data = simulated_data()
+    data["timing"]["speed_in_seconds"] = speed_in_seconds
+    data["timing"].pop("rainbow_fps", None)
+    data["temperature"]["update_seconds"] = update_seconds
+    with patch("nightlightpi.config.load_valid_yaml", return_value=data):
+        config = load_config()
+    with patch("nightlightpi.simulated.default_broker", return_value=FakeBroker()):
+        light = NightLight(config, scheduler=scheduler)
+    light.setLightMode(light.light_mode_index["Rainbow"])
+    return light
+
+
+def _stop(light):
+    light.stop()
+    if light.is_alive():
+        light.join()
+
+
+def run_simulated(minutes=60, speed_in_seconds=1, update_seconds=60):
+    """Run the light for simulated minutes and report the CPU it needed."""
+    scheduler = Scheduler(SimulatedClock())
+    light = _light(speed_in_seconds, update_seconds, scheduler)
+    rainbow = light.rainbow
+    # The sensor worker thread would race the simulated clock.
+    light.sensor.threaded = False
+    try:
+        light.begin()
+        frames = rainbow.frames_shown
+        wakeups = scheduler.wakeups
+        start = time.process_time()
+        scheduler.run(until=minutes * 60)
+        cpu = time.process_time() - start
+        reads = light.sensor.reads
+    finally:
+        _stop(light)
+    return {
+        "simulated_minutes": minutes,
+        "frames": rainbow.frames_shown - frames,
+        "sensor_reads": reads,
+        "wakeups": scheduler.wakeups - wakeups,
+        "cpu_seconds": cpu,
+        "cpu_seconds_per_simulated_minute": cpu / minutes,
+        "duty_cycle": cpu / (minutes * 60),
+    }
+
+
+def run_realtime(seconds=2.0, speed_in_seconds=0.05, update_seconds=0.5):
+    """Run the light on the real clock and report its share of one core."""
+    light = _light(speed_in_seconds, update_seconds)
+    rainbow = light.rainbow
+    scheduler = light.scheduler
+    try:
+        frames = rainbow.frames_shown
+        wakeups = scheduler.wakeups
+        wall_start = time.monotonic()
+        cpu_start = time.process_time()
+        light.start()
+        time.sleep(seconds)
+        cpu = time.process_time() - cpu_start
+        wall = time.monotonic() - wall_start
+        frames = rainbow.frames_shown - frames
+        wakeups = scheduler.wakeups - wakeups
+    finally:
+        _stop(light)
+    return {
+        "seconds": wall,
+        "frames": frames,
+        "wakeups": wakeups,
+        "cpu_seconds": cpu,
+        "cpu_fraction": cpu / wall,
+    }
+
+
+def run():
+    return {"simulated": run_simulated(), "realtime": run_realtime()}
+
+
+def main():
+    for name, results in run().items():
+        print(name)
+        for key, value in results.items():
+            print("    {0}: {1}".format(key, value))
+
+
+if __name__ == "__main__":
+    main()
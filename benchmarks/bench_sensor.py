@@ -0,0 +1,86 @@
+# -*- coding: utf-8; -*-
+"""Rainbow frame jitter while the sensor is read, in and out of process.
+
+The rainbow runs on a real scheduler against a sink which records when
+each frame is written, while a SensorService reads a simulated sensor
+every interval seconds. Each read blocks for block seconds holding the
+GIL, as the C DHT driver does.
+
+- none: no sensor, the baseline
+- thread: the sensor is read on the service's worker thread
+- process: the sensor is read in a ProcessSensor child process
+
+Reported are the mean, standard deviation, 99th percentile and largest
+interval between frames, and the frames written later than half a frame
+interval after they were due.
+
+"""
+
+import statistics
+import threading
+import time
+
+from nightlightpi.ledstrip import APA102Engine
+from nightlightpi.rainbow import RainbowAnimation
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.sensor import SensorService
+from nightlightpi.sensorprocess import ProcessSensor
+from nightlightpi.simulated import SimulatedSensor
+
+
+class TimingSink:
+
+    def __init__(self):
+        self.times = []
+
+    def write(self, frame):
+        self.times.append(time.perf_counter())
+
+
+def jitter(mode, block=0.05, interval=0.25, seconds=3.0, fps=30, length=60):
+    sink = TimingSink()
+    rainbow = RainbowAnimation(APA102Engine(length, sink), fps=fps, spread=True)
+    scheduler = Scheduler()
+    service = None
+    sensor = SimulatedSensor(latency=block, hold_gil=True)
+    if mode == "process":
+        sensor = ProcessSensor(sensor)
+        # Starting the child is not part of the measurement.
+        sensor.read()
+    if mode != "none":
+        service = SensorService(sensor, scheduler, interval, retry_delay=interval)
+        service.start()
+    rainbow.start(scheduler)
+    loop = threading.Thread(target=scheduler.run)
+    loop.start()
+    try:
+        time.sleep(seconds)
+    finally:
+        scheduler.stop()
+        loop.join()
+        if service is not None:
+            service.stop()
+        if mode == "process":
+            sensor.close()
+    target = 1.0 / fps
+    intervals = sorted(b - a for a, b in zip(sink.times, sink.times[1:]))
+    return {"frames": len(sink.times),
+            "reads": service.reads if service is not None else 0,
+            "mean_ms": statistics.mean(intervals) * 1000,
+            "stdev_ms": statistics.pstdev(intervals) * 1000,
+            "p99_ms": intervals[int(0.99 * (len(intervals) - 1))] * 1000,
+            "max_ms": intervals[-1] * 1000,
+            "late_frames": sum(1 for gap in intervals if gap > 1.5 * target)}
+
+
+def run(block=0.05, interval=0.25, seconds=3.0):
+    return {mode: jitter(mode, block, interval, seconds) for mode in ("none", "thread", "process")}
+
+
+def main():
+    for mode, result in run().items():
+        print("{0}: {1}".format(mode, result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8; -*-
+"""Measure how long NightLightPi takes to import and to light the strip.
+
+Both measurements run in fresh interpreters so nothing is already
+imported. The import report comes from python -X importtime and lists
+the slowest modules pulled in by nightlightpi.nightlight. Cold start is
+the time from spawning the interpreter until the first LED frame is
+written, using the sample config with the simulated backends and MQTT
+disabled. time.perf_counter is system wide on Linux, so the parent and
+child timestamps can be compared directly.
+
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import dirname
+from os.path import join
+
+import yaml
+
+
+ROOT = dirname(dirname(os.path.abspath(__file__)))
+SAMPLE_CONFIG = join(ROOT, "docs", "nightlightpi-sample-config.yaml")
+
+COLD_START = """
+import time
+from nightlightpi.config import load_config
+from nightlightpi.nightlight import NightLight
+light = NightLight(load_config())
+print(light.LEDStrip.sink.first_write_at)
+light.stop()
+"""
+
+
+def import_times(module="nightlightpi.nightlight", top=10):
+    """Return the total import time of module and its slowest imports."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative), name.strip()))
+    total = next(us for us, name in imports if name == module)
+    slowest = sorted(imports, reverse=True)[1:top + 1]
+    return {"total_ms": total / 1000.0,
+            "modules": len(imports),
+            "slowest_ms": [(name, us / 1000.0) for us, name in slowest]}
+
+
+def simulated_data():
+    """Return the sample config using the simulated backends."""
+    with open(SAMPLE_CONFIG) as f:
+        data = yaml.safe_load(f)
+    data["hardware"] = {"backend": "simulated"}
+    data["mqtt"]["enable"] = False
+    for mode in data["display_modes"]:
+        for key in ("menu", "background"):
+            if mode.get(key):
+                mode[key] = join(ROOT, mode[key])
+    return data
+
+
+def simulated_config(path, data=None):
+    with open(path, "w") as f:
+        yaml.safe_dump(simulated_data() if data is None else data, f)
+
+
+def cold_start(runs=5):
+    """Return the time to the first LED frame for each run."""
+    times = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = join(tmp, "nightlightpi.yaml")
+        simulated_config(path)
+        env = dict(os.environ, NIGHTLIGHTPICONFIG=path)
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", COLD_START], cwd=ROOT, env=env,
+                                    stdout=subprocess.PIPE, universal_newlines=True, check=True)
+            first_frame = float(result.stdout.split()[-1])
+            times.append((first_frame - started) * 1000)
+    return {"first_frame_ms": min(times), "runs_ms": times}
+
+
+def run():
+    return {"import": import_times(), "cold_start": cold_start()}
+
+
+def main():
+    results = run()
+    print("import nightlightpi.nightlight: {0:.1f} ms, {1} modules".format(
+        results["import"]["total_ms"], results["import"]["modules"]))
+    for name, ms in results["import"]["slowest_ms"]:
+        print("    {0:8.1f} ms  {1}".format(ms, name))
+    print("cold start to first frame: {0:.1f} ms (best of {1})".format(
+        results["cold_start"]["first_frame_ms"], len(results["cold_start"]["runs_ms"])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8; -*-
+"""Run every benchmark and keep the results as JSON.
+
+Results are written to benchmarks/results/<commit>.json by default,
+together with the commit, Python version and machine they came from, so
+runs from different commits can be compared with --compare. Every
+number found in both files is listed with its relative change, and
+changes larger than --threshold are marked.
+
+Example:
+    python -m benchmarks.suite --quick
+    python -m benchmarks.suite --compare benchmarks/results/3d228cd.json
+    python -m benchmarks.suite --only nightlight rainbow
+
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from os.path import join
+
+from benchmarks.bench_startup import ROOT
+
+
+RESULTS = join(ROOT, "benchmarks", "results")
+
+# Benchmark names with the keyword arguments that make their run quicker.
+BENCHMARKS = {
+    "nightlight": {"quick": True},
+    "startup": {},
+    "config": {"runs": 2},
+    "scheduler": {},
+    "rainbow": {"rates": (60,), "seconds": 0.5},
+    "ledstrip": {"lengths": (10, 300), "frames": 50},
+    "colourmap": {"lookups": 2000},
+    "renderer": {"frames": 50},
+    "router": {"count": 20000, "lights": 10},
+    "fleet": {"sizes": (1, 4), "seconds": 0.5},
+    "metrics": {},
+    "reload": {"count": 5},
+    "buttons": {"presses": 20},
+    "contention": {"writers": (1, 16), "seconds": 0.5},
+    "assets": {"switches": 60},
+    "logging": {"messages": 500},
+    "sensor": {"seconds": 1.0},
+}
+
+
+def _git(*args):
+    try:
+        result = subprocess.run(["git"] + list(args), cwd=ROOT, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def environment():
+    return {"commit": _git("rev-parse", "--short", "HEAD"),
+            "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "system": platform.platform(),
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+
+
+def run(names=None, quick=False):
+    """Return the environment and the results of the named benchmarks."""
+    results = {}
+    timings = {}
+    for name in names or BENCHMARKS:
+        module = importlib.import_module("benchmarks.bench_" + name)
+        started = time.perf_counter()
+        results[name] = module.run(**(BENCHMARKS[name] if quick else {}))
+        timings[name] = time.perf_counter() - started
+    return {"environment": environment(), "quick": quick, "seconds": timings,
+            "results": results}
+
+
+def flatten(results, prefix=""):
+    """Return {dotted.path: number} for every number in results."""
+    flat = {}
+    items = results.items() if isinstance(results, dict) else enumerate(results)
+    for key, value in items:
+        path = "{0}.{1}".format(prefix, key) if prefix else str(key)
+        if isinstance(value, (dict, list, tuple)):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(base, current, threshold=0.1):
+    """Return (path, base, current, change, marked) for the shared numbers."""
+    base = flatten(base["results"])
+    current = flatten(current["results"])
+    rows = []
+    for path in sorted(set(base) & set(current)):
+        old = base[path]
+        new = current[path]
+        change = (new - old) / abs(old) if old else (0.0 if new == old else float("inf"))
+        rows.append((path, old, new, change, abs(change) > threshold))
+    return rows
+
+
+def _print_comparison(rows):
+    for path, old, new, change, marked in rows:
+        print("{0} {1:<60} {2:>14.4g} {3:>14.4g} {4:>+8.1%}".format(
+            "*" if marked else " ", path, old, new, change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--quick", action="store_true", help="shorter runs, for a smoke test")
+    parser.add_argument("--output", help="where to write the results JSON")
+    parser.add_argument("--compare", metavar="BASE", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change to mark in the comparison (default 0.1)")
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.quick)
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS, exist_ok=True)
+        output = join(RESULTS, "{0}.json".format(results["environment"]["commit"] or "results"))
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print("Results written to {0}".format(output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            _print_comparison(compare(json.load(f), results, args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
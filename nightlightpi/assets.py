@@ -0,0 +1,216 @@
+# -*- coding: utf-8; -*-
+"""Compile the display images into one file of SSD1306 frames.
+
+Decoding a menu image with PIL and converting it to the display's page
+layout takes far longer than sending it. compile_assets does that once
+for every image the config names and writes the packed frames, 1024
+bytes each for a 128x64 display, into a single file. AssetPack maps the
+file into memory and hands out each frame as a memoryview of the map,
+so showing a menu copies nothing and never touches PIL.
+
+The file records the size and modification time of every source image.
+load_assets compiles the file again whenever the sources or the display
+size no longer match, which is checked when a light starts and when its
+display modes are reloaded. The frames are kept in the file named by the
+NIGHTLIGHTPIASSETS environment variable, or next to the config cache by
+default. Set the variable to an empty string to decode the images with
+PIL every time. Each light of a fleet has a file of its own, with its
+name appended as for its history and spool.
+
+The assets can be compiled ahead of time, for example when installing:
+
+    python -m nightlightpi.assets
+
+Example:
+    pack = load_assets(config_assets(config), 128, 64)
+    display.show_buffer(pack.frame(config.temp_mode.menu))
+    pack.close()
+
+"""
+
+__all__ = ["AssetPack", "compile_assets", "config_assets", "load_assets"]
+
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from os import environ
+from os.path import abspath
+from os.path import dirname
+from os.path import join
+from os.path import splitext
+
+from nightlightpi.config import default_cache_path
+
+
+ENVASSETSPATH = "NIGHTLIGHTPIASSETS"
+MAGIC = b"NLPIPAGE"
+VERSION = 1
+# Magic, version, display width and height, and the number of frames.
+HEADER = struct.Struct("<8sHHHH")
+# Source modification time, size and the length of the path after it.
+ENTRY = struct.Struct("<qqH")
+
+
+def default_assets_path():
+    return join(dirname(default_cache_path()), "assets.bin")
+
+
+def assets_path(name=None):
+    """Return the file of the pack of the light called name, "" for none."""
+    return _named(environ.get(ENVASSETSPATH, default_assets_path()), name)
+
+
+def _named(path, name):
+    if not path or not name:
+        return path
+    root, ext = splitext(path)
+    return "{0}-{1}{2}".format(root, name, ext)
+
+
+def config_assets(config):
+    """Return the paths of every image used by the display modes."""
+    paths = set()
+    for mode in (config.off_mode, config.temp_mode, config.rainbow_mode):
+        paths.update(path for path in (mode.menu, mode.background) if path)
+    return sorted(paths)
+
+
+def _source(path):
+    stat = os.stat(path)
+    return abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def compile_assets(paths, output, width=128, height=64):
+    """Write the images at paths, packed in SSD1306 page layout, to output."""
+    from nightlightpi.display import image_to_pages
+    from nightlightpi.display import open_image
+    sources = [_source(path) for path in paths]
+    frames = [image_to_pages(open_image(path), width, height) for path in paths]
+    index = [HEADER.pack(MAGIC, VERSION, width, height, len(sources))]
+    for path, mtime_ns, size in sources:
+        name = path.encode("utf-8")
+        index.append(ENTRY.pack(mtime_ns, size, len(name)) + name)
+    # Written to a temporary file and renamed into place, so a light
+    # mapping the old file keeps reading a complete one.
+    directory = dirname(abspath(output))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"".join(index))
+            for frame in frames:
+                f.write(frame)
+        os.replace(tmp_path, output)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class AssetPack:
+    """Map a file written by compile_assets and look its frames up by path.
+
+Raises ValueError if the file is not one compile_assets wrote.
+
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_index()
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            self._map.close()
+            raise ValueError("{0} is not a display asset file: {1}".format(path, e))
+        self._view = memoryview(self._map)
+
+    def _read_index(self):
+        magic, version, self.width, self.height, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("unknown format")
+        self.frame_size = self.width * (self.height // 8)
+        self.sources = {}
+        offsets = []
+        offset = HEADER.size
+        for _ in range(count):
+            mtime_ns, size, length = ENTRY.unpack_from(self._map, offset)
+            offset += ENTRY.size
+            path = self._map[offset:offset + length].decode("utf-8")
+            offset += length
+            self.sources[path] = (mtime_ns, size)
+            offsets.append(path)
+        if offset + count * self.frame_size != len(self._map):
+            raise ValueError("truncated")
+        self._offsets = {path: offset + index * self.frame_size
+                         for index, path in enumerate(offsets)}
+
+    def matches(self, paths, width, height):
+        """Return whether the pack holds exactly the current images at paths."""
+        if (width, height) != (self.width, self.height) or len(paths) != len(self.sources):
+            return False
+        try:
+            sources = [_source(path) for path in paths]
+        except OSError:
+            return False
+        return all(self.sources.get(path) == (mtime_ns, size) for path, mtime_ns, size in sources)
+
+    def frame(self, path):
+        """Return the frame for the image at path, or None if it is not packed."""
+        offset = self._offsets.get(abspath(path))
+        if offset is None:
+            return None
+        return self._view[offset:offset + self.frame_size]
+
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # A frame is still being sent, the map goes when it does.
+            pass
+
+
+def load_assets(paths, width=128, height=64, path=None, name=None):
+    """Return an AssetPack of the images at paths, compiling it if needed.
+
+Without a path the pack of the light called name is used, see
+assets_path. Returns None when the pack cannot be written or read, the
+images are then decoded with PIL as before.
+
+    """
+    if path is None:
+        path = assets_path(name)
+    if not path:
+        return None
+    try:
+        pack = AssetPack(path)
+    except (OSError, ValueError):
+        pack = None
+    if pack is not None:
+        if pack.matches(paths, width, height):
+            return pack
+        pack.close()
+    try:
+        compile_assets(paths, path, width, height)
+        return AssetPack(path)
+    except (OSError, ValueError) as e:
+        logging.warning("Could not compile the display assets to %s: %s", path, e)
+        return None
+
+
+def main(argv=None):
+    from nightlightpi.config import load_config
+    argv = sys.argv[1:] if argv is None else argv
+    config = load_config(argv[0] if argv else None)
+    for light in [config] + config.fleet:
+        output = _named(environ.get(ENVASSETSPATH) or default_assets_path(), light.name)
+        paths = config_assets(light)
+        compile_assets(paths, output)
+        print("Compiled {0} display assets to {1}".format(len(paths), output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
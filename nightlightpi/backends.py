@@ -0,0 +1,121 @@
+# -*- coding: utf-8; -*-
+"""Choose the drivers behind each device of the night light.
+
+Every device kind has a "real" backend talking to the Raspberry Pi
+hardware, a "simulated" backend from nightlightpi.simulated and a
+"null" backend which does nothing. Driver modules are only imported
+when their backend is created, so NightLightPi can be imported and run
+on machines without the Raspberry Pi libraries installed.
+
+The kinds and what their factories return are:
+
+    strip   - a sink with a write method for APA102Engine
+    display - an initialised SSD1306 device, or None when disabled
+    sensor  - an object with a read method for SensorService
+    inputs  - an RPi.GPIO compatible module, or None when disabled
+    mqtt    - an unconnected paho compatible client, or None
+
+Example:
+    sink = create("strip", conf.hardware.strip, conf)
+
+"""
+
+__all__ = ["create", "register", "available"]
+
+from nightlightpi.errorstrings import UNKNOWN_BACKEND
+
+
+KINDS = ("strip", "display", "sensor", "inputs", "mqtt")
+
+_factories = {}
+
+
+def register(kind, name, factory):
+    """Make factory(config) available as backend name for kind."""
+    if kind not in KINDS:
+        raise ValueError("Unknown device kind '{0}'".format(kind))
+    _factories[(kind, name)] = factory
+
+
+def available(kind):
+    """Return the names of the backends registered for kind."""
+    return sorted(name for k, name in _factories if k == kind)
+
+
+def create(kind, name, config):
+    """Create the device of kind using backend name."""
+    try:
+        factory = _factories[(kind, name)]
+    except KeyError:
+        raise RuntimeError(UNKNOWN_BACKEND.format(name, kind, ", ".join(available(kind))))
+    return factory(config)
+
+
+def _real_strip(config):
+    from nightlightpi.ledstrip import SpiDevSink
+    return SpiDevSink(config.led_strip.spi_bus, config.led_strip.spi_device)
+
+
+def _real_display(config):
+    import Adafruit_SSD1306
+    device = Adafruit_SSD1306.SSD1306_128_64(rst=0)
+    device.begin()
+    return device
+
+
+def _real_sensor(config):
+    from nightlightpi.sensor import DHTSensor
+    return DHTSensor(config.temperature.sensor_type, config.temperature.pin)
+
+
+def _real_inputs(config):
+    import RPi.GPIO
+    return RPi.GPIO
+
+
+def _real_mqtt(config):
+    import paho.mqtt.client as mqtt
+    client = mqtt.Client(client_id=config.mqtt.user)
+    client.tls_set("/etc/ssl/certs/DST_Root_CA_X3.pem")
+    client.username_pw_set(config.mqtt.user, password=config.mqtt.password)
+    return client
+
+
+def _simulated(name):
+    def factory(config):
+        from nightlightpi import simulated
+        return getattr(simulated, name)(config)
+    return factory
+
+
+def _null(config):
+    return None
+
+
+def _null_strip(config):
+    from nightlightpi.simulated import NullSink
+    return NullSink()
+
+
+def _null_sensor(config):
+    from nightlightpi.simulated import NullSensor
+    return NullSensor()
+
+
+register("strip", "real", _real_strip)
+register("display", "real", _real_display)
+register("sensor", "real", _real_sensor)
+register("inputs", "real", _real_inputs)
+register("mqtt", "real", _real_mqtt)
+
+register("strip", "simulated", _simulated("simulated_strip"))
+register("display", "simulated", _simulated("simulated_display"))
+register("sensor", "simulated", _simulated("simulated_sensor"))
+register("inputs", "simulated", _simulated("simulated_inputs"))
+register("mqtt", "simulated", _simulated("simulated_mqtt"))
+
+register("strip", "null", _null_strip)
+register("display", "null", _null)
+register("sensor", "null", _null_sensor)
+register("inputs", "null", _null)
+register("mqtt", "null", _null)
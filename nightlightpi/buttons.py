@@ -0,0 +1,191 @@
+# -*- coding: utf-8; -*-
+"""Turn GPIO edges from the buttons into presses and gestures.
+
+The GPIO callback only timestamps the edge, reads the pin level and
+queues both; all the work happens on the scheduler thread. Edges are
+debounced in software: the first edge which changes a button's state is
+acted on straight away, so a press is handled as soon as the scheduler
+is free, and further edges within the debounce time are counted as
+bounces and ignored. Once the debounce time has passed the pin is read
+again, in case the bouncing ended on the other level.
+
+A button held down for long_press seconds is reported as "long", a
+second press within double_press seconds of the first as "double", and
+any other press as "press". Each press is reported as one gesture only,
+so a long or double press never sets off the action of a single press
+first. That costs the single press some latency, so buttons are added
+with the gestures they are used for: a press is reported as soon as the
+button goes down if that is all it is used for, when it is released if
+it can be held, and double_press seconds after it went down if it can be
+pressed twice.
+
+Example:
+    buttons = ButtonInput(GPIO, scheduler, on_gesture, debounce=0.05)
+    buttons.add("light", 23, gestures=("press", "long"))
+    ...
+    buttons.close()
+
+"""
+
+__all__ = ["ButtonInput"]
+
+import threading
+from collections import deque
+
+
+PRESS = "press"
+DOUBLE = "double"
+LONG = "long"
+
+
+class _Button:
+    __slots__ = ("name", "pin", "long", "double", "down", "changed_at", "settle_job",
+                 "long_job", "press_job", "pressed_at", "reported")
+
+    def __init__(self, name, pin, gestures):
+        self.name = name
+        self.pin = pin
+        self.long = LONG in gestures
+        self.double = DOUBLE in gestures
+        self.down = False
+        self.changed_at = None
+        self.settle_job = None
+        self.long_job = None
+        # A press waiting to see whether a second one follows
+        self.press_job = None
+        self.pressed_at = None
+        # Whether a gesture has been reported for the current press
+        self.reported = True
+
+
+class ButtonInput:
+    """Debounce active low buttons and call on_gesture(name, gesture).
+
+on_gesture is called on the scheduler thread. submit is how the GPIO
+callback hands work to that thread, scheduler.call_soon by default.
+
+    """
+
+    def __init__(self, gpio, scheduler, on_gesture, debounce=0.05, long_press=1.0,
+                 double_press=0.4, submit=None):
+        self.gpio = gpio
+        self.scheduler = scheduler
+        self.clock = scheduler.clock
+        self.on_gesture = on_gesture
+        self.debounce = debounce
+        self.long_press = long_press
+        self.double_press = double_press
+        self.submit = submit if submit is not None else scheduler.call_soon
+        self.buttons = {}
+        self.edges = 0
+        self.bounces = 0
+        self.gestures = 0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self._edges = deque()
+        self._pending = False
+        self._lock = threading.Lock()
+
+    def add(self, name, pin, gestures=(PRESS, DOUBLE, LONG)):
+        """Report the gestures of the button on pin under name."""
+        GPIO = self.gpio
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self.buttons[pin] = _Button(name, pin, gestures)
+        GPIO.add_event_detect(pin, GPIO.BOTH, callback=self._edge)
+
+    def close(self):
+        for button in self.buttons.values():
+            self.gpio.remove_event_detect(button.pin)
+            for job in (button.settle_job, button.long_job, button.press_job):
+                if job is not None:
+                    job.cancel()
+        self.buttons = {}
+
+    def stats(self):
+        return {"edges": self.edges, "bounces": self.bounces, "gestures": self.gestures,
+                "latency_last_ms": self.latency_last * 1000,
+                "latency_max_ms": self.latency_max * 1000}
+
+    # Called on the GPIO callback thread.
+    def _edge(self, pin):
+        self._edges.append((pin, self.gpio.input(pin) == self.gpio.LOW, self.clock.now()))
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+        self.submit(self._process)
+
+    def _process(self):
+        with self._lock:
+            self._pending = False
+        while self._edges:
+            pin, down, at = self._edges.popleft()
+            self.edges += 1
+            button = self.buttons.get(pin)
+            if button is None or down == button.down:
+                continue
+            if button.changed_at is not None and at - button.changed_at < self.debounce:
+                self.bounces += 1
+                if button.settle_job is None:
+                    button.settle_job = self.scheduler.call_at(button.changed_at + self.debounce,
+                                                               self._settle, button)
+                continue
+            self._change(button, down, at)
+
+    def _settle(self, button):
+        button.settle_job = None
+        down = self.gpio.input(button.pin) == self.gpio.LOW
+        if down != button.down:
+            self._change(button, down, self.clock.now())
+
+    def _change(self, button, down, at):
+        button.down = down
+        button.changed_at = at
+        if not down:
+            if button.long_job is not None:
+                button.long_job.cancel()
+                button.long_job = None
+            if not button.reported and button.press_job is None:
+                self._pressed(button, at)
+            return
+        if button.press_job is not None:
+            # The second press of a double. A third quick press starts a new
+            # pair rather than making another double.
+            button.press_job.cancel()
+            button.press_job = None
+            button.reported = True
+            self._gesture(button, DOUBLE, at)
+            return
+        button.pressed_at = at
+        button.reported = False
+        if button.long:
+            button.long_job = self.scheduler.call_at(at + self.long_press, self._long, button)
+        else:
+            self._pressed(button, at)
+
+    def _pressed(self, button, at):
+        # The press can no longer be long, report it unless it may be double.
+        deadline = button.pressed_at + self.double_press
+        if button.double and at < deadline:
+            button.press_job = self.scheduler.call_at(deadline, self._single, button)
+            return
+        button.reported = True
+        self._gesture(button, PRESS, at)
+
+    def _single(self, button):
+        button.press_job = None
+        button.reported = True
+        self._gesture(button, PRESS, button.pressed_at + self.double_press)
+
+    def _long(self, button):
+        button.long_job = None
+        if button.down and not button.reported:
+            button.reported = True
+            self._gesture(button, LONG, button.pressed_at + self.long_press)
+
+    def _gesture(self, button, gesture, at):
+        self.on_gesture(button.name, gesture)
+        self.gestures += 1
+        latency = self.clock.now() - at
+        self.latency_last = latency
+        self.latency_max = max(self.latency_max, latency)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8; -*-
+"""Map temperatures to LED colours.
+
+The ranges and colours from the temperature section of the config are
+compiled once into a ColourMap. In "bands" mode every temperature range
+has one solid colour, found with a binary search over the boundaries.
+In "gradient" mode the colours blend smoothly from one band to the next
+and are looked up in a table precomputed at 0.1 degree resolution.
+
+Example:
+    colours = ColourMap([16, 20, 23.9], [(20, 0, 255), (255, 200, 10),
+                                         (255, 128, 0), (255, 0, 0)])
+    strip.fill(colours.colour(21.3))
+
+"""
+
+__all__ = ["ColourMap"]
+
+from bisect import bisect_left
+
+from nightlightpi.errorstrings import INVALID_COLOUR_TABLE
+
+
+MODES = ("bands", "gradient")
+
+
+class ColourMap:
+    """Look up the LED colour for a temperature in constant time.
+
+Temperatures at or below the first boundary get the first colour, those
+at or above the last boundary get the last colour, and a temperature t
+with ranges[i] < t <= ranges[i + 1] gets colours[i + 1].
+
+    """
+
+    def __init__(self, ranges, colours, mode="bands", resolution=0.1):
+        ranges = [float(r) for r in ranges]
+        if mode not in MODES:
+            raise RuntimeError(INVALID_COLOUR_TABLE.format("unknown colour mode '{0}'".format(mode)))
+        if not ranges or len(colours) < len(ranges):
+            raise RuntimeError(INVALID_COLOUR_TABLE.format("sensor_colours needs an entry per sensor_range"))
+        if ranges != sorted(ranges):
+            raise RuntimeError(INVALID_COLOUR_TABLE.format("sensor_ranges must be in ascending order"))
+        self.mode = mode
+        self.ranges = ranges
+        # One colour per band, the band above the last boundary always
+        # takes the final colour.
+        self.bands = [tuple(c) for c in colours[:len(ranges)]] + [tuple(colours[-1])]
+        self.resolution = resolution
+        self._low = ranges[0]
+        self._scale = 1.0 / resolution
+        self._table = self._gradient_table() if mode == "gradient" else None
+
+    @classmethod
+    def from_config(cls, temp_config):
+        return cls(temp_config.sensor_ranges, temp_config.sensor_colours,
+                   temp_config.colour_mode)
+
+    def colour(self, temperature):
+        """Return the (r, g, b) colour for temperature."""
+        table = self._table
+        if table is not None:
+            index = int((temperature - self._low) * self._scale + 0.5)
+            if index <= 0:
+                return table[0]
+            if index >= len(table):
+                return table[-1]
+            return table[index]
+        if temperature >= self.ranges[-1]:
+            return self.bands[-1]
+        return self.bands[bisect_left(self.ranges, temperature)]
+
+    def _gradient_table(self):
+        # Each colour is anchored at the middle of its band, the outermost
+        # two at the first and last boundaries.
+        ranges = self.ranges
+        anchors = [ranges[0]]
+        anchors += [(low + high) / 2 for low, high in zip(ranges, ranges[1:])]
+        anchors.append(ranges[-1])
+        steps = int(round((ranges[-1] - ranges[0]) / self.resolution))
+        table = []
+        segment = 0
+        for step in range(steps + 1):
+            t = ranges[0] + step * self.resolution
+            while segment < len(anchors) - 2 and t > anchors[segment + 1]:
+                segment += 1
+            low, high = anchors[segment], anchors[segment + 1]
+            weight = (t - low) / (high - low) if high > low else 1.0
+            weight = min(max(weight, 0.0), 1.0)
+            start, end = self.bands[segment], self.bands[segment + 1]
+            table.append(tuple(int(round(a + (b - a) * weight)) for a, b in zip(start, end)))
+        return table
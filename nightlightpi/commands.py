@@ -0,0 +1,103 @@
+# -*- coding: utf-8; -*-
+"""Hand hardware work from callbacks to the scheduler thread.
+
+MQTT messages arrive on paho's network thread and button presses on the
+RPi.GPIO event thread. Rather than driving the display and LED strip
+from those threads, their callbacks submit intents to a CommandQueue,
+which applies them from a job on the scheduler. The scheduler thread is
+then the only one touching the hardware, and a slow display update no
+longer holds up MQTT keepalives.
+
+An intent submitted with a key replaces any pending intent with the same
+key, so ten brightness changes arriving together are applied once.
+
+Example:
+    commands = CommandQueue(scheduler)
+    commands.submit("brightness", light.setBrightness, "10")
+    commands.submit(None, light.lightButtonPressed)
+    print(commands.stats())
+
+"""
+
+__all__ = ["CommandQueue"]
+
+import logging
+import threading
+
+
+class CommandQueue:
+    """Collect intents from any thread and apply them on the scheduler.
+
+Intents are applied in the order they were last submitted. Latency is
+measured from the first submission of an intent, including any it
+replaced, to when it has been applied.
+
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.clock = scheduler.clock
+        self._pending = {}
+        self._sequence = 0
+        self._drain_job = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.superseded = 0
+        self.applied = 0
+        self.max_depth = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_last = 0.0
+
+    def submit(self, key, callback, *args):
+        """Call callback(*args) on the scheduler thread.
+
+A pending intent with the same key is dropped in favour of this one.
+Intents with key None are never merged.
+
+        """
+        now = self.clock.now()
+        with self._lock:
+            self.submitted += 1
+            if key is None:
+                self._sequence += 1
+                key = (None, self._sequence)
+            previous = self._pending.pop(key, None)
+            if previous is not None:
+                self.superseded += 1
+                now = previous[0]
+            self._pending[key] = (now, callback, args)
+            self.max_depth = max(self.max_depth, len(self._pending))
+            if self._drain_job is None:
+                self._drain_job = self.scheduler.call_soon(self.drain)
+
+    def drain(self):
+        """Apply every pending intent now."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._drain_job = None
+        for received, callback, args in pending.values():
+            try:
+                callback(*args)
+            except Exception:
+                logging.exception("Command %r failed", callback)
+            latency = self.clock.now() - received
+            self.applied += 1
+            self.latency_last = latency
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        mean = self.latency_total / self.applied if self.applied else 0.0
+        return {"depth": self.depth,
+                "max_depth": self.max_depth,
+                "submitted": self.submitted,
+                "superseded": self.superseded,
+                "applied": self.applied,
+                "latency_last_ms": self.latency_last * 1000,
+                "latency_mean_ms": mean * 1000,
+                "latency_max_ms": self.latency_max * 1000}
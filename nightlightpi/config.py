@@ -8,6 +8,13 @@ file. If the environment variable is not set, it will assume the user
 is running on a Raspberry PI using Linux and will attempt to find the
 configuration file at /etc/nightlightpi/nightlightpi.yaml.
 
+Validating the file against the schema is slow on a Pi Zero, so the
+resulting Config is cached in a pickle keyed by a hash of the config
+file, the schema and the modules defining the objects it holds. The
+cache is kept in the file named by the NIGHTLIGHTPICONFIGCACHE
+environment variable, or under $XDG_CACHE_HOME/nightlightpi by default.
+Set the variable to an empty string to disable caching.
+
 Example:
     conf = load_config()
     if conf.some_value:
@@ -15,42 +22,161 @@ Example:
 
 """
 
-__all__ = ["load_config"]
+__all__ = ["load_config", "config_path"]
 
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from importlib.resources import files
 from os import environ
+from os.path import dirname
+from os.path import expanduser
 from os.path import join
+from os.path import splitext
 
-from pkg_resources import resource_filename
-from pykwalify.core import Core
-from pykwalify.errors import SchemaError
-from yaml import safe_load
-
+from nightlightpi import colourmap
+from nightlightpi.colourmap import ColourMap
 from nightlightpi.errorstrings import MISSING_CONFIG_VALUE
 
 
 ETCPATH = join("/", "etc", "nightlightpi", "nightlightpi.yaml")
 ENVCONFIGPATH = "NIGHTLIGHTPICONFIG"
+ENVCACHEPATH = "NIGHTLIGHTPICONFIGCACHE"
+ENVSPOOLPATH = "NIGHTLIGHTPISPOOL"
+CACHE_VERSION = b"1"
 
 
-def load_config():
+def load_config(path=None):
     """Load configuration from disk, returned as a Config instance."""
-    data = load_valid_yaml(environ.get(ENVCONFIGPATH, ETCPATH))
+    if path is None:
+        path = config_path()
+    cache_path = environ.get(ENVCACHEPATH, default_cache_path())
+    # The file is read once, so the bytes parsed are the bytes hashed even
+    # if it is written again in between.
+    try:
+        with open(path, "rb") as f:
+            config_bytes = f.read()
+    except OSError:
+        config_bytes = None
+    key = _cache_key(path, config_bytes) if cache_path else None
+    conf = _load_cached(cache_path, key)
+    if conf is not None:
+        return conf
+    data = load_valid_yaml(path, config_bytes)
     conf = Config()
     try:
         _set_config_values(conf, data)
     except KeyError as e:
         raise RuntimeError(MISSING_CONFIG_VALUE.format(e.args[0]))
+    _store_cached(cache_path, key, conf)
     return conf
 
 
-def load_valid_yaml(path):
+def config_path():
+    """Return the path of the config file load_config reads by default."""
+    return environ.get(ENVCONFIGPATH, ETCPATH)
+
+
+def preload_validator():
+    """Import the schema validator now rather than on the next cache miss."""
+    import pykwalify.core  # noqa: F401
+    import yaml  # noqa: F401
+
+
+def load_valid_yaml(path, config_bytes=None):
     """Return a dict deserialized from the file located at path.
 The data will be validated against the schema defined in conf-schema.yaml.
+config_bytes, if given, are the contents of the file already read.
 
     """
-    schema_path = resource_filename("nightlightpi", "conf-schema.yaml")
-    c = Core(source_file=path, schema_files=[schema_path])
-    return c.validate()
+    # pykwalify and its YAML parser take a while to import, so they are
+    # left until the cache has missed.
+    from pykwalify.core import Core
+    from yaml import safe_load
+    from pykwalify.errors import SchemaError
+    schema = safe_load(_schema_bytes())
+    if config_bytes is None:
+        c = Core(source_file=path, schema_data=schema)
+    else:
+        c = Core(source_data=safe_load(config_bytes), schema_data=schema)
+    data = c.validate()
+    # The schema only checks that a light's sections are maps, so each
+    # light is validated again with its sections merged over the others.
+    for device in data.get("fleet") or ():
+        try:
+            Core(source_data=_device_data(data, device), schema_data=schema).validate()
+        except SchemaError as e:
+            raise SchemaError("Fleet light {0}: {1}".format(device["name"], e.msg))
+    return data
+
+
+def default_cache_path():
+    cache_home = environ.get("XDG_CACHE_HOME") or join(expanduser("~"), ".cache")
+    return join(cache_home, "nightlightpi", "config.pickle")
+
+
+def default_spool_path():
+    """Return the spool file of a config which does not name one.
+
+This is the file named by the NIGHTLIGHTPISPOOL environment variable,
+where an empty string keeps the spool in memory, or spool.bin under
+$XDG_STATE_HOME/nightlightpi.
+
+    """
+    path = environ.get(ENVSPOOLPATH)
+    if path is not None:
+        return path or None
+    state_home = environ.get("XDG_STATE_HOME") or join(expanduser("~"), ".local", "state")
+    return join(state_home, "nightlightpi", "spool.bin")
+
+
+def _schema_bytes():
+    return files("nightlightpi").joinpath("conf-schema.yaml").read_bytes()
+
+
+def _cache_key(path, config_bytes):
+    """Return a digest of everything the parsed config depends on."""
+    if config_bytes is None:
+        return None
+    digest = hashlib.sha256(CACHE_VERSION)
+    # The pickle holds instances of the classes defined in these modules.
+    for module in (__file__, colourmap.__file__):
+        digest.update(str(os.stat(module).st_mtime_ns).encode("ascii"))
+    digest.update(_schema_bytes())
+    digest.update(os.path.abspath(path).encode("utf-8"))
+    digest.update(config_bytes)
+    digest.update(str(default_spool_path()).encode("utf-8"))
+    return digest.digest()
+
+
+def _load_cached(cache_path, key):
+    if key is None:
+        return None
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, conf = pickle.load(f)
+    except Exception:
+        return None
+    return conf if cached_key == key else None
+
+
+def _store_cached(cache_path, key, conf):
+    # The pickle is written to a private temporary file and renamed into
+    # place, so a half written cache is never read and nobody else can
+    # write to it.
+    if key is None:
+        return
+    directory = dirname(cache_path)
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((key, conf), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.debug("Could not cache the config in %s: %s", cache_path, e)
 
 
 # TODO: This could be simplified by using YAML SafeLoader and using object
@@ -62,9 +188,17 @@ def _set_config_values(conf, data):
     _set_led_strip_values(conf.led_strip, data)
     _set_inputs_values(conf.inputs, data)
     _set_temperature_values(conf.temperature, data)
+    _set_time_values(conf.timing, data)
     _set_display_mode_values(conf.off_mode, "Off", data)
     _set_display_mode_values(conf.temp_mode, "Temperature", data)
     _set_display_mode_values(conf.rainbow_mode, "Rainbow", data)
+    _set_hardware_values(conf.hardware, data)
+    _set_history_values(conf.history, data)
+    _set_spool_values(conf.spool, data)
+    _set_metrics_values(conf.metrics, data)
+    _set_logging_values(conf.logging, data)
+    _set_memory_values(conf.memory, data)
+    _set_fleet_values(conf, data)
 
 
 def _set_mqtt_values(mqtt, data):
@@ -79,6 +213,15 @@ def _set_mqtt_values(mqtt, data):
     mqtt.server = mqtt_data["server"]
     mqtt.temperature_topic = mqtt_data["temperature_topic"]
     mqtt.user = mqtt_data["user"]
+    mqtt.publish_window_seconds = mqtt_data.get("publish_window_seconds", 0.25)
+    mqtt.group_topic = mqtt_data.get("group_topic")
+    mqtt.history_topic = mqtt_data.get("history_topic")
+    mqtt.logs_topic = mqtt_data.get("logs_topic")
+    mqtt.backlog_topic = mqtt_data.get("backlog_topic")
+    if mqtt.backlog_topic is None:
+        mqtt.backlog_topic = mqtt.temperature_topic.rpartition("/")[0] + "/backlog"
+    mqtt.reconnect_min_seconds = mqtt_data.get("reconnect_min_seconds", 1)
+    mqtt.reconnect_max_seconds = mqtt_data.get("reconnect_max_seconds", 120)
 
 
 def _set_led_strip_values(led_strip, data):
@@ -87,22 +230,34 @@ def _set_led_strip_values(led_strip, data):
     led_strip.light = led_strip_data["light"]
     led_strip.max_brightness = led_strip_data["max_brightness"]
     led_strip.brightness = led_strip_data["brightness"]
+    led_strip.rainbow_spread = led_strip_data.get("rainbow_spread", False)
+    led_strip.spi_bus = led_strip_data.get("spi_bus", 0)
+    led_strip.spi_device = led_strip_data.get("spi_device", 1)
 
 
 def _set_inputs_values(inputs, data):
     inputs_data = data["inputs"]
     inputs.button_light = inputs_data["button_light"]
     inputs.button_display = inputs_data["button_display"]
+    inputs.long_press_seconds = inputs_data.get("long_press_seconds", 1.0)
+    inputs.double_press_seconds = inputs_data.get("double_press_seconds", 0.4)
 
 
 def _set_temperature_values(temp_config, data):
     temp_config_data = data["temperature"]
     temp_config.sensor_ranges = temp_config_data["sensor_ranges"]
     temp_config.sensor_type = temp_config_data["sensor_type"]
+    temp_config.pin = temp_config_data["pin"]
+    temp_config.update_seconds = temp_config_data["update_seconds"]
     colours = list()
     for c in temp_config_data["sensor_colours"]:
         colours.append((c["r"], c["g"], c["b"]))
     temp_config.sensor_colours = colours
+    temp_config.colour_mode = temp_config_data.get("colour_mode", "bands")
+    temp_config.isolate = temp_config_data.get("isolate", False)
+    temp_config.cpus = temp_config_data.get("cpus")
+    temp_config.realtime_priority = temp_config_data.get("realtime_priority")
+    temp_config.colour_map = ColourMap.from_config(temp_config)
 
 
 def _set_time_values(timing_config, data):
@@ -110,6 +265,12 @@ def _set_time_values(timing_config, data):
     timing_config.speed_in_seconds = timing_data["speed_in_seconds"]
     timing_config.menu_button_pressed_time_in_seconds = timing_data["menu_button_pressed_time_in_seconds"]
     timing_config.menu_display = timing_data["menu_display"]
+    rainbow_fps = timing_data.get("rainbow_fps")
+    if rainbow_fps is None:
+        # Without an explicit frame rate, step the rainbow once per speed_in_seconds.
+        speed = timing_config.speed_in_seconds
+        rainbow_fps = 1.0 / speed if speed > 0 else 1.0
+    timing_config.rainbow_fps = rainbow_fps
 
 
 def _set_display_mode_values(mode, name, data):
@@ -120,6 +281,99 @@ def _set_display_mode_values(mode, name, data):
             mode.background = mode_data["background"]
 
 
+def _set_hardware_values(hardware, data):
+    hardware_data = data.get("hardware") or {}
+    hardware.backend = hardware_data.get("backend", "real")
+    for device in ("strip", "display", "sensor", "inputs", "mqtt"):
+        setattr(hardware, device, hardware_data.get(device, hardware.backend))
+
+
+def _set_history_values(history, data):
+    history_data = data.get("history") or {}
+    history.path = history_data.get("path")
+    history.capacity = history_data.get("capacity", 10080)
+    history.flush_seconds = history_data.get("flush_seconds", 900)
+
+
+def _set_spool_values(spool, data):
+    spool_data = data.get("spool") or {}
+    spool.path = spool_data.get("path", default_spool_path())
+    spool.max_records = spool_data.get("max_records", 10080)
+    spool.replay_batch = spool_data.get("replay_batch", 50)
+    spool.replay_rate = spool_data.get("replay_rate", 5)
+
+
+def _set_metrics_values(metrics, data):
+    metrics_data = data.get("metrics") or {}
+    metrics.enable = metrics_data.get("enable", False)
+    metrics.host = metrics_data.get("host", "127.0.0.1")
+    metrics.port = metrics_data.get("port", 9108)
+    metrics.topic = metrics_data.get("topic")
+    metrics.publish_seconds = metrics_data.get("publish_seconds", 60)
+
+
+def _set_logging_values(logging_config, data):
+    logging_data = data.get("logging") or {}
+    logging_config.level = logging_data.get("level", "INFO")
+    logging_config.ring_size = logging_data.get("ring_size", 500)
+    logging_config.rate_per_second = logging_data.get("rate_per_second", 5)
+    logging_config.burst = logging_data.get("burst", 20)
+    logging_config.queue_size = logging_data.get("queue_size", 10000)
+
+
+def _set_memory_values(memory, data):
+    memory_data = data.get("memory") or {}
+    memory.low_memory = memory_data.get("low_memory", False)
+
+
+MQTT_TOPICS = ("temperature_topic", "humidity_topic", "display_topic",
+               "light_topic", "brightness_topic", "history_topic", "logs_topic",
+               "backlog_topic")
+
+
+def _set_fleet_values(conf, data):
+    conf.fleet = [_device_config(data, device) for device in data.get("fleet") or ()]
+
+
+def _device_config(data, device):
+    """Return the Config of one light in the fleet.
+
+The device's sections are merged over the top level ones, and its MQTT
+topics are moved under its topic_prefix, which defaults to the name of
+the device in place of the last part of each topic. Unless the device
+sets its own, the history and spool files get its name appended.
+
+    """
+    conf = Config()
+    _set_config_values(conf, _device_data(data, device))
+    conf.name = device["name"]
+    for name, section in (("history", conf.history), ("spool", conf.spool)):
+        if name not in device and section.path:
+            root, ext = splitext(section.path)
+            section.path = "{0}-{1}{2}".format(root, conf.name, ext)
+    for attr in MQTT_TOPICS:
+        if getattr(conf.mqtt, attr) is None:
+            continue
+        parent, leaf = getattr(conf.mqtt, attr).rpartition("/")[::2]
+        prefix = device.get("topic_prefix") or "/".join(filter(None, (parent, conf.name)))
+        setattr(conf.mqtt, attr, "{0}/{1}".format(prefix, leaf))
+    return conf
+
+
+def _device_data(data, device):
+    """Return the config data of a light, its sections merged over data."""
+    device_data = {key: value for key, value in data.items() if key != "fleet"}
+    for section, overrides in device.items():
+        if section in ("name", "topic_prefix"):
+            continue
+        base = device_data.get(section)
+        if isinstance(base, dict) and isinstance(overrides, dict):
+            device_data[section] = dict(base, **overrides)
+        else:
+            device_data[section] = overrides
+    return device_data
+
+
 class Config:
     """Provide configuration for the MQTT server and RPi attached device.
 This is a composite configuration class built up from other
@@ -127,6 +381,10 @@ configuration objects.
 
     """
 
+    __slots__ = ("mqtt", "led_strip", "inputs", "temperature", "timing",
+                 "off_mode", "temp_mode", "rainbow_mode", "hardware", "history",
+                 "spool", "metrics", "logging", "memory", "name", "fleet")
+
     def __init__(self):
         self.mqtt = MQTTConfig()
         self.led_strip = LEDStripConfig()
@@ -136,9 +394,22 @@ configuration objects.
         self.off_mode = DisplayModeConfig()
         self.temp_mode = DisplayModeConfig()
         self.rainbow_mode = DisplayModeConfig()
+        self.hardware = HardwareConfig()
+        self.history = HistoryConfig()
+        self.spool = SpoolConfig()
+        self.metrics = MetricsConfig()
+        self.logging = LoggingConfig()
+        self.memory = MemoryConfig()
+        self.name = None
+        self.fleet = []
 
 
 class MQTTConfig:
+    __slots__ = ("enable", "server", "port", "user", "password",
+                 "temperature_topic", "humidity_topic", "display_topic",
+                 "light_topic", "brightness_topic", "publish_window_seconds",
+                 "group_topic", "history_topic", "logs_topic", "backlog_topic",
+                 "reconnect_min_seconds", "reconnect_max_seconds")
 
     def __init__(self):
         self.enable = None
@@ -151,45 +422,145 @@ class MQTTConfig:
         self.display_topic = None
         self.light_topic = None
         self.brightness_topic = None
+        self.publish_window_seconds = 0.25
+        self.group_topic = None
+        self.history_topic = None
+        self.logs_topic = None
+        self.backlog_topic = None
+        self.reconnect_min_seconds = 1
+        self.reconnect_max_seconds = 120
 
 
 class LEDStripConfig:
+    __slots__ = ("length", "light", "max_brightness", "brightness",
+                 "rainbow_spread", "spi_bus", "spi_device")
 
     def __init__(self):
         self.length = None
         self.light = None
         self.max_brightness = None
         self.brightness = None
+        self.rainbow_spread = False
+        self.spi_bus = 0
+        self.spi_device = 1
 
 
 class InputsConfig:
+    __slots__ = ("button_light", "button_display", "long_press_seconds",
+                 "double_press_seconds")
 
     def __init__(self):
-        self.buttons_light = None
-        self.buttons_display = None
+        self.button_light = None
+        self.button_display = None
+        self.long_press_seconds = 1.0
+        self.double_press_seconds = 0.4
 
 
 class TemperatureConfig:
+    __slots__ = ("sensor_ranges", "sensor_colours", "colour_mode", "colour_map",
+                 "sensor_type", "pin", "update_seconds", "isolate", "cpus",
+                 "realtime_priority")
 
     def __init__(self):
         self.sensor_ranges = None
         self.sensor_colours = None
+        self.colour_mode = "bands"
+        self.colour_map = None
         self.sensor_type = "AM2302"
         self.pin = 22
         self.update_seconds = 60
+        self.isolate = False
+        self.cpus = None
+        self.realtime_priority = None
 
 
 class TimingConfig:
+    __slots__ = ("speed_in_seconds", "menu_button_pressed_time_in_seconds",
+                 "menu_display", "rainbow_fps")
 
     def __init__(self):
         self.speed_in_seconds = None
         self.menu_button_pressed_time_in_seconds = None
         self.menu_display = None
+        self.rainbow_fps = None
+
+
+class HistoryConfig:
+    """Where and how much sensor history to keep, see nightlightpi.history."""
+
+    __slots__ = ("path", "capacity", "flush_seconds")
+
+    def __init__(self):
+        self.path = None
+        self.capacity = 10080
+        self.flush_seconds = 900
+
+
+class SpoolConfig:
+    """Where readings are kept while MQTT is down, see nightlightpi.spool."""
+
+    __slots__ = ("path", "max_records", "replay_batch", "replay_rate")
+
+    def __init__(self):
+        self.path = None
+        self.max_records = 10080
+        self.replay_batch = 50
+        self.replay_rate = 5
+
+
+class MetricsConfig:
+    """Whether and where to report metrics, see nightlightpi.metrics."""
+
+    __slots__ = ("enable", "host", "port", "topic", "publish_seconds")
+
+    def __init__(self):
+        self.enable = False
+        self.host = "127.0.0.1"
+        self.port = 9108
+        self.topic = None
+        self.publish_seconds = 60
+
+
+class LoggingConfig:
+    """How much to log and keep, see nightlightpi.logs."""
+
+    __slots__ = ("level", "ring_size", "rate_per_second", "burst", "queue_size")
+
+    def __init__(self):
+        self.level = "INFO"
+        self.ring_size = 500
+        self.rate_per_second = 5
+        self.burst = 20
+        self.queue_size = 10000
+
+
+class MemoryConfig:
+    """Whether to trade CPU time for memory, see nightlightpi.memory."""
+
+    __slots__ = ("low_memory",)
+
+    def __init__(self):
+        self.low_memory = False
 
 
 class DisplayModeConfig:
+    __slots__ = ("name", "menu", "background")
 
     def __init__(self):
         self.name = None
         self.menu = None
         self.background = None
+
+
+class HardwareConfig:
+    """Name the backend from nightlightpi.backends used for each device."""
+
+    __slots__ = ("backend", "strip", "display", "sensor", "inputs", "mqtt")
+
+    def __init__(self):
+        self.backend = "real"
+        self.strip = "real"
+        self.display = "real"
+        self.sensor = "real"
+        self.inputs = "real"
+        self.mqtt = "real"
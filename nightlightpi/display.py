@@ -0,0 +1,149 @@
+# -*- coding: utf-8; -*-
+"""Send only the changed parts of each frame to the SSD1306 display.
+
+The SSD1306 stores its pixels in pages of 8 rows, one byte per column
+per page. DiffingDisplay keeps a copy of the last frame sent to the
+device, compares each new frame page by page and transmits only the
+column range that actually changed in each page. Identical frames are
+not transmitted at all.
+
+Example:
+    device = Adafruit_SSD1306.SSD1306_128_64(rst=0)
+    device.begin()
+    display = DiffingDisplay(device)
+    display.image(image)
+    print(display.stats())
+
+"""
+
+__all__ = ["DiffingDisplay", "image_to_pages", "open_image"]
+
+from PIL import Image
+
+
+SSD1306_COLUMNADDR = 0x21
+SSD1306_PAGEADDR = 0x22
+I2C_DATA = 0x40
+I2C_CHUNK = 16
+
+_REVERSE_BITS = bytes(int("{0:08b}".format(i)[::-1], 2) for i in range(256))
+
+
+def image_to_pages(image, width=128, height=64):
+    """Return image packed into the SSD1306 page layout.
+
+The result holds height // 8 pages of width bytes each, the least
+significant bit of every byte being the top row of its page.
+
+    """
+    if image.mode != "1":
+        image = image.convert("1")
+    # Transposing turns display columns into rows, tobytes then packs 8
+    # vertically adjacent pixels into each byte, most significant first.
+    columns = image.transpose(Image.TRANSPOSE).tobytes()
+    pages = height // 8
+    packed = b"".join(columns[page::pages] for page in range(pages))
+    return packed.translate(_REVERSE_BITS)
+
+
+def open_image(path):
+    """Load an image file as a one bit image for the display."""
+    return Image.open(path).convert("1")
+
+
+class DiffingDisplay:
+    """Wrap an Adafruit_SSD1306 device and skip unchanged pixels.
+
+The wrapped device must already have been initialised with begin. Call
+invalidate after anything else has written to the device, the next
+frame is then sent in full.
+
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.width = device.width
+        self.height = device.height
+        self.pages = device.height // 8
+        self.frame_size = self.width * self.pages
+        # The last frame sent is copied into a buffer kept for the life of
+        # the display, rather than a new bytes for every frame.
+        self._last = bytearray(self.frame_size)
+        self._stale = True
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.bytes_sent = 0
+        self.bytes_avoided = 0
+        self.command_bytes = 0
+
+    def image(self, image):
+        """Show a PIL image, sending only what changed."""
+        self.show_buffer(image_to_pages(image, self.width, self.height))
+
+    def clear(self):
+        """Blank the display."""
+        self.show_buffer(bytes(self.frame_size))
+
+    def invalidate(self):
+        """Forget the last frame so the next one is sent in full."""
+        self._stale = True
+
+    def show_buffer(self, buffer):
+        """Show a frame already packed in SSD1306 page layout."""
+        if len(buffer) != self.frame_size:
+            raise ValueError("Expected {0} bytes, got {1}".format(self.frame_size, len(buffer)))
+        last = None if self._stale else self._last
+        if last is not None and last == buffer:
+            self.frames_skipped += 1
+            self.bytes_avoided += self.frame_size
+            return
+        width = self.width
+        sent = 0
+        if last is None:
+            self._send(0, width - 1, 0, self.pages - 1, buffer)
+            sent = self.frame_size
+        else:
+            for page in range(self.pages):
+                start = page * width
+                end = start + width
+                new = buffer[start:end]
+                old = last[start:end]
+                if new == old:
+                    continue
+                first = 0
+                while new[first] == old[first]:
+                    first += 1
+                final = width - 1
+                while new[final] == old[final]:
+                    final -= 1
+                self._send(first, final, page, page, new[first:final + 1])
+                sent += final + 1 - first
+        self._last[:] = buffer
+        self._stale = False
+        self.frames_sent += 1
+        self.bytes_sent += sent
+        self.bytes_avoided += self.frame_size - sent
+
+    def stats(self):
+        """Return the transfer counters as a dict."""
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_skipped": self.frames_skipped,
+            "bytes_sent": self.bytes_sent,
+            "bytes_avoided": self.bytes_avoided,
+            "command_bytes": self.command_bytes,
+        }
+
+    def _send(self, first_column, last_column, first_page, last_page, data):
+        device = self.device
+        for c in (SSD1306_COLUMNADDR, first_column, last_column,
+                  SSD1306_PAGEADDR, first_page, last_page):
+            device.command(c)
+        self.command_bytes += 6
+        # Mirror Adafruit_SSD1306.display, which supports both buses.
+        if getattr(device, "_spi", None) is not None:
+            device._gpio.set_high(device._dc)
+            device._spi.write(list(data))
+        else:
+            for i in range(0, len(data), I2C_CHUNK):
+                device._i2c.writeList(I2C_DATA, list(data[i:i + I2C_CHUNK]))
@@ -4,3 +4,11 @@
 MISSING_CONFIG_VALUE = """
 '{0}' is not specified or invalid in the config file!
 """.strip()
+
+INVALID_COLOUR_TABLE = """
+The temperature colours in the config file are invalid: {0}
+""".strip()
+
+UNKNOWN_BACKEND = """
+There is no '{0}' backend for the {1}, expected one of: {2}
+""".strip()
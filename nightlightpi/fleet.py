@@ -0,0 +1,190 @@
+# -*- coding: utf-8; -*-
+"""Run several night lights from one process.
+
+The lights listed in the fleet section of the config share a single
+scheduler thread and a single MQTT connection. Every light keeps its own
+strip, display, sensor and buttons and its own topics, and incoming
+messages are routed to the light owning the topic, or to every light
+for the group topic.
+
+Example:
+    conf = load_config()
+    fleet = Fleet(conf)
+    fleet.start()
+    ...
+    fleet.stop()
+
+"""
+
+__all__ = ["Fleet"]
+
+import json
+import logging
+import threading
+
+from nightlightpi import backends
+from nightlightpi.config import config_path
+from nightlightpi.config import load_config
+from nightlightpi.config import preload_validator
+from nightlightpi.link import Backoff
+from nightlightpi.link import MQTTLink
+from nightlightpi.metrics import Metrics
+from nightlightpi.nightlight import NightLight
+from nightlightpi.nightlight import serveMetrics
+from nightlightpi.publisher import Publisher
+from nightlightpi.reload import ConfigWatcher
+from nightlightpi.router import TopicRouter
+from nightlightpi.scheduler import Scheduler
+
+
+class Fleet(threading.Thread):
+    """Host a NightLight for each device in config.fleet.
+
+The top level hardware.mqtt backend and mqtt settings are used for the
+shared connection, and the metrics settings for the metrics of every
+light, labelled with its name. Like NightLight, the fleet runs its scheduler on its
+own thread once started.
+
+    """
+
+    def __init__(self, config, scheduler=None):
+        super().__init__(name="fleet")
+        self.config = config
+        self.scheduler = Scheduler() if scheduler is None else scheduler
+        self.mqttc = None
+        self.link = None
+        self.publisher = None
+        # Whether metrics were due while the broker was unreachable
+        self.metrics_held = False
+        if config.mqtt.enable:
+            self.mqttc = backends.create("mqtt", config.hardware.mqtt, config)
+        if self.mqttc is not None:
+            self.publisher = Publisher(self.mqttc, self.scheduler, config.mqtt.publish_window_seconds)
+            self.link = MQTTLink(self.mqttc, config.mqtt.server, config.mqtt.port,
+                                 Backoff(config.mqtt.reconnect_min_seconds,
+                                         config.mqtt.reconnect_max_seconds),
+                                 on_connect=self.on_mqtt_connect,
+                                 on_disconnect=self.on_mqtt_disconnect)
+        self.watcher = None
+        self.metrics = Metrics(config.metrics.enable)
+        self.mqtt_received = self.metrics.counter("nightlight_fleet_mqtt_messages_received_total",
+                                                  "MQTT messages received for the fleet")
+        self.lights = [NightLight(device, scheduler=self.scheduler, mqttc=self.mqttc, link=self.link,
+                                  metrics=self.metrics)
+                       for device in config.fleet]
+        self.metrics_server = self.metrics_job = None
+        if self.metrics.enabled:
+            self.metrics_server, self.metrics_job = serveMetrics(self.metrics, config.metrics,
+                                                                 self.scheduler, self.publish_metrics)
+        self.router = self.build_router()
+        if self.mqttc is not None:
+            self.mqttc.on_message = self.on_mqtt_message
+            self.link.start()
+
+    def build_router(self):
+        router = TopicRouter()
+        for light in self.lights:
+            for topic in light.router.topics():
+                router.add(topic, light.router.dispatch)
+        return router
+
+    def on_mqtt_connect(self, client, userdata, flags, rc):
+        logging.info("Fleet MQTT connection returned result: %s", rc)
+        for topic in self.router.topics():
+            client.subscribe(topic)
+        if rc == 0:
+            for light in self.lights:
+                light.mqttConnected()
+            if self.metrics_held:
+                self.scheduler.call_soon(self.publish_metrics)
+
+    def on_mqtt_disconnect(self, client, userdata, rc):
+        if rc != 0:
+            logging.warning("Unexpected fleet MQTT disconnection.")
+
+    def on_mqtt_message(self, client, userdata, message):
+        payload = message.payload.decode("utf-8")
+        self.mqtt_received.inc()
+        if not self.router.dispatch(message.topic, payload):
+            logging.warning("No light for MQTT topic %s", message.topic)
+
+    def publish_metrics(self):
+        """Queue the metrics on the publisher, or once the broker is back.
+
+Only the latest snapshot is worth sending, so metrics due while the
+broker is unreachable are published once on reconnecting.
+
+        """
+        if self.publisher is None:
+            return
+        self.metrics_held = not self.link.connected
+        if not self.metrics_held:
+            self.publisher.publish(self.config.metrics.topic, json.dumps(self.metrics.snapshot()),
+                                   retain=False)
+
+    def light(self, name):
+        """Return the light called name."""
+        for light in self.lights:
+            if light.config.name == name:
+                return light
+        raise KeyError(name)
+
+    def watchConfig(self, path=None, **kwargs):
+        """Reload the config whenever the file at path changes."""
+        self.watcher = ConfigWatcher(path or config_path(), self.reloadConfig,
+                                     prepare=preload_validator, **kwargs)
+        self.watcher.start()
+
+    def reloadConfig(self):
+        try:
+            new = load_config(self.watcher.path)
+        except Exception as e:
+            logging.error("Not reloading the config, it is invalid: %s", e)
+            return
+        self.scheduler.call_soon(self.applyConfig, new)
+
+    def applyConfig(self, new):
+        """Apply a reloaded config to every light, on the scheduler thread.
+
+Lights are matched to the fleet's devices by name. Adding or removing
+lights needs a restart.
+
+        """
+        devices = {device.name: device for device in new.fleet}
+        if list(devices) != [light.config.name for light in self.lights]:
+            logging.warning("The config change to the fleet needs a restart")
+        self.config = new
+        for light in self.lights:
+            device = devices.get(light.config.name)
+            if device is not None:
+                light.applyConfig(device)
+        topics = set(self.router.topics())
+        self.router = self.build_router()
+        if self.link is not None and self.link.connected:
+            new_topics = set(self.router.topics())
+            for topic in topics - new_topics:
+                self.mqttc.unsubscribe(topic)
+            for topic in new_topics - topics:
+                self.mqttc.subscribe(topic)
+
+    def begin(self):
+        for light in self.lights:
+            light.begin()
+
+    def run(self):
+        self.begin()
+        self.scheduler.run()
+
+    def stop(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.scheduler.stop()
+        for light in self.lights:
+            light.stop()
+        if self.metrics_job is not None:
+            self.metrics_job.cancel()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.link is not None:
+            self.link.stop()
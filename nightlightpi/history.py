@@ -0,0 +1,176 @@
+# -*- coding: utf-8; -*-
+"""Keep a history of sensor readings that survives restarts.
+
+Readings are stored in a fixed size ring buffer made of three arrays,
+timestamps as doubles and temperature and humidity as 32 bit floats, so
+memory use stays the same however long the light has been running. If
+a path is given the ring is mirrored in a memory mapped file. Only the
+records added since the last flush are copied into the file, and
+flushes are meant to run every few minutes rather than on every
+reading, which keeps writes to the SD card small and infrequent.
+
+Example:
+    history = SensorHistory(10080, "/var/lib/nightlightpi/history.bin")
+    history.append(time.time(), 21.5, 40.0)
+    history.flush()
+    for bucket in history.rollup(3600, since=time.time() - 86400):
+        print(bucket["start"], bucket["temperature"]["avg"])
+
+"""
+
+__all__ = ["SensorHistory"]
+
+import logging
+import mmap
+import os
+import struct
+from array import array
+
+
+MAGIC = b"NLH1"
+HEADER = struct.Struct("<4sIII")
+
+
+class SensorHistory:
+    """Hold the last capacity readings, optionally backed by a file.
+
+A file written with a different capacity is discarded and started over.
+Records are appended in time order and queries return them oldest
+first.
+
+    """
+
+    def __init__(self, capacity, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.times = array("d", bytes(8 * capacity))
+        self.temperatures = array("f", bytes(4 * capacity))
+        self.humidities = array("f", bytes(4 * capacity))
+        self.head = 0
+        self.count = 0
+        self.bytes_written = 0
+        self.flushes = 0
+        self._unflushed = 0
+        self._file = None
+        self._map = None
+        if path is not None:
+            self._open(path)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, temperature, humidity):
+        head = self.head
+        self.times[head] = timestamp
+        self.temperatures[head] = temperature
+        self.humidities[head] = humidity
+        self.head = (head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self._unflushed = min(self._unflushed + 1, self.capacity)
+
+    def latest(self):
+        """Return the newest (timestamp, temperature, humidity), or None."""
+        if not self.count:
+            return None
+        index = (self.head - 1) % self.capacity
+        return self.times[index], self.temperatures[index], self.humidities[index]
+
+    def records(self, since=None):
+        """Return (timestamp, temperature, humidity) tuples, oldest first."""
+        start = (self.head - self.count) % self.capacity
+        records = [(self.times[i % self.capacity], self.temperatures[i % self.capacity],
+                    self.humidities[i % self.capacity])
+                   for i in range(start, start + self.count)]
+        if since is not None:
+            records = [record for record in records if record[0] >= since]
+        return records
+
+    def rollup(self, bucket_seconds, since=None):
+        """Return the min, max and average of the readings in each bucket.
+
+Buckets are bucket_seconds wide, aligned to multiples of bucket_seconds
+since the epoch, and empty buckets are left out.
+
+        """
+        if bucket_seconds <= 0:
+            raise ValueError("bucket_seconds must be positive")
+        buckets = []
+        current = None
+        for timestamp, temperature, humidity in self.records(since):
+            start = timestamp - timestamp % bucket_seconds
+            if current is None or current[0] != start:
+                current = [start, [], []]
+                buckets.append(current)
+            current[1].append(temperature)
+            current[2].append(humidity)
+        return [{"start": start, "count": len(temperatures),
+                 "temperature": _summary(temperatures),
+                 "humidity": _summary(humidities)}
+                for start, temperatures, humidities in buckets]
+
+    def flush(self):
+        """Copy the records added since the last flush to the file."""
+        if self._map is None or not self._unflushed:
+            return
+        first = (self.head - self._unflushed) % self.capacity
+        for offset, values in self._columns():
+            size = values.itemsize
+            data = memoryview(values).cast("B")
+            end = first + self._unflushed
+            for start, stop in ((first, min(end, self.capacity)), (0, max(end - self.capacity, 0))):
+                if stop > start:
+                    self._map[offset + start * size:offset + stop * size] = data[start * size:stop * size]
+                    self.bytes_written += (stop - start) * size
+        self._map[:HEADER.size] = HEADER.pack(MAGIC, self.capacity, self.count, self.head)
+        self.bytes_written += HEADER.size
+        self._map.flush()
+        self._unflushed = 0
+        self.flushes += 1
+
+    def close(self):
+        self.flush()
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+    def stats(self):
+        return {"records": self.count, "capacity": self.capacity,
+                "unflushed": self._unflushed, "flushes": self.flushes,
+                "bytes_written": self.bytes_written}
+
+    def _columns(self):
+        offset = HEADER.size
+        for values in (self.times, self.temperatures, self.humidities):
+            yield offset, values
+            offset += values.itemsize * self.capacity
+
+    def _open(self, path):
+        size = HEADER.size + 16 * self.capacity
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a+b")
+        existing = os.fstat(self._file.fileno()).st_size
+        if existing != size:
+            if existing:
+                logging.warning("Discarding sensor history in %s, it has a different size", path)
+            self._file.truncate(0)
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        magic, capacity, count, head = HEADER.unpack(self._map[:HEADER.size])
+        if magic != MAGIC or capacity != self.capacity:
+            # Not a history file, or one for another capacity: start afresh.
+            self._unflushed = self.capacity
+            self.flush()
+            self._unflushed = 0
+            return
+        for offset, values in self._columns():
+            view = memoryview(values).cast("B")
+            view[:] = self._map[offset:offset + len(view)]
+        self.count = count
+        self.head = head
+
+
+def _summary(values):
+    return {"min": min(values), "max": max(values), "avg": sum(values) / len(values)}
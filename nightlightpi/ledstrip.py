@@ -0,0 +1,192 @@
+# -*- coding: utf-8; -*-
+"""Drive an APA102 LED strip from a single preallocated frame buffer.
+
+The whole strip is held as one bytearray already in APA102 wire format:
+a start frame, four bytes per LED and an end frame. Colours are written
+to ranges of LEDs with slice assignment and the finished frame is sent
+with one SPI transfer, so the cost of an update hardly depends on the
+length of the strip. Frames identical to the last one sent are not
+transmitted again.
+
+Example:
+    strip = APA102Engine(10, SpiDevSink(), global_brightness=30)
+    strip.fill((255, 0, 0), 0, 5, brightness=50)
+    strip.show()
+
+"""
+
+__all__ = ["APA102Engine", "SpiDevSink", "lit_range", "wheel"]
+
+from math import ceil
+
+
+MAX_BRIGHTNESS = 31
+LED_START = 0xE0
+
+# Byte offsets of red, green and blue within an LED frame for each of the
+# colour orders supported by the APA102_Pi library.
+RGB_MAP = {
+    "rgb": (3, 2, 1),
+    "rbg": (3, 1, 2),
+    "grb": (2, 3, 1),
+    "gbr": (2, 1, 3),
+    "brg": (1, 3, 2),
+    "bgr": (1, 2, 3),
+}
+
+
+def wheel(position):
+    """Return the (r, g, b) colour at position 0-255 of a colour wheel."""
+    if position > 255:
+        position = 255
+    if position < 85:
+        return (position * 3, 255 - position * 3, 0)
+    if position < 170:
+        position -= 85
+        return (255 - position * 3, 0, position * 3)
+    position -= 170
+    return (0, position * 3, 255 - position * 3)
+
+
+def lit_range(length, light):
+    """Return the (start, stop) LEDs to light for led_strip.light.
+
+A positive light counts LEDs from the start of the strip and a negative
+one counts from the end.
+
+    """
+    if light > 0:
+        return 0, min(light, length)
+    if light < 0:
+        return max(length + light, 0), length
+    return 0, 0
+
+
+class SpiDevSink:
+    """Write frames to the strip through the spidev SPI driver."""
+
+    def __init__(self, bus=0, device=1, speed_hz=8000000):
+        import spidev
+        self.spi = spidev.SpiDev()
+        self.spi.open(bus, device)
+        self.spi.max_speed_hz = speed_hz
+
+    def write(self, frame):
+        self.spi.writebytes2(frame)
+
+    def close(self):
+        self.spi.close()
+
+
+class APA102Engine:
+    """Hold the strip state in wire format and send it in one transfer.
+
+Brightness is given as a percentage of global_brightness, the same
+convention as the APA102_Pi library. The sink is any object with a
+write method accepting a bytes-like frame.
+
+    """
+
+    def __init__(self, length, sink, global_brightness=MAX_BRIGHTNESS, order="rgb"):
+        self.length = length
+        self.sink = sink
+        self.global_brightness = min(global_brightness, MAX_BRIGHTNESS)
+        self._rgb_map = RGB_MAP.get(order.lower(), RGB_MAP["rgb"])
+        self._start = 4
+        self._stop = 4 + 4 * length
+        # The start frame is 32 zero bits. The end frame needs half a clock
+        # pulse per LED to push the data through the strip.
+        self._frame = bytearray(self._stop + (length + 15) // 16)
+        self._committed = None
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.clear()
+
+    def pixel(self, rgb, brightness=100):
+        """Return the 4 byte LED frame for one pixel."""
+        level = ceil(brightness * self.global_brightness / 100.0)
+        pixel = bytearray(4)
+        pixel[0] = (level & MAX_BRIGHTNESS) | LED_START
+        r, g, b = self._rgb_map
+        pixel[r], pixel[g], pixel[b] = rgb
+        return bytes(pixel)
+
+    def fill(self, rgb, start=0, stop=None, brightness=100):
+        """Set LEDs start up to stop to the same colour."""
+        self._fill(self._frame, self._start, rgb, start, stop, brightness)
+
+    def compose(self, rgb, start=0, stop=None, brightness=100):
+        """Return the LED frames setting LEDs start up to stop to rgb.
+
+Neither the strip nor the rest of its LEDs are read, so the frames can be
+composed without holding the lock which serialises writes to the strip.
+Pass the result to swap with the same start.
+
+        """
+        if stop is None or stop > self.length:
+            stop = self.length
+        return self.pixel(rgb, brightness) * max(stop - max(start, 0), 0)
+
+    def swap(self, leds, start=0, force=False):
+        """Copy leds, as returned by compose, in from LED start and send the frame.
+
+Only those LEDs are replaced, whatever else has been written to the
+strip since they were composed is kept.
+
+        """
+        self.load(leds, max(start, 0))
+        self.show(force)
+
+    def _fill(self, frame, base, rgb, start, stop, brightness):
+        if stop is None or stop > self.length:
+            stop = self.length
+        start = max(start, 0)
+        if stop <= start:
+            return
+        frame[base + 4 * start:base + 4 * stop] = self.pixel(rgb, brightness) * (stop - start)
+
+    def load(self, leds, start=0):
+        """Copy already packed LED frames into the strip from LED start."""
+        offset = self._start + 4 * start
+        end = min(offset + len(leds), self._stop)
+        self._frame[offset:end] = leds[:end - offset]
+
+    def set_brightness(self, brightness):
+        """Change the brightness of every LED, keeping their colours."""
+        level = ceil(brightness * self.global_brightness / 100.0)
+        self._frame[self._start:self._stop:4] = bytes([(level & MAX_BRIGHTNESS) | LED_START]) * self.length
+
+    def clear(self):
+        """Turn every LED off. Call show to send the change."""
+        self.fill((0, 0, 0))
+
+    def leds(self):
+        """Return a copy of the LED frames, without start and end frames."""
+        return bytes(self._frame[self._start:self._stop])
+
+    def show(self, force=False):
+        """Send the frame to the strip in a single transfer.
+
+The transfer is skipped when the frame is identical to the last one
+sent, unless force is set.
+
+        """
+        if not force and self._committed == self._frame:
+            self.frames_skipped += 1
+            return
+        self.sink.write(self._frame)
+        self._committed = bytes(self._frame)
+        self.frames_sent += 1
+
+    def invalidate(self):
+        """Forget the last frame sent so the next show always sends."""
+        self._committed = None
+
+    def stats(self):
+        """Return the transfer counters as a dict."""
+        return {"frames_sent": self.frames_sent, "frames_skipped": self.frames_skipped}
+
+    def close(self):
+        close = getattr(self.sink, "close", None)
+        if close is not None:
+            close()
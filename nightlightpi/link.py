@@ -0,0 +1,131 @@
+# -*- coding: utf-8; -*-
+"""Keep the MQTT connection up with a jittered reconnect backoff.
+
+paho's loop_start reconnects on its own with a fixed doubling delay, so
+every light that lost a broker retries in step with every other one
+when the broker comes back. MQTTLink instead runs the client's network
+loop on its own thread and, whenever the connection drops, waits a
+random delay of up to an exponentially growing limit before trying
+again.
+
+Example:
+    link = MQTTLink(client, "broker.local", 8883, Backoff(1, 120),
+                    on_connect=subscribe)
+    link.start()
+    ...
+    link.stop()
+
+"""
+
+__all__ = ["Backoff", "MQTTLink"]
+
+import logging
+import random
+import threading
+
+
+MQTT_ERR_SUCCESS = 0
+
+
+class Backoff:
+    """Return reconnect delays using exponential backoff with full jitter.
+
+Each delay is uniformly random between zero and base doubled once per
+attempt, capped at cap seconds.
+
+    """
+
+    def __init__(self, base=1.0, cap=120.0, rng=None):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+        self._random = rng if rng is not None else random.Random()
+
+    def next(self):
+        limit = min(self.cap, self.base * 2 ** self.attempt)
+        self.attempt += 1
+        return self._random.uniform(0, limit)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class MQTTLink:
+    """Connect a paho compatible client and reconnect when it drops.
+
+on_connect and on_disconnect are installed as the client's callbacks
+and keep connected up to date. The first connection is attempted
+straight away, later ones after a delay from backoff.
+
+    """
+
+    def __init__(self, client, host, port, backoff=None, on_connect=None,
+                 on_disconnect=None, loop_timeout=1.0):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.loop_timeout = loop_timeout
+        self.connected = False
+        self.connects = 0
+        self.failures = 0
+        self._stopping = threading.Event()
+        self._up = threading.Event()
+        self._thread = None
+        client.on_connect = self._connected
+        client.on_disconnect = self._disconnected
+
+    def start(self):
+        self.client.connect_async(self.host, port=self.port)
+        self._thread = threading.Thread(target=self._run, name="mqtt", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self.client.disconnect()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(self.loop_timeout * 2)
+
+    def wait_connected(self, timeout=None):
+        """Wait for the connection to be up, returning False on timeout."""
+        return self._up.wait(timeout)
+
+    def stats(self):
+        return {"connected": self.connected, "connects": self.connects,
+                "failures": self.failures, "attempt": self.backoff.attempt}
+
+    def _run(self):
+        socket_open = False
+        first = True
+        while not self._stopping.is_set():
+            if not socket_open:
+                delay = 0 if first else self.backoff.next()
+                first = False
+                if self._stopping.wait(delay):
+                    break
+                try:
+                    socket_open = self.client.reconnect() == MQTT_ERR_SUCCESS
+                except OSError as e:
+                    logging.warning("Could not connect to MQTT broker: %s", e)
+                if not socket_open:
+                    self.failures += 1
+                continue
+            if self.client.loop(timeout=self.loop_timeout) != MQTT_ERR_SUCCESS:
+                socket_open = False
+
+    def _connected(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connected = True
+            self.connects += 1
+            self.backoff.reset()
+            self._up.set()
+        if self.on_connect is not None:
+            self.on_connect(client, userdata, flags, rc)
+
+    def _disconnected(self, client, userdata, rc):
+        self.connected = False
+        self._up.clear()
+        if self.on_disconnect is not None:
+            self.on_disconnect(client, userdata, rc)
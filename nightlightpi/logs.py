@@ -0,0 +1,240 @@
+# -*- coding: utf-8; -*-
+"""Log from the hot paths without waiting for the log to be written.
+
+The root logger is given a single handler which puts records on a queue.
+A background thread takes them off and writes them to stderr, or the
+systemd journal on a Pi, and into a ring of recent events that can be
+fetched over MQTT. Records are put on the queue unformatted, so with
+%-style arguments the message is only built on the writer thread, and a
+full queue drops records rather than blocking the caller.
+
+Busy events are rate limited per message: each logger, level and message
+template has a token bucket refilled at rate records a second, holding
+up to burst of them. Records arriving with the bucket empty are dropped,
+and the next one let through reports how many similar ones were. Errors
+are never limited.
+
+Example:
+    pipeline = start_logging(logging.INFO, ring_size=500, rate=5, burst=20)
+    logging.info("Received MQTT message with topic %s", topic)
+    print(recent(10))
+    stop_logging()
+
+"""
+
+__all__ = ["LogPipeline", "RateLimitFilter", "RingHandler", "recent",
+           "start_logging", "stop_logging"]
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import deque
+
+
+FORMAT = "%(levelname)s: %(message)s"
+
+_pipeline = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop records of a kind arriving faster than rate a second.
+
+Records above max_level are always let through. At most max_keys
+kinds are tracked, the buckets start over when there are more.
+
+    """
+
+    def __init__(self, rate=5.0, burst=20, max_level=logging.WARNING, max_keys=1024,
+                 clock=time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_level = max_level
+        self.max_keys = max_keys
+        self.clock = clock
+        self.suppressed = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.clear()
+                self._buckets[key] = [self.burst - 1, now, 0]
+                return True
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] = tokens - 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class _Formatter(logging.Formatter):
+
+    def format(self, record):
+        message = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            message += " ({0} similar messages suppressed)".format(suppressed)
+        return message
+
+
+class RingHandler(logging.Handler):
+    """Keep the last capacity records as dicts for recent."""
+
+    def __init__(self, capacity=500):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self.records.append({"time": round(record.created, 3),
+                             "level": record.levelname,
+                             "logger": record.name,
+                             "message": message})
+
+    def recent(self, count=None, level=logging.NOTSET):
+        """Return up to count of the latest records at level or above, oldest first."""
+        records = [record for record in list(self.records)
+                   if logging.getLevelName(record["level"]) >= level]
+        return records[-count:] if count else records
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.queued = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting is left to the writer thread. The record is not
+        # copied either, nothing else sees it once it is queued.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.queued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+
+    def prepare(self, record):
+        # Merge the arguments into the message once for all the handlers.
+        # A bad format string must not stop the writer thread, so the
+        # message is then kept as it was with the arguments after it.
+        try:
+            record.msg = record.getMessage()
+        except Exception:
+            record.msg = "{0} {1!r}".format(record.msg, record.args)
+        record.args = None
+        return record
+
+
+class LogPipeline:
+    """Route the root logger through a queue to handlers on a writer thread.
+
+start replaces the root logger's handlers, which stop puts back after
+writing out whatever is still queued.
+
+    """
+
+    def __init__(self, level=logging.INFO, ring_size=500, rate=5.0, burst=20,
+                 queue_size=10000, handlers=None, format=FORMAT):
+        formatter = _Formatter(format)
+        if handlers is None:
+            handlers = [logging.StreamHandler()]
+        self.ring = RingHandler(ring_size)
+        self.handlers = list(handlers) + [self.ring]
+        for handler in self.handlers:
+            handler.setFormatter(formatter)
+        self.level = level
+        self.limiter = RateLimitFilter(rate, burst)
+        self.handler = _QueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(self.limiter)
+        self.listener = _QueueListener(self.handler.queue, *self.handlers,
+                                       respect_handler_level=True)
+        self._previous = None
+
+    def start(self):
+        root = logging.getLogger()
+        self._previous = (root.handlers[:], root.level)
+        root.handlers[:] = [self.handler]
+        root.setLevel(self.level)
+        self.listener.start()
+
+    def stop(self):
+        if self._previous is None:
+            return
+        root = logging.getLogger()
+        handlers, level = self._previous
+        self._previous = None
+        root.handlers[:] = handlers
+        root.setLevel(level)
+        self.listener.stop()
+        for handler in self.handlers:
+            handler.flush()
+
+    def flush(self):
+        """Wait until every queued record has been handled."""
+        self.handler.queue.join()
+
+    def stats(self):
+        return {"queued": self.handler.queued,
+                "dropped": self.handler.dropped,
+                "suppressed": self.limiter.suppressed,
+                "pending": self.handler.queue.qsize()}
+
+
+def start_logging(level=logging.INFO, **kwargs):
+    """Start a LogPipeline for the root logger, stopping any running one.
+
+kwargs are passed to LogPipeline. The pipeline is stopped when the
+interpreter exits, so the last records are not lost.
+
+    """
+    global _pipeline
+    stop_logging()
+    _pipeline = LogPipeline(level, **kwargs)
+    _pipeline.start()
+    return _pipeline
+
+
+def stop_logging():
+    global _pipeline
+    if _pipeline is not None:
+        _pipeline.stop()
+        _pipeline = None
+
+
+def recent(count=None, level=logging.NOTSET):
+    """Return the latest records kept by the running pipeline, if any."""
+    if _pipeline is None:
+        return []
+    return _pipeline.ring.recent(count, level)
+
+
+atexit.register(stop_logging)
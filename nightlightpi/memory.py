@@ -0,0 +1,178 @@
+# -*- coding: utf-8; -*-
+"""Report how much memory the light uses, by subsystem.
+
+Resident memory is read from /proc and the Python heap is traced with
+tracemalloc. Every traced allocation is charged to the innermost
+nightlightpi module on its call stack, so memory PIL allocates for the
+renderer counts against the renderer. Modules being imported and
+allocations made outside any nightlightpi module are grouped by top
+level package.
+
+Run as a command, a light is built from the config on the simulated
+backend, so it can be run next to the real one, and the memory in use
+is reported once it has started and again after running for a while:
+
+    python -m nightlightpi.memory --seconds 60 /etc/nightlightpi/nightlightpi.yaml
+
+Example:
+    tracemalloc.start(FRAMES)
+    light = NightLight(config)
+    print(usage()["rss_kib"], by_subsystem(tracemalloc.take_snapshot()))
+
+"""
+
+__all__ = ["by_subsystem", "growth", "rss_kib", "usage"]
+
+import argparse
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from os.path import dirname
+from os.path import sep
+
+
+# Stack frames kept per allocation, enough to reach the calling module
+# from inside PIL or the standard library.
+FRAMES = 25
+
+MODULE = os.path.abspath(__file__)
+PACKAGE = dirname(MODULE) + sep
+
+
+def rss_kib():
+    """Return the resident set size of this process in KiB, or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def _package(filename):
+    if filename.startswith(PACKAGE):
+        return filename[len(PACKAGE):].rsplit(".", 1)[0]
+    for path in sorted(sys.path, key=len, reverse=True):
+        if path and filename.startswith(path + sep):
+            return filename[len(path) + 1:].split(sep)[0].rsplit(".", 1)[0]
+    return filename
+
+
+def _innermost_file(traceback):
+    for frame in reversed(traceback):
+        if not frame.filename.startswith("<"):
+            return frame.filename
+    return traceback[-1].filename
+
+
+def _subsystem(traceback):
+    for frame in reversed(traceback):
+        filename = frame.filename
+        if filename == MODULE:
+            # The report's own snapshots
+            return None
+        if filename.startswith(PACKAGE):
+            return _package(filename)
+        if filename.startswith("<frozen importlib"):
+            return "import:" + _package(_innermost_file(traceback))
+    return "other:" + _package(_innermost_file(traceback))
+
+
+def by_subsystem(snapshot):
+    """Return {subsystem: KiB} of the memory allocated in snapshot."""
+    totals = {}
+    for stat in snapshot.statistics("traceback"):
+        name = _subsystem(stat.traceback)
+        if name is not None:
+            totals[name] = totals.get(name, 0) + stat.size
+    return {name: size / 1024 for name, size in sorted(totals.items(), key=lambda item: -item[1])}
+
+
+def growth(before, after):
+    """Return {subsystem: KiB} of the change between two snapshots."""
+    old = by_subsystem(before)
+    new = by_subsystem(after)
+    changes = {name: new.get(name, 0) - old.get(name, 0) for name in set(old) | set(new)}
+    return {name: kib for name, kib in sorted(changes.items(), key=lambda item: -abs(item[1]))
+            if abs(kib) >= 0.1}
+
+
+def usage():
+    """Return the resident and traced memory of the process now."""
+    current, peak = tracemalloc.get_traced_memory()
+    return {"rss_kib": rss_kib(),
+            "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "traced_kib": current / 1024,
+            "traced_peak_kib": peak / 1024}
+
+
+def report(config, seconds=60.0, warmup=5.0):
+    """Run a simulated light from config and return its memory use.
+
+The result holds the usage and the traced memory by subsystem once the
+light has started, and after it has run for seconds, along with how much
+each subsystem grew in between. The light keeps its history and spool in
+memory and does not serve metrics.
+
+    """
+    from nightlightpi.nightlight import NightLight
+    for device in config.hardware.__slots__:
+        setattr(config.hardware, device, "simulated")
+    # Leave the files and port of a light already running from the config
+    # alone.
+    config.history.path = None
+    config.spool.path = None
+    config.metrics.port = None
+    config.metrics.topic = None
+    tracemalloc.start(FRAMES)
+    try:
+        light = NightLight(config)
+        light.start()
+        try:
+            time.sleep(warmup)
+            started = tracemalloc.take_snapshot()
+            result = {"startup": dict(usage(), subsystems=by_subsystem(started))}
+            time.sleep(seconds)
+            steady = tracemalloc.take_snapshot()
+            result["steady"] = dict(usage(), subsystems=by_subsystem(steady))
+            result["growth_kib"] = growth(started, steady)
+        finally:
+            light.stop()
+            light.join()
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def _print_usage(title, values):
+    print("{0}: RSS {1} KiB (peak {2} KiB), Python heap {3:.0f} KiB (peak {4:.0f} KiB)".format(
+        title, values["rss_kib"], values["max_rss_kib"], values["traced_kib"],
+        values["traced_peak_kib"]))
+    for name, kib in values["subsystems"].items():
+        if kib >= 1:
+            print("    {0:<24} {1:>10.1f} KiB".format(name, kib))
+
+
+def main(argv=None):
+    from nightlightpi.config import load_config
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("config", nargs="?", help="config file, by default the one the light uses")
+    parser.add_argument("--seconds", type=float, default=60.0, help="how long to run for")
+    parser.add_argument("--low-memory", action="store_true", help="run in low memory mode")
+    args = parser.parse_args(argv)
+    config = load_config(args.config)
+    if args.low_memory:
+        config.memory.low_memory = True
+    result = report(config, args.seconds)
+    _print_usage("Started", result["startup"])
+    _print_usage("After {0:g} seconds".format(args.seconds), result["steady"])
+    print("Growth:")
+    for name, kib in result["growth_kib"].items():
+        print("    {0:<24} {1:>+10.1f} KiB".format(name, kib))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
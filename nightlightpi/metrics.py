@@ -0,0 +1,292 @@
+# -*- coding: utf-8; -*-
+"""Count and time what the light spends its time on.
+
+Metrics holds counters, timers and values collected from callbacks when
+they are read. Timers keep a count, total and maximum of the durations
+observed, and a lock created through Metrics times how long callers
+wait to acquire it. With enabled False every metric is a shared object
+whose methods do nothing and locks are plain threading.Lock instances,
+so instrumented code costs next to nothing when metrics are off.
+
+MetricsServer serves the metrics in the Prometheus text format over
+HTTP, and snapshot returns them as a dict for publishing over MQTT.
+
+Example:
+    metrics = Metrics()
+    frames = metrics.counter("nightlight_frames_total", "Frames written")
+    write_time = metrics.timer("nightlight_strip_write_seconds", "SPI writes")
+    with write_time.time():
+        strip.show()
+    frames.inc()
+    server = MetricsServer(metrics, port=9108)
+    server.start()
+
+"""
+
+__all__ = ["Metrics", "MetricsServer", "TimedLock"]
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from time import perf_counter
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Timer:
+    """Keep the count, total and maximum of durations in seconds."""
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def time(self):
+        """Return a context manager timing its body."""
+        return _Timing(self)
+
+
+class _Timing:
+    __slots__ = ("timer", "started")
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.observe(perf_counter() - self.started)
+
+
+class _NullMetric:
+    """Stands in for every metric type when metrics are disabled."""
+
+    __slots__ = ()
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, seconds):
+        pass
+
+    def time(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_METRIC = _NullMetric()
+
+
+class TimedLock:
+    """A threading.Lock which records how long acquire waited in a Timer."""
+
+    __slots__ = ("_lock", "_timer")
+
+    def __init__(self, timer, lock=None):
+        self._lock = threading.Lock() if lock is None else lock
+        self._timer = timer
+
+    def acquire(self, blocking=True, timeout=-1):
+        started = perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        self._timer.observe(perf_counter() - started)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+
+class Metrics:
+    """A registry of named metrics, each optionally split by labels.
+
+Registering a name again with the same labels returns the existing
+metric, so several lights can share one registry by labelling their
+metrics with their name.
+
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, **labels):
+        if not self.enabled:
+            return NULL_METRIC
+        return self._register(name, "counter", help, labels, Counter)
+
+    def timer(self, name, help, **labels):
+        if not self.enabled:
+            return NULL_METRIC
+        return self._register(name, "summary", help, labels, Timer)
+
+    def collect(self, name, help, callback, kind="gauge", **labels):
+        """Report the value callback returns whenever metrics are read."""
+        if self.enabled:
+            self._register(name, kind, help, labels, lambda: callback)
+
+    def lock(self, name, help, **labels):
+        """Return a lock whose acquire wait times are kept in a timer."""
+        if not self.enabled:
+            return threading.Lock()
+        return TimedLock(self.timer(name, help, **labels))
+
+    def snapshot(self):
+        """Return {name: {labels: value}}, timers as count, sum and max."""
+        result = {}
+        for name, (kind, _, metrics) in self._items():
+            values = result[name] = {}
+            for labels, metric in metrics:
+                key = ",".join("{0}={1}".format(*label) for label in labels)
+                values[key] = _value(metric)
+        return result
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for name, (kind, help, metrics) in self._items():
+            lines.append("# HELP {0} {1}".format(name, help))
+            lines.append("# TYPE {0} {1}".format(name, kind))
+            values = [(labels, _value(metric)) for labels, metric in metrics]
+            if kind != "summary":
+                for labels, value in values:
+                    lines.append("{0}{1} {2}".format(name, _labels(labels), _number(value)))
+                continue
+            for labels, value in values:
+                for suffix in ("count", "sum"):
+                    lines.append("{0}_{1}{2} {3}".format(name, suffix, _labels(labels),
+                                                         _number(value[suffix])))
+            # A summary has no max sample, so it is a gauge family of its own.
+            lines.append("# HELP {0}_max {1} (largest)".format(name, help))
+            lines.append("# TYPE {0}_max gauge".format(name))
+            for labels, value in values:
+                lines.append("{0}_max{1} {2}".format(name, _labels(labels), _number(value["max"])))
+        lines.append("")
+        return "\n".join(lines)
+
+    def _register(self, name, kind, help, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help, {}))
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+        return metric
+
+    def _items(self):
+        with self._lock:
+            return [(name, (kind, help, list(metrics.items())))
+                    for name, (kind, help, metrics) in sorted(self._families.items())]
+
+
+def _value(metric):
+    if isinstance(metric, Counter):
+        return metric.value
+    if isinstance(metric, Timer):
+        return {"count": metric.count, "sum": metric.total, "max": metric.max}
+    try:
+        return metric()
+    except Exception:
+        logging.exception("Collecting a metric failed")
+        return None
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{0}="{1}"'.format(key, str(value).replace('"', '\\"'))
+                          for key, value in labels) + "}"
+
+
+def _number(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsServer:
+    """Serve the metrics at /metrics over HTTP from a background thread.
+
+The server listens on localhost by default. Port 0 picks a free port,
+see address for the one in use.
+
+    """
+
+    def __init__(self, metrics, host="127.0.0.1", port=9108):
+        self.metrics = metrics
+        self._server = ThreadingHTTPServer((host, port), _handler(metrics))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.1,),
+                                        name="metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+
+def _handler(metrics):
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug("Metrics request: " + format, *args)
+
+    return MetricsHandler
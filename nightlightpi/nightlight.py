@@ -1,21 +1,41 @@
 #!/usr/bin/python3
-import Adafruit_DHT
-import apa102
-import Adafruit_SSD1306
-import paho.mqtt.client as mqtt
-import time
-import RPi.GPIO as GPIO
+import copy
+import json
 import threading
 import logging
+import time
 
-from PIL import Image
-from PIL import ImageDraw
-from PIL import ImageFont
-
+from nightlightpi import backends
+from nightlightpi import logs
+from nightlightpi.assets import config_assets
+from nightlightpi.assets import load_assets
+from nightlightpi.buttons import ButtonInput
+from nightlightpi.commands import CommandQueue
+from nightlightpi.config import config_path
 from nightlightpi.config import load_config
-
-# Set logging level
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+from nightlightpi.config import preload_validator
+from nightlightpi.history import SensorHistory
+from nightlightpi.link import Backoff
+from nightlightpi.link import MQTTLink
+from nightlightpi.metrics import Metrics
+from nightlightpi.metrics import MetricsServer
+from nightlightpi.ledstrip import APA102Engine
+from nightlightpi.ledstrip import MAX_BRIGHTNESS
+from nightlightpi.ledstrip import lit_range
+from nightlightpi.ledstrip import wheel
+from nightlightpi.publisher import NullPublisher
+from nightlightpi.publisher import Publisher
+from nightlightpi.rainbow import RainbowAnimation
+from nightlightpi.reload import ConfigWatcher
+from nightlightpi.reload import diff_config
+from nightlightpi.reload import keep_restart_fields
+from nightlightpi.router import TopicRouter
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.sensor import SensorService
+from nightlightpi.sensorprocess import ProcessSensor
+from nightlightpi.spool import Spool
+from nightlightpi.spool import SpoolReplay
+from nightlightpi.state import StateStore
 
 
 class NightLight(threading.Thread):
@@ -68,32 +88,94 @@ class NightLight(threading.Thread):
    # light_mode_order = ['Temperature', 'Rainbow', 'Off']
 
    light_mode_order = ('Temperature', 'Rainbow', 'Off')
+   quick_rainbow_seconds = 1.0
    # config['Speed'] = 1 # 1 second delay
 
    # menu_button_pressed_time = 0
    # menu_displayed = 0
 
 
-   def __init__(self, config):
-       super().__init__()
+   # The fields of the current state snapshot. Each assignment publishes a
+   # new snapshot.
+   temperature = property(lambda self: self.state.current.temperature,
+                          lambda self, value: self.state.update(temperature=value))
+   humidity = property(lambda self: self.state.current.humidity,
+                       lambda self, value: self.state.update(humidity=value))
+   lightMode = property(lambda self: self.state.current.light_mode,
+                        lambda self, value: self.state.update(light_mode=value))
+   displayMode = property(lambda self: self.state.current.display_mode,
+                          lambda self, value: self.state.update(display_mode=value))
+
+
+   # A fleet passes in the scheduler, MQTT client, link and metrics it shares
+   # between its lights, which then belong to the fleet rather than this light.
+   def __init__(self, config, scheduler=None, mqttc=None, link=None, metrics=None):
+       super().__init__(name=config.name)
        self.config = config
-       self.temperature = None
-       self.humidity = None
+       # The config as last read from disk, which reloads are compared
+       # against since self.config changes at runtime.
+       self.loaded_config = copy.deepcopy(config)
+       self.watcher = None
+       self.reloads = 0
 
        self.mode = 'Run'
 
-       self.displayMode = 'Temperature'
-       self.lightMode = 0
-       self.rainbow_colour = 0
-
-       def on_mqtt_connect(client, userdata, rc):
-           logging.info("MQTT Connection returned result: "+mqtt.connack_string(rc))
+       # The reading, modes and brightness are published as immutable
+       # snapshots, so frames are computed from a consistent state without
+       # holding the device locks.
+       self.state = StateStore(light_mode=0, display_mode='Temperature',
+                               brightness=config.led_strip.brightness)
+
+       # All timed work runs from the scheduler, which sleeps until the next
+       # rainbow frame or sensor reading is due.
+       self.owns_scheduler = scheduler is None
+       self.scheduler = Scheduler() if scheduler is None else scheduler
+
+       # MQTT and button callbacks queue their work for the scheduler thread,
+       # which is the only thread driving the display and LED strip.
+       self.commands = CommandQueue(self.scheduler)
+
+       # Timings and counters from the hot paths, which cost next to nothing
+       # when metrics are disabled.
+       self.owns_metrics = metrics is None
+       self.metrics = Metrics(self.config.metrics.enable) if metrics is None else metrics
+       self.metrics_server = None
+       self.metrics_job = None
+       labels = {'light': config.name} if config.name else {}
+       m = self.metrics
+       self.sensor_read_time = m.timer('nightlight_sensor_read_seconds', 'Time taken by good sensor reads', **labels)
+       self.render_time = m.timer('nightlight_display_render_seconds', 'Time taken to render the temperature screen', **labels)
+       self.display_write_time = m.timer('nightlight_display_write_seconds', 'Time taken to send frames to the display', **labels)
+       self.strip_write_time = m.timer('nightlight_strip_write_seconds', 'Time taken to send colours to the LED strip', **labels)
+       self.mqtt_received = m.counter('nightlight_mqtt_messages_received_total', 'MQTT messages received', **labels)
+
+       # Sensor reads happen on the sensor service's own worker thread, or in
+       # a separate process when isolated, so the driver can't hold the GIL.
+       # Device drivers are only imported once their backend is created.
+       hardware = self.config.hardware
+       sensorConfig = self.config.temperature
+       historyConfig = self.config.history
+       self.history = SensorHistory(historyConfig.capacity, historyConfig.path)
+       self.history_job = self.scheduler.call_repeating(historyConfig.flush_seconds, self.history.flush,
+                                                        delay=historyConfig.flush_seconds)
+       sensor = backends.create('sensor', hardware.sensor, self.config)
+       self.sensor_process = None
+       if sensorConfig.isolate:
+           self.sensor_process = sensor = ProcessSensor(sensor, sensorConfig.cpus,
+                                                        sensorConfig.realtime_priority)
+       self.sensor = SensorService(sensor,
+                                   self.scheduler, sensorConfig.update_seconds,
+                                   on_reading=self.getData, on_stale=self.sensorStale)
+
+       def on_mqtt_connect(client, userdata, flags, rc):
+           logging.info("MQTT Connection returned result: %s", rc)
 
            # Subscribing in on_connect() means that if we lose the connection and
          # reconnect then subscriptions will be renewed.
-           self.mqttc.subscribe(self.config.mqtt.display_topic + '/set')
-           self.mqttc.subscribe(self.config.mqtt.light_topic + '/set')
-           self.mqttc.subscribe(self.config.mqtt.brightness_topic + '/set')
+           for topic in self.router.topics():
+               self.mqttc.subscribe(topic)
+           if rc == 0:
+               self.mqttConnected()
 
 
        def on_mqtt_disconnect(client, userdata, rc):
@@ -102,172 +184,248 @@ class NightLight(threading.Thread):
 
        # Setup MQTT
        mqttConfig = self.config.mqtt
-       if self.config.mqtt.enable:
-           self.mqttc = mqtt.Client(client_id=mqttConfig.user)
-           self.mqttc.tls_set("/etc/ssl/certs/DST_Root_CA_X3.pem")
-           self.mqttc.username_pw_set(mqttConfig.user, password=mqttConfig.password)
-
-           self.mqttc.on_connect = on_mqtt_connect
-           self.mqttc.on_disconnect = on_mqtt_disconnect
+       self.light_mode_index = {mode: index for index, mode in enumerate(self.light_mode_order)}
+       self.router = TopicRouter.from_config(mqttConfig, self.mqttHandlers())
+       self.owns_mqttc = mqttc is None
+       self.mqttc = mqttc
+       self.link = link
+       # Updates are queued and sent in batches from the scheduler thread
+       self.publisher = NullPublisher()
+       self.spool = None
+       self.replay = None
+       if mqttConfig.enable and self.owns_mqttc:
+           self.mqttc = backends.create('mqtt', hardware.mqtt, self.config)
+       if self.mqttc is not None:
+           self.publisher = Publisher(self.mqttc, self.scheduler, mqttConfig.publish_window_seconds)
+           # Readings taken while the broker is unreachable are replayed in
+           # batches on the backlog topic once it is back.
+           spoolConfig = self.config.spool
+           self.spool = Spool(spoolConfig.path, spoolConfig.max_records)
+           self.replay = SpoolReplay(self.spool, self.mqttc, self.scheduler, mqttConfig.backlog_topic,
+                                     spoolConfig.replay_batch, spoolConfig.replay_rate)
+       if self.mqttc is not None and self.owns_mqttc:
            self.mqttc.on_message = self.on_mqtt_message
-
-           self.mqttc.connect(mqttConfig.server, port=mqttConfig.port)
-           self.mqttc.loop_start()
+           # The link reconnects with a jittered backoff when the broker drops
+           self.link = MQTTLink(self.mqttc, mqttConfig.server, mqttConfig.port,
+                                Backoff(mqttConfig.reconnect_min_seconds, mqttConfig.reconnect_max_seconds),
+                                on_connect=on_mqtt_connect, on_disconnect=on_mqtt_disconnect)
+           self.link.start()
 
 
 
 
        # Setup LED Strip
        ledConfig = self.config.led_strip
-       self.LEDStrip = apa102.APA102(numLEDs=ledConfig.length, globalBrightness=ledConfig.max_brightness, order='rgb')
-       self.LEDStrip_lock = threading.Lock()
+       self.LEDStrip = APA102Engine(ledConfig.length, backends.create('strip', hardware.strip, self.config), global_brightness=ledConfig.max_brightness, order='rgb')
+       self.LEDStrip_lock = self.metrics.lock('nightlight_strip_lock_wait_seconds', 'Time spent waiting for the LED strip', **labels)
+       start, stop = lit_range(ledConfig.length, ledConfig.light)
+       self.rainbow = RainbowAnimation(self.LEDStrip, start, stop, fps=self.config.timing.rainbow_fps,
+                                       spread=ledConfig.rainbow_spread, brightness=ledConfig.brightness,
+                                       lock=self.LEDStrip_lock,
+                                       precompute=not self.config.memory.low_memory)
 
        self.setLightMode(self.lightMode)
 
        # OLED Display Settings - 128x64 display with hardware I2C:
-       self.display = Adafruit_SSD1306.SSD1306_128_64(rst=0)
-       self.display.begin()
-       self.display.clear()
-       self.display.display()
-       self.display_lock = threading.Lock()
+       # Only the pages that changed since the last frame are sent over I2C.
+       # The display modules need PIL, so they are only imported when there is
+       # a display. Menus are shown straight from the precompiled assets.
+       self.display = None
+       self.assets = None
+       self.display_lock = self.metrics.lock('nightlight_display_lock_wait_seconds', 'Time spent waiting for the display', **labels)
+       display_device = backends.create('display', hardware.display, self.config)
+       if display_device is not None:
+           from nightlightpi.display import DiffingDisplay
+           from nightlightpi.display import open_image
+           from nightlightpi.renderer import TemperatureRenderer
+           self.display = DiffingDisplay(display_device)
+           self.display.clear()
+           self.open_image = open_image
+           self.assets = load_assets(config_assets(self.config), self.display.width, self.display.height,
+                                     name=self.config.name)
+           self.temperature_renderer = TemperatureRenderer(self.config.temp_mode.background,
+                                                           self.display.width, self.display.height,
+                                                           keep_fonts=not self.config.memory.low_memory)
 
        #self.setDisplayMode(self.displayMode)
 
        # Setup buttons
-       GPIO.setmode(GPIO.BCM)
-       menu_button_pin = self.config.inputs.button_light
-       GPIO.setup(menu_button_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-       GPIO.add_event_detect(menu_button_pin, GPIO.FALLING, callback=self.lightButtonPressed, bouncetime=500)
-       timer_button_pin = self.config.inputs.button_display
-       GPIO.setup(timer_button_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-       GPIO.add_event_detect(timer_button_pin, GPIO.FALLING, callback=self.displayButtonPressed, bouncetime=500)
-
+       # Edges are debounced and turned into gestures on the scheduler thread.
+       # Each press is one gesture, so holding the light button turns it off
+       # without first moving on to the next mode. A press of a button which
+       # can also be held or double pressed is only acted on once it is
+       # known not to be.
+       self.button_actions = {('light', 'press'): self.lightButtonPressed,
+                              ('light', 'long'): self.lightButtonHeld,
+                              ('display', 'press'): self.displayButtonPressed,
+                              ('display', 'double'): self.refreshStrip}
+       self.buttons = None
+       self.GPIO = GPIO = backends.create('inputs', hardware.inputs, self.config)
+       if GPIO is not None:
+           GPIO.setmode(GPIO.BCM)
+           self.setupButtons()
+
+       self.collectMetrics(labels)
+       if self.owns_metrics and self.metrics.enabled:
+           self.metrics_server, self.metrics_job = serveMetrics(self.metrics, self.config.metrics,
+                                                                self.scheduler, self.publishMetrics)
+
+
+   # A press is handed to the scheduler thread through the command queue, so
+   # it waits for no more than the job in progress.
+   def setupButtons(self):
+       inputsConfig = self.config.inputs
+       self.buttons = ButtonInput(self.GPIO, self.scheduler, self.onButton,
+                                  debounce=self.config.timing.menu_button_pressed_time_in_seconds or 0.05,
+                                  long_press=inputsConfig.long_press_seconds,
+                                  double_press=inputsConfig.double_press_seconds,
+                                  submit=lambda process: self.commands.submit('buttons', process))
+       for name, pin in (('light', inputsConfig.button_light), ('display', inputsConfig.button_display)):
+           gestures = [gesture for button, gesture in self.button_actions if button == name]
+           self.buttons.add(name, pin, gestures)
+
+
+   # Values which are already counted elsewhere are read when the metrics are
+   # read.
+   def collectMetrics(self, labels):
+       m = self.metrics
+       sensor = self.sensor
+       m.collect('nightlight_sensor_reads_total', 'Sensor read attempts', lambda: sensor.reads, 'counter', **labels)
+       m.collect('nightlight_sensor_failures_total', 'Sensor reads retried after failing', lambda: sensor.failures, 'counter', **labels)
+       m.collect('nightlight_sensor_timeouts_total', 'Sensor reads which timed out', lambda: sensor.timeouts, 'counter', **labels)
+       m.collect('nightlight_commands_pending', 'Commands waiting for the scheduler thread', lambda: self.commands.depth, **labels)
+       m.collect('nightlight_command_latency_max_seconds', 'Longest wait of a command for the scheduler thread', lambda: self.commands.latency_max, **labels)
+       publisher = self.publisher
+       m.collect('nightlight_mqtt_messages_sent_total', 'MQTT messages published', lambda: publisher.stats()['sent'], 'counter', **labels)
+       m.collect('nightlight_mqtt_messages_coalesced_total', 'MQTT messages replaced by a newer one before being sent', lambda: publisher.stats()['coalesced'], 'counter', **labels)
+       m.collect('nightlight_mqtt_publish_failures_total', 'MQTT messages which could not be published', lambda: publisher.stats()['failed'], 'counter', **labels)
+       if self.link is not None:
+           m.collect('nightlight_mqtt_connected', 'Whether the MQTT broker is connected', lambda: self.link.connected, **labels)
+       if self.spool is not None:
+           m.collect('nightlight_spool_pending', 'Readings waiting to be replayed', lambda: len(self.spool), **labels)
+
+   def publishMetrics(self):
+       self.publisher.publish(self.config.metrics.topic, json.dumps(self.metrics.snapshot()), retain=False)
+
+   def mqttHandlers(self):
+       handlers = {'display': self.onDisplaySet,
+                   'light': self.onLightSet,
+                   'brightness': self.onBrightnessSet}
+       if self.config.mqtt.history_topic:
+           handlers['history'] = self.onHistoryGet
+       if self.config.mqtt.logs_topic:
+           handlers['logs'] = self.onLogsGet
+       return handlers
 
 
    def publishData(self, temperature, humidity):
+       if self.link is not None and not self.link.connected:
+           self.spool.append(time.time(), temperature, humidity)
+           return
        mqttConfig = self.config.mqtt
-       if mqttConfig.enable:
-           self.mqttc.publish(mqttConfig.temperature_topic, payload="{:0.1f}".format(temperature), retain=True)
-           self.mqttc.publish(mqttConfig.humidity_topic, payload="{:0.1f}".format(humidity), retain=True)
+       self.publisher.publish_many({mqttConfig.temperature_topic: "{:0.1f}".format(temperature),
+                                    mqttConfig.humidity_topic: "{:0.1f}".format(humidity)})
 
 
    # Set the entire strip to the same colour
-   def setStripRGB(self, rgb):
+   # Unchanged frames are not resent unless force is set, which is useful to
+   # recover from glitches on the strip. The frame is composed before taking
+   # the lock, which is only held to swap it in and send it.
+   def setStripRGB(self, rgb, force=False):
        ledConfig = self.config.led_strip
        strip = self.LEDStrip
+       start, stop = lit_range(ledConfig.length, ledConfig.light)
+       leds = strip.compose(rgb, start, stop, self.state.current.brightness)
        self.LEDStrip_lock.acquire()
-       brightness = ledConfig.brightness
-       if ledConfig.light > 0: # Light LEDs from the start of the strip
-           for pixel in range(ledConfig.light):
-               strip.setPixelRGB(pixel, rgb, brightness)
-       elif ledConfig['light'] < 0: # Light LEDs from the end of the strip
-           for pixel in list(range(ledConfig.length))[ledConfig.light:ledConfig.length]:
-               strip.setPixelRGB(pixel, rgb, brightness)
-       strip.show()
+       with self.strip_write_time.time():
+           strip.swap(leds, start, force)
        self.LEDStrip_lock.release()
 
 
    # Set the entire strip to the same colour
-   def setStrip(self, rgb_tuple):
-       colour = self.LEDStrip.combineColor(rgb_tuple[0], rgb_tuple[1], rgb_tuple[2])
-       self.stripColour = colour
-       self.setStripRGB(colour)
+   def setStrip(self, rgb_tuple, force=False):
+       self.stripColour = rgb_tuple
+       self.setStripRGB(rgb_tuple, force)
 
 
    def displayImage(self, image):
+       if self.display is None:
+           return
        self.display_lock.acquire()
-       self.display.image(image)
-       self.display.display()
+       with self.display_write_time.time():
+           self.display.image(image)
        self.display_lock.release()
 
 
    def displayTemperature(self):
-       if self.displayMode == 'Off':
+       state = self.state.current
+       if self.display is None or state.display_mode == 'Off':
            return
 
-       if self.temperature is None:
+       if not self.hasSensorData(state):
            self.displayTemperatureMenu()
            return
 
-       temperature = self.temperature
-       humidity = self.humidity
-
-
-
        # Set the OLED display to show temperature
-       display = self.display
-       padding = 2
-       padding_x = 38
-       width = display.width
-       height = display.height
-
-       image = Image.open(self.config.temp_mode.background).convert('1')
-       draw = ImageDraw.Draw(image)
-
-       # TODO: font names should also be in the config (wkmanire 2017-10-10)
-       font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 30)
-       font_small = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 14)
-       temperature_string = "{0:0.1f}Â°".format(temperature)  # â„ƒ
-
-       temperature_size = draw.textsize(temperature_string, font=font)
-       x = ((width - padding_x) - temperature_size[0])/2 + padding_x
-       draw.text((x, padding), temperature_string, font=font, fill=255)
-
-       humidity_string = "{0:0.1f}%".format(humidity)
-       humidity_size = draw.textsize(humidity_string, font=font_small)
-       x = ((width - padding_x) - humidity_size[0])/2 + padding_x
-       y = (height - padding) - humidity_size[1]
-       draw.text((x,y), humidity_string, font=font_small, fill=255)
-
+       with self.render_time.time():
+           image = self.temperature_renderer.render(state.temperature, state.humidity)
        self.displayImage(image)
 
    def displayOff(self):
        display = self.display
+       if display is None:
+           return
 
        self.display_lock.acquire()
        display.clear()
-       display.display()
        self.display_lock.release()
 
 
    def displayTemperatureMenu(self):
-       image = Image.open(self.config.temp_mode.menu).convert('1')
-       self.displayImage(image)
+       self.displayAsset(self.config.temp_mode.menu)
+
+
+   # Show an image from the config, sending its precompiled frame when there
+   # is one and decoding the file otherwise.
+   def displayAsset(self, path):
+       if self.display is None:
+           return
+       frame = self.assets.frame(path) if self.assets is not None else None
+       if frame is None:
+           self.displayImage(self.open_image(path))
+           return
+       self.display_lock.acquire()
+       with self.display_write_time.time():
+           self.display.show_buffer(frame)
+       self.display_lock.release()
 
 
    def lightTemperature(self):
-       if self.temperature is None:
-           self.setStripRGB(self.LEDStrip.wheel(140))
+       state = self.state.current
+       if not self.hasSensorData(state):
+           self.setStripRGB(wheel(140))
            return
 
-       temperature = self.temperature
        # Set the LED strip to the correct colour
-       temperature_ranges = self.config.temperature.sensor_ranges
-       temperature_colours = self.config.temperature.sensor_colours
-       if temperature <= temperature_ranges[0]:
-           self.setStrip(temperature_colours[0])
-       elif temperature >= temperature_ranges[-1]:
-           self.setStrip(temperature_colours[-1])
-       else:
-           for range_boundary in range(len(temperature_ranges) - 1 ):
-               if (temperature > temperature_ranges[range_boundary]) and (temperature <= temperature_ranges[range_boundary+1]):
-                   self.setStrip(temperature_colours[range_boundary+1])
+       self.setStrip(self.config.temperature.colour_map.colour(state.temperature))
 
+   # Sweep through the whole colour wheel before settling into the rainbow
    def lightQuickRainbow(self):
-       rainbow_colour = 0
-       while rainbow_colour < 255:
-           self.setStripRGB(self.LEDStrip.wheel(rainbow_colour))
-           rainbow_colour = rainbow_colour + 1
-           #time.sleep(0.01)
-
-       self.setStripRGB(self.LEDStrip.wheel(0))
+       self.rainbow.start(self.scheduler, sweep=self.quick_rainbow_seconds)
 
    def lightOff(self):
        self.LEDStrip_lock.acquire()
-       self.LEDStrip.clearStrip()
+       self.LEDStrip.clear()
        self.LEDStrip.show()
        self.LEDStrip_lock.release()
 
+   # Resend the current frame even though it has not changed, for recovering
+   # from glitches on the strip.
+   def refreshStrip(self):
+       self.LEDStrip_lock.acquire()
+       self.LEDStrip.show(force=True)
+       self.LEDStrip_lock.release()
+
 
    def turnOff(self):
        self.displayOff()
@@ -275,11 +433,35 @@ class NightLight(threading.Thread):
 
    def stop(self):
        self.mode = 'Stop'
+       if self.watcher is not None:
+           self.watcher.stop()
+       self.sensor.stop()
+       if self.sensor_process is not None:
+           self.sensor_process.close()
+       if self.owns_scheduler:
+           self.scheduler.stop()
        self.turnOff()
-       self.LEDStrip.cleanup()
-       self.mqttc.loop_stop()
-       self.mqttc.disconnect()
-       GPIO.cleanup()
+       self.history_job.cancel()
+       self.history.close()
+       if self.metrics_job is not None:
+           self.metrics_job.cancel()
+       if self.metrics_server is not None:
+           self.metrics_server.stop()
+           self.metrics_server = None
+       self.publisher.flush()
+       self.LEDStrip.close()
+       if self.assets is not None:
+           self.assets.close()
+           self.assets = None
+       if self.replay is not None:
+           self.replay.stop()
+           self.spool.close()
+       if self.link is not None and self.owns_mqttc:
+           self.link.stop()
+       if self.GPIO is not None:
+           self.buttons.close()
+           inputsConfig = self.config.inputs
+           self.GPIO.cleanup([inputsConfig.button_light, inputsConfig.button_display])
 
    def __del__(self):
        self.stop()
@@ -288,18 +470,80 @@ class NightLight(threading.Thread):
        topic = message.topic #.decode('utf-8')
        payload = message.payload.decode('utf-8')
 
-       logging.info("Received MQTT message with topic {} : {}".format(topic, payload))
+       logging.info("Received MQTT message with topic %s : %s", topic, payload)
+       self.mqtt_received.inc()
+
+       if not self.router.dispatch(topic, payload):
+           logging.warning("No handler for MQTT topic %s", topic)
 
-       if topic == self.config.mqtt.display_topic + '/set':
-           self.setDisplayMode(payload)
+   # Called on the MQTT network thread, the changes are applied on the
+   # scheduler thread with superseded ones dropped.
+   def onDisplaySet(self, topic, payload):
+       self.commands.submit('display', self.setDisplayMode, payload)
 
-       elif topic == self.config.mqtt.light_topic + '/set':
-           for index, mode in enumerate(self.light_mode_order):
-               if payload == mode:
-                   self.setLightMode(index)
+   def onLightSet(self, topic, payload):
+       index = self.light_mode_index.get(payload)
+       if index is None:
+           logging.warning("Unknown light mode '%s'", payload)
+           return
+       self.commands.submit('light', self.setLightMode, index)
+
+   def onBrightnessSet(self, topic, payload):
+       self.commands.submit('brightness', self.setBrightness, payload)
+
+   # Called on the MQTT network thread each time the connection is made.
+   def mqttConnected(self):
+       self.commands.submit('replay', self.replayBacklog)
+
+   # The broker may have lost the retained values while we were away, so
+   # send the latest reading again along with what was spooled.
+   def replayBacklog(self):
+       self.publisher.forget()
+       state = self.state.current
+       if state.temperature is not None:
+           self.publishData(state.temperature, state.humidity)
+       self.replay.start()
+
+   # History requests are answered on the scheduler thread, which is the
+   # one adding readings to it.
+   def onHistoryGet(self, topic, payload):
+       self.commands.submit(None, self.publishHistory, payload)
+
+   def publishHistory(self, request):
+       try:
+           request = json.loads(request) if request else {}
+           since = time.time() - float(request.get('since', 86400))
+           bucket = float(request.get('bucket', 3600))
+       except (ValueError, AttributeError):
+           logging.warning("Could not understand history request '%s'", request)
+           return
+       rollup = self.history.rollup(bucket, since)
+       for entry in rollup:
+           for key in ('temperature', 'humidity'):
+               entry[key] = {stat: round(value, 2) for stat, value in entry[key].items()}
+       self.publisher.publish(self.config.mqtt.history_topic, json.dumps(rollup), retain=False)
+
+   # The recent log messages kept by the logging pipeline, for debugging a
+   # light without a shell on it.
+   def onLogsGet(self, topic, payload):
+       self.commands.submit(None, self.publishLogs, payload)
+
+   def publishLogs(self, request):
+       try:
+           request = json.loads(request) if request else {}
+           count = int(request.get('count', 50))
+           level = logging.getLevelName(str(request.get('level', 'DEBUG')).upper())
+           if not isinstance(level, int):
+               raise ValueError(level)
+       except (ValueError, TypeError, AttributeError):
+           logging.warning("Could not understand logs request '%s'", request)
+           return
+       self.publisher.publish(self.config.mqtt.logs_topic, json.dumps(logs.recent(count, level)), retain=False)
 
-       elif topic == self.config.mqtt.brightness_topic + '/set':
-           self.setBrightness(payload)
+   def onButton(self, button, gesture):
+       action = self.button_actions.get((button, gesture))
+       if action is not None:
+           action()
 
 
    def setBrightness(self, brightness):
@@ -307,21 +551,20 @@ class NightLight(threading.Thread):
        try:
            new_brightness = int(brightness)
            self.config.led_strip.brightness = new_brightness
+           self.state.update(brightness=new_brightness)
+           self.rainbow.set_brightness(new_brightness)
 
            # Update immediately if in temp mode otherwise could take up to a minute
            # TODO: The display mode order should be based on their definition in the config (wkmanire 2017-10-10)
            if self.light_mode_order[self.lightMode] == 'Temperature':
                self.lightTemperature()
 
-           mqttConfig = self.config.mqtt
-           if mqttConfig.enable:
-               self.mqttc.publish(mqttConfig.brightness_topic, new_brightness, retain=True)
+           self.publisher.publish(self.config.mqtt.brightness_topic, new_brightness)
 
-           status = 'Brightness: {0}'.format(new_brightness)
-           logging.info(status)
+           logging.info('Brightness: %s', new_brightness)
 
        except:
-           logging.warning("Could not set brightness to '{}', leaving at {}".format(brightness, current_brightness))
+           logging.warning("Could not set brightness to '%s', leaving at %s", brightness, current_brightness)
 
 
    # Toggles Display on and off
@@ -334,19 +577,15 @@ class NightLight(threading.Thread):
 
 
    def setDisplayMode(self, mode):
-       self.displayMode = mode
-       if self.displayMode == 'Temperature':
+       self.state.update(display_mode=mode)
+       if mode == 'Temperature':
            self.displayTemperature()
-       elif self.displayMode == 'Off':
+       elif mode == 'Off':
            self.displayOff()
 
-       mqttConfig = self.config.mqtt
-       # TODO: We're doing this check in at least 3 different places. This needs to be refactored. (wkmanire 2017-10-10)
-       if mqttConfig.enable:
-           self.mqttc.publish(mqttConfig.display_topic, self.displayMode, retain=True)
+       self.publisher.publish(self.config.mqtt.display_topic, mode)
 
-       status = 'Display Mode: {0}'.format(self.displayMode)
-       logging.info(status)
+       logging.info('Display Mode: %s', mode)
 
 
    def lightButtonPressed(self, *args):
@@ -354,17 +593,27 @@ class NightLight(threading.Thread):
        new_mode = (self.lightMode + 1) % len(self.light_mode_order)
        #self.lightMode = new_mode % len(self.light_mode_order)
 
+       self.setLightMode(new_mode)
+
        mode_text = self.light_mode_order[new_mode]
        if mode_text == 'Rainbow':
            self.lightQuickRainbow()
 
-       self.setLightMode(new_mode)
+   # Holding the light button turns the light off whatever mode it is in
+   def lightButtonHeld(self):
+       logging.info("Light button held")
+       self.setLightMode(self.light_mode_index['Off'])
 
 
 
    def setLightMode(self, mode):
        mode_text = self.light_mode_order[mode]
-       self.lightMode = mode
+       self.state.update(light_mode=mode)
+
+       if mode_text == 'Rainbow':
+           self.startRainbow()
+       else:
+           self.stopRainbow()
 
        if mode_text == 'Off':
            self.lightOff()
@@ -372,70 +621,205 @@ class NightLight(threading.Thread):
        elif mode_text == 'Temperature':
            self.lightTemperature()
 
-       mqttConfig = self.config.mqtt
-       if mqttConfig.enable:
-           self.mqttc.publish(mqttConfig.light_topic, mode_text, retain=True)
+       self.publisher.publish(self.config.mqtt.light_topic, mode_text)
 
-       status = 'Light Mode: {0}'.format(self.light_mode_order[self.lightMode])
-       logging.info(status)
+       logging.info('Light Mode: %s', mode_text)
 
 
 
-   def getData(self):
-       # Try to grab a sensor reading and publish it.  Use the read_retry method which will retry up
-       # to 15 times to get a sensor reading (waiting 2 seconds between each retry).
-       sensorConfig = self.config.temperature
-       humidity, temperature = Adafruit_DHT.read_retry(getattr(Adafruit_DHT, sensorConfig.sensor_type), sensorConfig.pin)
+   def getData(self, reading):
+       # Called by the sensor service with each good reading
+       self.state.update(temperature=reading.temperature, humidity=reading.humidity)
+       self.history.append(time.time(), reading.temperature, reading.humidity)
+       self.sensor_read_time.observe(self.sensor.last_elapsed)
 
-       if humidity is not None and temperature is not None:
-           self.humidity = humidity
-           self.temperature = temperature
+       logging.info('Temp=%0.1f°C  Humidity=%0.1f%%', reading.temperature, reading.humidity)
 
-           status = 'Temp={0:0.1f}Â°C  Humidity={1:0.1f}%'.format(temperature, humidity)
-           logging.info(status)
+       self.publishData(reading.temperature, reading.humidity)
+       self.showSensorData()
 
-           self.publishData(temperature, humidity)
 
-       if self.displayMode == 'Temperature':
+   # The last reading is too old to trust, fall back to the no data display
+   def sensorStale(self):
+       self.showSensorData()
+
+
+   def showSensorData(self):
+       state = self.state.current
+       if state.display_mode == 'Temperature':
            self.displayTemperature()
 
-       if self.light_mode_order[self.lightMode] == 'Temperature':
+       if self.light_mode_order[state.light_mode] == 'Temperature':
            self.lightTemperature()
 
 
-   def run(self):
-       last_update = 0
-       last_rainbow = 0
+   def hasSensorData(self, state=None):
+       state = self.state.current if state is None else state
+       return state.temperature is not None and not self.sensor.is_stale()
 
-       # Set display and light immediately on start up...
-       self.displayTemperatureMenu()
-       #self.setStripRGB(self.LEDStrip.wheel(170))
 
+   def startRainbow(self):
+       if not self.rainbow.running:
+           self.rainbow.start(self.scheduler)
+
+   def stopRainbow(self):
+       self.rainbow.stop()
+
+
+   # Reload the config whenever the file at path, by default the one it was
+   # loaded from, changes.
+   def watchConfig(self, path=None, **kwargs):
+       self.watcher = ConfigWatcher(path or config_path(), self.reloadConfig,
+                                    prepare=preload_validator, **kwargs)
+       self.watcher.start()
+
+   # Called on the watcher thread, which does the slow parsing and
+   # validation. An invalid file leaves the running config alone.
+   def reloadConfig(self):
+       try:
+           new = load_config(self.watcher.path)
+       except Exception as e:
+           logging.error("Not reloading the config, it is invalid: %s", e)
+           return
+       self.commands.submit('reload', self.applyConfig, new)
+
+   # Runs on the scheduler thread between frames, so every change takes
+   # effect at once and the strip and display are redrawn no more than once.
+   def applyConfig(self, new):
+       old, self.loaded_config = self.loaded_config, new
+       changed = set(diff_config(old, new))
+       if not changed:
+           return
+       new = copy.deepcopy(new)
+       for field in keep_restart_fields(self.config, new):
+           logging.warning("The config change to %s needs a restart", field)
+       if 'fleet' in changed:
+           logging.warning("The config change to the fleet needs a restart")
+       # Brightness set over MQTT is kept unless the file changed it
+       if new.led_strip.brightness == old.led_strip.brightness:
+           new.led_strip.brightness = self.config.led_strip.brightness
+       previous, self.config = self.config, new
+       self.state.update(brightness=new.led_strip.brightness)
+
+       if 'temperature' in changed:
+           interval = new.temperature.update_seconds
+           self.sensor.interval = self.sensor.max_backoff = interval
+           self.sensor.stale_after = 3 * interval
+
+       if 'history' in changed:
+           self.history_job.cancel()
+           self.history_job = self.scheduler.call_repeating(new.history.flush_seconds, self.history.flush,
+                                                            delay=new.history.flush_seconds)
+
+       if changed & {'led_strip', 'timing'}:
+           ledConfig = new.led_strip
+           start, stop = lit_range(ledConfig.length, ledConfig.light)
+           with self.LEDStrip_lock:
+               self.LEDStrip.global_brightness = min(ledConfig.max_brightness, MAX_BRIGHTNESS)
+               if (start, stop) != (self.rainbow.start_led, self.rainbow.stop_led):
+                   # LEDs which are no longer lit go dark with the next frame
+                   self.LEDStrip.clear()
+           rainbow = self.rainbow
+           rainbow.start_led, rainbow.stop_led = start, stop
+           rainbow.spread = ledConfig.rainbow_spread
+           rainbow.set_brightness(ledConfig.brightness)
+           if rainbow.fps != new.timing.rainbow_fps:
+               rainbow.fps = new.timing.rainbow_fps
+               if rainbow.running:
+                   rainbow.start(self.scheduler)
+
+       if 'temp_mode' in changed and self.display is not None:
+           from nightlightpi.renderer import TemperatureRenderer
+           self.temperature_renderer = TemperatureRenderer(new.temp_mode.background,
+                                                           self.display.width, self.display.height,
+                                                           keep_fonts=not new.memory.low_memory)
+
+       if changed & {'off_mode', 'temp_mode', 'rainbow_mode'} and self.display is not None:
+           if self.assets is not None:
+               self.assets.close()
+           self.assets = load_assets(config_assets(new), self.display.width, self.display.height,
+                                     name=new.name)
+
+       if 'mqtt' in changed:
+           topics = set(self.router.topics())
+           self.router = TopicRouter.from_config(new.mqtt, self.mqttHandlers())
+           # A fleet subscribes for its lights
+           if self.owns_mqttc and self.link is not None and self.link.connected:
+               self.resubscribe(topics, set(self.router.topics()))
+           if self.replay is not None:
+               self.publisher.window = new.mqtt.publish_window_seconds
+               self.replay.topic = new.mqtt.backlog_topic
+
+       if 'spool' in changed and self.replay is not None:
+           self.replay.batch_size = new.spool.replay_batch
+           self.replay.interval = 1.0 / new.spool.replay_rate
+
+       if changed & {'inputs', 'timing'} and self.GPIO is not None:
+           self.buttons.close()
+           inputsConfig = previous.inputs
+           self.GPIO.cleanup([inputsConfig.button_light, inputsConfig.button_display])
+           self.setupButtons()
+
+       if changed & {'led_strip', 'timing', 'temperature', 'temp_mode'}:
+           self.showSensorData()
+       elif changed & {'off_mode', 'rainbow_mode'} and self.displayMode == 'Temperature':
+           self.displayTemperature()
+
+       self.reloads += 1
+       logging.info("Applied config changes to %s", ", ".join(sorted(changed)))
 
-       # Start a thread to get temperature
-       sensor = threading.Timer(0, self.getData)
-       sensor.start()
+   def resubscribe(self, old_topics, new_topics):
+       for topic in old_topics - new_topics:
+           self.mqttc.unsubscribe(topic)
+       for topic in new_topics - old_topics:
+           self.mqttc.subscribe(topic)
 
-       while self.mode != 'Stop':
-           now = time.time()
 
-           if not sensor.is_alive():
-               sensor = threading.Timer(self.config.temperature.update_seconds, self.getData)
-               sensor.start()
+   # Set display and light immediately on start up and start reading the
+   # sensor, the scheduler then runs everything else.
+   def begin(self):
+       self.displayTemperatureMenu()
+       #self.setStripRGB(wheel(170))
 
-           if self.light_mode_order[self.lightMode] == 'Rainbow':
-               if (now - last_rainbow) > self.config['Speed']:
-                   self.setStripRGB(self.LEDStrip.wheel(self.rainbow_colour))
-                   self.rainbow_colour = (self.rainbow_colour + 1) % 255
-                   last_rainbow = now
+       self.sensor.start()
 
-       sensor.cancel()
+   def run(self):
+       self.begin()
+       self.scheduler.run()
+
+
+
+# Start serving metrics over HTTP and publishing them every publish_seconds,
+# as metricsConfig asks. Returns the server and publishing job, either None.
+def serveMetrics(metrics, metricsConfig, scheduler, publish):
+   server = None
+   job = None
+   if metricsConfig.port is not None:
+       try:
+           server = MetricsServer(metrics, metricsConfig.host, metricsConfig.port)
+           server.start()
+           logging.info("Serving metrics on http://%s:%s/metrics", *server.address)
+       except OSError as e:
+           logging.warning("Could not serve metrics on %s:%s: %s", metricsConfig.host, metricsConfig.port, e)
+   if metricsConfig.topic:
+       job = scheduler.call_repeating(metricsConfig.publish_seconds, publish, delay=metricsConfig.publish_seconds)
+   return server, job
 
 
 
 if __name__ == '__main__':
    config = load_config()
-   t = NightLight(config)
+   # Log messages are written from a background thread
+   loggingConfig = config.logging
+   logs.start_logging(logging.getLevelName(loggingConfig.level), ring_size=loggingConfig.ring_size,
+                      rate=loggingConfig.rate_per_second, burst=loggingConfig.burst,
+                      queue_size=loggingConfig.queue_size)
+   if config.fleet:
+       from nightlightpi.fleet import Fleet
+       t = Fleet(config)
+   else:
+       t = NightLight(config)
+   t.watchConfig()
    t.daemon = True
    t.start()
 
@@ -0,0 +1,132 @@
+# -*- coding: utf-8; -*-
+"""Queue outgoing MQTT messages and send them in batches.
+
+Messages are held for a short window before being published from the
+scheduler thread. A message for a topic which is already queued
+replaces the queued one, so only the latest value is sent, and a
+retained message carrying the payload last sent on its topic is dropped
+since the broker already holds it.
+
+Example:
+    publisher = Publisher(client, scheduler, window=0.25)
+    publisher.publish_many({"nightlight/temperature": "21.5",
+                            "nightlight/humidity": "40.0"})
+    print(publisher.stats())
+
+"""
+
+__all__ = ["Publisher", "NullPublisher"]
+
+import threading
+
+
+MQTT_ERR_SUCCESS = 0
+
+
+def _encode(payload):
+    if isinstance(payload, bytes):
+        return payload
+    if payload is None:
+        return b""
+    return str(payload).encode("utf-8")
+
+
+class Publisher:
+    """Publish messages to a paho compatible client in coalesced batches.
+
+publish and publish_many may be called from any thread. The queue is
+flushed by a job on scheduler, window seconds after the first message
+queued since the last flush.
+
+    """
+
+    def __init__(self, client, scheduler, window=0.25):
+        self.client = client
+        self.scheduler = scheduler
+        self.window = window
+        self._pending = {}
+        self._retained = {}
+        self._flush_job = None
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.coalesced = 0
+        self.duplicates = 0
+        self.sent = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def publish(self, topic, payload, retain=True):
+        """Queue payload to be published on topic."""
+        with self._lock:
+            self._enqueue(topic, payload, retain)
+
+    def publish_many(self, messages, retain=True):
+        """Queue a dict of topics to payloads to go out in the same flush."""
+        with self._lock:
+            for topic, payload in messages.items():
+                self._enqueue(topic, payload, retain)
+
+    def flush(self):
+        """Publish everything queued now."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._flush_job is not None:
+                self._flush_job.cancel()
+                self._flush_job = None
+        if not pending:
+            return
+        self.flushes += 1
+        for topic, (payload, retain) in pending.items():
+            info = self.client.publish(topic, payload, retain=retain)
+            if getattr(info, "rc", MQTT_ERR_SUCCESS) != MQTT_ERR_SUCCESS:
+                self.failed += 1
+                continue
+            self.sent += 1
+            if retain:
+                self._retained[topic] = payload
+
+    def forget(self):
+        """Forget the retained payloads, e.g. after the broker restarted."""
+        with self._lock:
+            self._retained.clear()
+
+    def stats(self):
+        return {"enqueued": self.enqueued,
+                "coalesced": self.coalesced,
+                "duplicates": self.duplicates,
+                "sent": self.sent,
+                "failed": self.failed,
+                "flushes": self.flushes,
+                "pending": len(self._pending)}
+
+    def _enqueue(self, topic, payload, retain):
+        payload = _encode(payload)
+        self.enqueued += 1
+        if self._pending.pop(topic, None) is not None:
+            self.coalesced += 1
+        if retain and self._retained.get(topic) == payload:
+            self.duplicates += 1
+            return
+        self._pending[topic] = (payload, retain)
+        if self._flush_job is None:
+            self._flush_job = self.scheduler.call_later(self.window, self.flush)
+
+
+class NullPublisher:
+    """Stand in for Publisher when MQTT is disabled."""
+
+    def publish(self, topic, payload, retain=True):
+        pass
+
+    def publish_many(self, messages, retain=True):
+        pass
+
+    def flush(self):
+        pass
+
+    def forget(self):
+        pass
+
+    def stats(self):
+        return {"enqueued": 0, "coalesced": 0, "duplicates": 0, "sent": 0,
+                "failed": 0, "flushes": 0, "pending": 0}
@@ -0,0 +1,141 @@
+# -*- coding: utf-8; -*-
+"""Animate a rainbow on the LED strip from precomputed frames.
+
+All 256 frames of the animation are packed into APA102 LED frames when
+the animation is created, so showing a frame is a single copy into the
+strip buffer and one SPI transfer. Without precompute only the 256
+colours are packed and each frame is joined from them as it is shown,
+which keeps a few KiB rather than 1 KiB a frame for every 256 LEDs.
+
+The animation runs as a repeating scheduler job at a target frame rate,
+and can begin with a quick sweep through the whole colour wheel when the
+light button selects it.
+
+Example:
+    rainbow = RainbowAnimation(strip, fps=30, spread=True)
+    rainbow.start(scheduler, sweep=1.0)
+    ...
+    print(rainbow.stats())
+
+"""
+
+__all__ = ["RainbowAnimation", "WHEEL"]
+
+from nightlightpi.ledstrip import wheel
+
+
+WHEEL = tuple(wheel(position) for position in range(256))
+
+
+class RainbowAnimation:
+    """Cycle the LEDs start up to stop through the colour wheel.
+
+With spread set the rainbow is laid out along the strip and moves along
+it, otherwise every LED shows the same colour. Brightness is a percent
+of the strip's global brightness, call set_brightness to change it
+while running. If lock is given it is held while the strip is written.
+Set precompute to False to build each frame as it is shown.
+
+    """
+
+    def __init__(self, strip, start=0, stop=None, fps=1.0, spread=False,
+                 brightness=100, lock=None, sweep_fps=60, precompute=True):
+        self.strip = strip
+        self.start_led = start
+        self.stop_led = strip.length if stop is None else stop
+        self.fps = fps
+        self.spread = spread
+        self.precompute = precompute
+        self.sweep_fps = sweep_fps
+        self.lock = lock
+        self.position = 0
+        self.frames_shown = 0
+        self._job = None
+        self._scheduler = None
+        self._first_frame_at = None
+        self._last_frame_at = None
+        self._sweep_frames = 0
+        self._sweep_index = 0
+        self.set_brightness(brightness)
+
+    def set_brightness(self, brightness):
+        """Rebuild the frames for a new brightness."""
+        self.brightness = brightness
+        count = max(self.stop_led - self.start_led, 0)
+        self._pixels = [self.strip.pixel(colour, brightness) for colour in WHEEL]
+        self._count = count
+        self._offsets = None
+        if self.spread and count > 1:
+            self._offsets = [(256 * led) // count for led in range(count)]
+        self.frames = None
+        if self.precompute:
+            self.frames = [self._frame(position) for position in range(256)]
+
+    def _frame(self, position):
+        if self._offsets is None:
+            return self._pixels[position] * self._count
+        pixels = self._pixels
+        return b"".join([pixels[(position + offset) & 255] for offset in self._offsets])
+
+    def start(self, scheduler, sweep=0):
+        """Start animating, after a sweep lasting sweep seconds if given."""
+        self.stop()
+        self._scheduler = scheduler
+        self.frames_shown = 0
+        if sweep > 0:
+            self._sweep_frames = max(1, int(sweep * self.sweep_fps))
+            self._sweep_index = 0
+            self._job = scheduler.call_repeating(1.0 / self.sweep_fps, self._sweep_step)
+        else:
+            self._job = scheduler.call_repeating(1.0 / self.fps, self.step)
+
+    def stop(self):
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+    @property
+    def running(self):
+        return self._job is not None
+
+    def step(self, advance=1):
+        """Show the current frame and move on by advance positions."""
+        if self.frames is not None:
+            frame = self.frames[self.position]
+        else:
+            frame = self._frame(self.position)
+        if self.lock is not None:
+            with self.lock:
+                self._show(frame)
+        else:
+            self._show(frame)
+        self.position = (self.position + advance) & 255
+        if self._scheduler is not None:
+            self._last_frame_at = self._scheduler.clock.now()
+            if not self.frames_shown:
+                self._first_frame_at = self._last_frame_at
+        self.frames_shown += 1
+
+    def stats(self):
+        """Return the target and achieved frame rates."""
+        achieved = 0.0
+        if self.frames_shown > 1:
+            elapsed = self._last_frame_at - self._first_frame_at
+            if elapsed > 0:
+                achieved = (self.frames_shown - 1) / elapsed
+        return {"target_fps": self.fps, "achieved_fps": achieved, "frames": self.frames_shown}
+
+    def _show(self, frame):
+        self.strip.load(frame, self.start_led)
+        self.strip.show()
+
+    def _sweep_step(self):
+        if self._sweep_index >= self._sweep_frames:
+            # The sweep ends back at the start of the wheel, then the
+            # animation carries on at its normal rate.
+            self.position = 0
+            self.start(self._scheduler)
+            return
+        self.position = (256 * self._sweep_index) // self._sweep_frames
+        self._sweep_index += 1
+        self.step()
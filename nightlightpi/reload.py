@@ -0,0 +1,229 @@
+# -*- coding: utf-8; -*-
+"""Notice changes to the config file so they can be applied live.
+
+ConfigWatcher watches the directory holding the config file with Linux
+inotify, through ctypes so there is nothing extra to install, which
+catches editors that save by writing a new file and renaming it over
+the old one. Where inotify is unavailable the file is polled instead.
+Bursts of events are allowed to settle before on_change is called on
+the watcher's thread.
+
+diff_config compares two Config instances section by section, so only
+the parts of the running light that changed need to be touched. Some
+settings are only read when the light starts, keep_restart_fields puts
+their running values back into a new Config and names the ones that
+will need a restart.
+
+Example:
+    watcher = ConfigWatcher(config_path(), light.reloadConfig)
+    watcher.start()
+    ...
+    watcher.stop()
+
+"""
+
+__all__ = ["ConfigWatcher", "diff_config", "keep_restart_fields", "RESTART_FIELDS"]
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+
+from nightlightpi.config import Config
+from nightlightpi.config import HardwareConfig
+from nightlightpi.config import LoggingConfig
+from nightlightpi.config import MemoryConfig
+from nightlightpi.config import MetricsConfig
+
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+EVENT = struct.Struct("iIII")
+
+# Settings which are only read at startup, by section.
+RESTART_FIELDS = {
+    "led_strip": ("length", "spi_bus", "spi_device"),
+    "mqtt": ("enable", "server", "port", "user", "password",
+             "reconnect_min_seconds", "reconnect_max_seconds"),
+    "temperature": ("sensor_type", "pin", "isolate", "cpus", "realtime_priority"),
+    "hardware": HardwareConfig.__slots__,
+    "history": ("path", "capacity"),
+    "spool": ("path", "max_records"),
+    "metrics": MetricsConfig.__slots__,
+    "logging": LoggingConfig.__slots__,
+    "memory": MemoryConfig.__slots__,
+}
+
+SECTIONS = tuple(name for name in Config.__slots__ if name not in ("name", "fleet"))
+
+
+def _section_values(section):
+    return tuple(getattr(section, name) for name in section.__slots__ if name != "colour_map")
+
+
+def diff_config(old, new):
+    """Return the names of the sections that differ between two Configs."""
+    changed = [name for name in SECTIONS
+               if _section_values(getattr(old, name)) != _section_values(getattr(new, name))]
+    if [device.name for device in old.fleet] != [device.name for device in new.fleet]:
+        changed.append("fleet")
+    return changed
+
+
+def keep_restart_fields(running, new):
+    """Copy the settings only read at startup from running into new.
+
+Returns the ones which differed as section.field names.
+
+    """
+    kept = []
+    for section, fields in RESTART_FIELDS.items():
+        running_section = getattr(running, section)
+        new_section = getattr(new, section)
+        for field in fields:
+            value = getattr(running_section, field)
+            if getattr(new_section, field) != value:
+                kept.append("{0}.{1}".format(section, field))
+                setattr(new_section, field, value)
+    return kept
+
+
+class ConfigWatcher:
+    """Call on_change whenever the file at path is written or replaced.
+
+prepare, if given, is called on the watcher thread before watching
+starts, to get slow imports out of the way of the first reload.
+
+    """
+
+    def __init__(self, path, on_change, poll_interval=1.0, settle=0.02, use_inotify=True,
+                 prepare=None):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.use_inotify = use_inotify
+        self.prepare = prepare
+        self.mode = None
+        self.changes = 0
+        self._last = None
+        self._thread = None
+        # The pipe stop writes to, to wake the watcher thread
+        self._stop_pipe = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        fd = self._inotify() if self.use_inotify else None
+        self.mode = "poll" if fd is None else "inotify"
+        self._last = self._signature()
+        target = self._poll if fd is None else self._watch
+        self._stop_pipe = os.pipe()
+        self._thread = threading.Thread(target=self._run, args=(target, fd, self._stop_pipe),
+                                        name="ConfigWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        with self._lock:
+            if self._stop_pipe is not None:
+                os.write(self._stop_pipe[1], b"x")
+        if thread is not threading.current_thread():
+            thread.join(self.poll_interval + 1)
+
+    def stats(self):
+        return {"mode": self.mode, "changes": self.changes}
+
+    def _inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+            logging.warning("Could not watch %s, polling it instead: %s",
+                            self.path, os.strerror(ctypes.get_errno()))
+            os.close(fd)
+            return None
+        return fd
+
+    def _changed(self):
+        try:
+            self.on_change()
+        except Exception:
+            logging.exception("Reloading the config failed")
+        self.changes += 1
+
+    def _run(self, target, fd, stop_pipe):
+        # The thread closes the stop pipe on its way out, as stop may be
+        # called from on_change or give up waiting for it to finish.
+        try:
+            target(fd, stop_pipe[0])
+        finally:
+            with self._lock:
+                for end in stop_pipe:
+                    os.close(end)
+                if self._stop_pipe is stop_pipe:
+                    self._stop_pipe = None
+
+    def _watch(self, fd, stop_read):
+        if self.prepare is not None:
+            self.prepare()
+        name = os.path.basename(self.path).encode()
+        try:
+            while True:
+                ready = select.select([fd, stop_read], [], [])[0]
+                if stop_read in ready:
+                    return
+                if not self._read_events(fd, name):
+                    continue
+                # Editors save in several steps, wait for them to finish.
+                while select.select([fd, stop_read], [], [], self.settle)[0]:
+                    if stop_read in select.select([stop_read], [], [], 0)[0]:
+                        return
+                    self._read_events(fd, name)
+                self._changed()
+        finally:
+            os.close(fd)
+
+    def _read_events(self, fd, name):
+        """Return True if any of the pending events are for the config file."""
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            return False
+        matched = False
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            matched = matched or data[offset:offset + length].rstrip(b"\0") == name
+            offset += length
+        return matched
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _poll(self, fd, stop_read):
+        if self.prepare is not None:
+            self.prepare()
+        while not select.select([stop_read], [], [], self.poll_interval)[0]:
+            current = self._signature()
+            if current != self._last and current is not None:
+                self._last = current
+                self._changed()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8; -*-
+"""Render the temperature screen for the OLED display.
+
+The background image and fonts are loaded once, and every character the
+temperature screen can show is drawn once into a small glyph image. A
+frame is then composed by copying the cached background and pasting the
+cached glyphs onto it, with no disk access or font rasterising. The
+same frame image is reused for every render.
+
+Without keep_fonts the fonts are closed once the glyphs are drawn, which
+saves several hundred KiB on a Pi Zero, and only opened again for a
+character the screen was not expected to show.
+
+Example:
+    renderer = TemperatureRenderer("images/temperature.ppm")
+    display.image(renderer.render(21.5, 48.0))
+
+"""
+
+__all__ = ["TemperatureRenderer", "GlyphStrip"]
+
+from PIL import Image
+from PIL import ImageDraw
+from PIL import ImageFont
+
+
+# TODO: font names should also be in the config (wkmanire 2017-10-10)
+DEFAULT_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+DEGREE = "°"
+ALPHABET = "0123456789.-" + DEGREE + "%"
+
+
+class GlyphStrip:
+    """Hold pre-rasterised 1-bit glyphs for one font and size.
+
+Characters outside the alphabet are rasterised on first use and then
+cached like the rest. If reload is given the font is dropped once the
+alphabet is drawn, and reload is called to open it again when needed.
+
+    """
+
+    def __init__(self, font, alphabet=ALPHABET, reload=None):
+        self.font = font
+        self.reload = reload
+        ascent, descent = font.getmetrics()
+        self.height = ascent + descent
+        self.glyphs = {}
+        for char in alphabet:
+            self._add(char)
+        if reload is not None:
+            self.font = None
+
+    def measure(self, text):
+        """Return the width in pixels of text."""
+        glyphs = self.glyphs
+        width = 0
+        for char in text:
+            if char not in glyphs:
+                self._add(char)
+            width += glyphs[char][0]
+        return width
+
+    def paste(self, frame, text, x, y):
+        """Draw text onto frame with its top left corner at x, y."""
+        glyphs = self.glyphs
+        x = int(x)
+        y = int(y)
+        for char in text:
+            if char not in glyphs:
+                self._add(char)
+            advance, mask = glyphs[char]
+            if mask is not None:
+                frame.paste(255, (x, y, x + mask.width, y + mask.height), mask)
+            x += advance
+
+    def _add(self, char):
+        font = self.font
+        if font is None:
+            font = self.reload()
+        advance = int(round(font.getlength(char)))
+        right = font.getbbox(char)[2]
+        width = max(advance, right)
+        if width <= 0:
+            self.glyphs[char] = (advance, None)
+            return
+        mask = Image.new("1", (width, self.height))
+        ImageDraw.Draw(mask).text((0, 0), char, font=font, fill=255)
+        self.glyphs[char] = (advance, mask)
+
+
+class TemperatureRenderer:
+    """Compose temperature and humidity frames from cached assets."""
+
+    def __init__(self, background, width=128, height=64, font_path=DEFAULT_FONT,
+                 padding=2, padding_x=38, keep_fonts=True):
+        self.width = width
+        self.height = height
+        self.padding = padding
+        self.padding_x = padding_x
+        self.background = Image.open(background).convert("1")
+        self.large = self._glyphs(font_path, 30, keep_fonts)
+        self.small = self._glyphs(font_path, 14, keep_fonts)
+        self._frame = self.background.copy()
+
+    def render(self, temperature, humidity):
+        """Return a 1-bit image showing temperature and humidity.
+
+The image is redrawn by the next call, so show it before rendering again.
+
+        """
+        frame = self._frame
+        frame.paste(self.background)
+        temperature_string = "{0:0.1f}{1}".format(temperature, DEGREE)
+        self.large.paste(frame, temperature_string,
+                         self._centre(self.large, temperature_string),
+                         self.padding)
+        humidity_string = "{0:0.1f}%".format(humidity)
+        self.small.paste(frame, humidity_string,
+                         self._centre(self.small, humidity_string),
+                         (self.height - self.padding) - self.small.height)
+        return frame
+
+    @staticmethod
+    def _glyphs(font_path, size, keep_font):
+        reload = None
+        if not keep_font:
+            reload = lambda: ImageFont.truetype(font_path, size)
+        return GlyphStrip(ImageFont.truetype(font_path, size), reload=reload)
+
+    def _centre(self, strip, text):
+        span = self.width - self.padding_x
+        return (span - strip.measure(text)) / 2 + self.padding_x
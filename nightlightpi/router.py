@@ -0,0 +1,113 @@
+# -*- coding: utf-8; -*-
+"""Dispatch incoming MQTT messages to handlers by topic.
+
+Topics without wildcards are looked up in a dict. Filters using the MQTT
++ and # wildcards are matched the first time a topic is seen and the
+result is cached, so every later message on that topic is dispatched
+with a single dict lookup no matter how many filters are registered.
+
+Example:
+    router = TopicRouter.from_config(conf.mqtt, {"display": set_display,
+                                                 "light": set_light,
+                                                 "brightness": set_brightness})
+    for topic in router.topics():
+        client.subscribe(topic)
+    router.dispatch(message.topic, message.payload.decode("utf-8"))
+
+"""
+
+__all__ = ["TopicRouter", "topic_matches", "COMMANDS", "QUERIES"]
+
+
+# The commands accepted over MQTT, each is set by publishing to the
+# config.mqtt.<command>_topic with /set appended.
+COMMANDS = ("display", "light", "brightness")
+
+# Queries are requested on config.mqtt.<query>_topic with /get appended.
+QUERIES = ("history", "logs")
+
+
+def topic_matches(topic_filter, topic):
+    """Return True if topic matches an MQTT filter with + and # wildcards."""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class TopicRouter:
+    """Call handler(topic, payload) for each filter matching a topic.
+
+Handlers are called in the order their filters were added. At most
+max_routes topics are cached, the cache starts over when it is full.
+
+    """
+
+    def __init__(self, max_routes=1024):
+        self.max_routes = max_routes
+        self._filters = []
+        self._routes = {}
+        self.dispatched = 0
+        self.unmatched = 0
+
+    @classmethod
+    def from_config(cls, mqtt_config, handlers):
+        """Route the /set topics of config.mqtt to handlers by command.
+
+handlers maps names from COMMANDS and QUERIES to callables. When
+mqtt.group_topic is set, <group_topic>/<command>/set is routed to the
+same handler, so a single message can drive every light in the group.
+
+        """
+        router = cls()
+        group_topic = getattr(mqtt_config, "group_topic", None)
+        for command, handler in handlers.items():
+            action = "get" if command in QUERIES else "set"
+            router.add("{0}/{1}".format(getattr(mqtt_config, command + "_topic"), action), handler)
+            if group_topic:
+                router.add("{0}/{1}/{2}".format(group_topic, command, action), handler)
+        return router
+
+    def add(self, topic_filter, handler):
+        self._filters.append((topic_filter, handler))
+        self._routes.clear()
+
+    def topics(self):
+        """Return the filters to subscribe to, without duplicates."""
+        return list(dict.fromkeys(topic_filter for topic_filter, _ in self._filters))
+
+    def handlers(self, topic):
+        """Return the handlers for topic."""
+        try:
+            return self._routes[topic]
+        except KeyError:
+            pass
+        handlers = tuple(handler for topic_filter, handler in self._filters
+                         if topic_filter == topic or topic_matches(topic_filter, topic))
+        if len(self._routes) >= self.max_routes:
+            self._routes.clear()
+        self._routes[topic] = handlers
+        return handlers
+
+    def dispatch(self, topic, payload):
+        """Call the handlers for topic, returning False if there are none."""
+        handlers = self._routes.get(topic)
+        if handlers is None:
+            handlers = self.handlers(topic)
+        if not handlers:
+            self.unmatched += 1
+            return False
+        self.dispatched += 1
+        for handler in handlers:
+            handler(topic, payload)
+        return True
+
+    def stats(self):
+        return {"filters": len(self._filters), "routes": len(self._routes),
+                "dispatched": self.dispatched, "unmatched": self.unmatched}
@@ -0,0 +1,171 @@
+# -*- coding: utf-8; -*-
+"""Run timed and event driven jobs from a single thread.
+
+The Scheduler keeps pending jobs in a heap ordered by their deadline on
+a monotonic clock. The thread calling run sleeps until the earliest
+deadline is due, or until another thread submits new work, so an idle
+night light does not use any CPU time between rainbow frames and sensor
+readings.
+
+Example:
+    scheduler = Scheduler()
+    scheduler.call_repeating(1, step_rainbow)
+    scheduler.call_soon(update_display)
+    scheduler.run()
+
+"""
+
+__all__ = ["Scheduler", "MonotonicClock", "SimulatedClock"]
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class MonotonicClock:
+    """Tell the time with time.monotonic and really sleep while waiting."""
+
+    def now(self):
+        return time.monotonic()
+
+    def wait(self, condition, timeout):
+        condition.wait(timeout)
+
+
+class SimulatedClock:
+    """Jump forward in time instead of sleeping.
+
+This lets tests and benchmarks run hours of scheduler activity in a
+fraction of a second. Only use it with a scheduler that is driven from
+a single thread, nothing can wake a simulated wait early.
+
+    """
+
+    def __init__(self, start=0.0):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def wait(self, condition, timeout):
+        if timeout is not None:
+            self.advance(timeout)
+
+    def advance(self, seconds):
+        """Move the clock forward, e.g. to simulate a slow operation."""
+        self.current += max(seconds, 0)
+
+
+class Job:
+    """A pending call held by the Scheduler. Call cancel to drop it."""
+
+    __slots__ = ("deadline", "interval", "callback", "args", "cancelled")
+
+    def __init__(self, deadline, interval, callback, args):
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """Call jobs when they are due, sleeping in between.
+
+All scheduling methods are thread safe. Submitting a job which is due
+earlier than everything else already queued wakes the running loop
+immediately, which is how button presses and MQTT messages get handled
+without waiting for the next timer.
+
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock if clock is not None else MonotonicClock()
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._running = False
+        self.wakeups = 0
+        self.jobs_run = 0
+        self.missed_deadlines = 0
+
+    def call_soon(self, callback, *args):
+        """Run callback as soon as the loop is free."""
+        return self.call_at(self.clock.now(), callback, *args)
+
+    def call_later(self, delay, callback, *args):
+        """Run callback once, delay seconds from now."""
+        return self.call_at(self.clock.now() + delay, callback, *args)
+
+    def call_at(self, deadline, callback, *args):
+        """Run callback once at the clock time deadline."""
+        job = Job(deadline, None, callback, args)
+        self._push(job)
+        return job
+
+    def call_repeating(self, interval, callback, *args, delay=0):
+        """Run callback every interval seconds, starting after delay."""
+        job = Job(self.clock.now() + delay, interval, callback, args)
+        self._push(job)
+        return job
+
+    def stop(self):
+        """Make run return once the job in progress has finished."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def run(self, until=None):
+        """Run jobs until stop is called or the clock reaches until."""
+        with self._condition:
+            self._running = True
+        while True:
+            job = self._next_job(until)
+            if job is None:
+                return
+            if not job.cancelled:
+                self._run_job(job)
+
+    def _push(self, job):
+        with self._condition:
+            heapq.heappush(self._queue, (job.deadline, next(self._counter), job))
+            if self._queue[0][2] is job:
+                self._condition.notify()
+
+    def _next_job(self, until):
+        with self._condition:
+            while self._running:
+                now = self.clock.now()
+                if until is not None and now >= until:
+                    self._running = False
+                    break
+                if self._queue and self._queue[0][0] <= now:
+                    return heapq.heappop(self._queue)[2]
+                timeout = self._queue[0][0] - now if self._queue else None
+                if until is not None:
+                    remaining = until - now
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                self.clock.wait(self._condition, timeout)
+                self.wakeups += 1
+        return None
+
+    def _run_job(self, job):
+        try:
+            job.callback(*job.args)
+        except Exception:
+            logging.exception("Scheduled job %r failed", job.callback)
+        self.jobs_run += 1
+        if job.interval is None or job.cancelled:
+            return
+        # Skip frames rather than bunching them up if a job overran.
+        now = self.clock.now()
+        job.deadline += job.interval
+        if job.deadline < now:
+            self.missed_deadlines += 1
+            job.deadline = now + job.interval
+        self._push(job)
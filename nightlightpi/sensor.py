@@ -0,0 +1,200 @@
+# -*- coding: utf-8; -*-
+"""Acquire temperature and humidity readings without blocking the light.
+
+SensorService owns one long-lived worker thread which performs single
+read attempts on request. The scheduler decides when the next attempt
+is due: every update interval after a good reading, or after an
+exponentially growing delay while reads keep failing. The last good
+reading is cached, and once it is older than stale_after the on_stale
+callback tells the display and LEDs that the data can't be trusted.
+
+Sensors are any object with a read method returning a (humidity,
+temperature) tuple, either of which may be None when the read failed.
+
+Example:
+    service = SensorService(DHTSensor("AM2302", 22), scheduler, 60,
+                            on_reading=show_reading)
+    service.start()
+
+"""
+
+__all__ = ["DHTSensor", "Reading", "SensorService"]
+
+import logging
+import threading
+from collections import namedtuple
+
+
+Reading = namedtuple("Reading", ["temperature", "humidity", "timestamp"])
+
+
+class DHTSensor:
+    """Make single read attempts from a DHT11/DHT22/AM2302 sensor.
+
+It can be pickled, to be read from a ProcessSensor, and imports the
+driver again where it is unpickled.
+
+    """
+
+    def __init__(self, sensor_type, pin):
+        import Adafruit_DHT
+        self._dht = Adafruit_DHT
+        self._sensor = getattr(Adafruit_DHT, sensor_type)
+        self.sensor_type = sensor_type
+        self.pin = pin
+
+    def __reduce__(self):
+        return (DHTSensor, (self.sensor_type, self.pin))
+
+    def read(self):
+        return self._dht.read(self._sensor, self.pin)
+
+
+class SensorService:
+    """Schedule sensor reads and keep the last good reading.
+
+Callbacks are made on the scheduler thread. on_reading is called with
+each new Reading and on_stale once when the cached reading goes stale.
+A read taking longer than timeout is counted as a failure and its
+result, should it ever arrive, is discarded. With threaded set to False
+reads are made directly on the scheduler thread, which is only useful
+with simulated sensors.
+
+    """
+
+    def __init__(self, sensor, scheduler, interval, on_reading=None, on_stale=None,
+                 timeout=5.0, retry_delay=2.0, max_backoff=None, stale_after=None,
+                 threaded=True):
+        self.sensor = sensor
+        self.scheduler = scheduler
+        self.interval = interval
+        self.on_reading = on_reading
+        self.on_stale = on_stale
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff if max_backoff is not None else interval
+        self.stale_after = stale_after if stale_after is not None else 3 * interval
+        self.threaded = threaded
+        self.last_good = None
+        self.last_elapsed = None
+        self.reads = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.consecutive_failures = 0
+        self._stale_signalled = False
+        self._started = None
+        self._request_id = 0
+        self._pending = None
+        self._next = None
+        self._wanted = threading.Event()
+        self._running = False
+        self._worker = None
+
+    def start(self):
+        """Start the worker and take the first reading straight away."""
+        self._running = True
+        self._started = self.scheduler.clock.now()
+        if self.threaded:
+            self._worker = threading.Thread(target=self._work, name="SensorService")
+            self._worker.daemon = True
+            self._worker.start()
+        self._next = self.scheduler.call_soon(self._request)
+
+    def stop(self):
+        self._running = False
+        self._wanted.set()
+        if self._next is not None:
+            self._next.cancel()
+
+    def age(self):
+        """Return the age in seconds of the last good reading, or None."""
+        if self.last_good is None:
+            return None
+        return self.scheduler.clock.now() - self.last_good.timestamp
+
+    def is_stale(self):
+        """Return True if there has been no good reading for stale_after."""
+        if self.last_good is not None:
+            return self.age() > self.stale_after
+        if self._started is None:
+            return False
+        return self.scheduler.clock.now() - self._started > self.stale_after
+
+    def stats(self):
+        return {
+            "reads": self.reads,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "consecutive_failures": self.consecutive_failures,
+            "age": self.age(),
+        }
+
+    def _request(self):
+        self._request_id += 1
+        request_id = self._request_id
+        self._pending = request_id
+        if not self.threaded:
+            self._complete(request_id, *self._read())
+            return
+        self._wanted.set()
+        self._next = self.scheduler.call_later(self.timeout, self._expire, request_id)
+
+    def _work(self):
+        while True:
+            self._wanted.wait()
+            self._wanted.clear()
+            if not self._running:
+                return
+            request_id = self._request_id
+            result = self._read()
+            self.scheduler.call_soon(self._complete, request_id, *result)
+
+    def _read(self):
+        clock = self.scheduler.clock
+        start = clock.now()
+        try:
+            humidity, temperature = self.sensor.read()
+        except Exception:
+            logging.exception("Sensor read failed")
+            humidity, temperature = None, None
+        return humidity, temperature, clock.now() - start
+
+    def _complete(self, request_id, humidity, temperature, elapsed):
+        if not self._running or request_id != self._pending:
+            return
+        self._pending = None
+        if self._next is not None:
+            self._next.cancel()
+        self.reads += 1
+        self.last_elapsed = elapsed
+        if humidity is None or temperature is None:
+            self._failed()
+            return
+        if elapsed > self.timeout:
+            self.timeouts += 1
+            self._failed()
+            return
+        self.consecutive_failures = 0
+        self._stale_signalled = False
+        self.last_good = Reading(temperature, humidity, self.scheduler.clock.now())
+        self._next = self.scheduler.call_later(self.interval, self._request)
+        if self.on_reading is not None:
+            self.on_reading(self.last_good)
+
+    def _expire(self, request_id):
+        if request_id != self._pending:
+            return
+        self._pending = None
+        self.timeouts += 1
+        self._failed()
+
+    def _failed(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        delay = min(self.retry_delay * 2 ** (self.consecutive_failures - 1), self.max_backoff)
+        self._next = self.scheduler.call_later(delay, self._request)
+        if self.is_stale() and not self._stale_signalled:
+            self._stale_signalled = True
+            logging.warning("No good sensor reading for %s seconds", self.stale_after)
+            if self.on_stale is not None:
+                self.on_stale()
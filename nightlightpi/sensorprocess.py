@@ -0,0 +1,240 @@
+# -*- coding: utf-8; -*-
+"""Read the sensor in a separate process.
+
+The DHT driver bit-bangs the sensor from C code which holds the GIL for
+the whole read, so while a read is in progress no other thread of the
+light runs: rainbow frames are late and MQTT messages wait. ProcessSensor
+moves the reads into a child process, optionally pinned to some CPUs
+and given realtime priority, so they only compete with the light for
+CPU time.
+
+Each read is requested over a pipe. The child writes the result into a
+small record in shared memory and wakes the caller, which copies the
+record out without taking any lock. The record is a seqlock: the
+writer makes the sequence odd while it writes and even once it is done,
+and a reader that sees the sequence odd or changed reads again. A child
+killed part way through a write leaves the sequence odd, so the record
+is reset before the next child starts.
+
+Example:
+    sensor = ProcessSensor(DHTSensor("AM2302", 22), cpus=[3], priority=50)
+    humidity, temperature = sensor.read()
+    sensor.close()
+
+"""
+
+__all__ = ["ProcessSensor", "SharedReading"]
+
+import logging
+import math
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+
+SEQUENCE = struct.Struct("<Q")
+# Request, humidity, temperature and elapsed seconds, after the sequence.
+DATA = struct.Struct("<Qddd")
+
+Record = namedtuple("Record", ["sequence", "request", "humidity", "temperature", "elapsed"])
+
+
+class SharedReading:
+    """A sensor reading in shared memory with one writer and lock-free readers.
+
+buffer is anything writable with the buffer protocol and at least size
+bytes, such as a multiprocessing RawArray shared with a child process.
+
+    """
+
+    size = SEQUENCE.size + DATA.size
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def write(self, request, humidity, temperature, elapsed):
+        buffer = self.buffer
+        # Odd whatever a writer killed part way through left behind.
+        writing = SEQUENCE.unpack_from(buffer)[0] | 1
+        SEQUENCE.pack_into(buffer, 0, writing)
+        DATA.pack_into(buffer, SEQUENCE.size, request, _to_float(humidity),
+                       _to_float(temperature), elapsed)
+        SEQUENCE.pack_into(buffer, 0, writing + 1)
+
+    def reset(self):
+        """Clear the record. Only call this while there is no other writer."""
+        self.write(0, None, None, 0.0)
+
+    def read(self, retries=1000):
+        """Return the last Record written, missing values are None.
+
+If the record is still being written after retries attempts, a Record
+for request 0 with no values is returned.
+
+        """
+        buffer = self.buffer
+        for _ in range(retries):
+            before = SEQUENCE.unpack_from(buffer)[0]
+            if before & 1:
+                time.sleep(0)
+                continue
+            request, humidity, temperature, elapsed = DATA.unpack_from(buffer, SEQUENCE.size)
+            if SEQUENCE.unpack_from(buffer)[0] == before:
+                return Record(before, request, _from_float(humidity),
+                              _from_float(temperature), elapsed)
+        return Record(before, 0, None, None, 0.0)
+
+
+def _to_float(value):
+    return math.nan if value is None else value
+
+
+def _from_float(value):
+    return None if math.isnan(value) else value
+
+
+class ProcessSensor:
+    """Make the reads of sensor in a child process.
+
+sensor is pickled into the child, which is started on the first read
+and again if it dies. cpus is a list of CPUs for the child to run on and
+priority its SCHED_FIFO realtime priority, either is ignored with a
+warning if the system does not allow it. A read which takes longer than
+timeout fails, and the child is replaced in case the sensor hung.
+
+    """
+
+    def __init__(self, sensor, cpus=None, priority=None, timeout=5.0, context="spawn"):
+        self.sensor = sensor
+        self.cpus = cpus
+        self.priority = priority
+        self.timeout = timeout
+        self._context = multiprocessing.get_context(context)
+        self.record = SharedReading(self._context.RawArray("B", SharedReading.size))
+        self.reads = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self._process = None
+        self._conn = None
+        self._request = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pid(self):
+        return None if self._process is None else self._process.pid
+
+    def start(self):
+        """Start the child now rather than on the first read."""
+        with self._lock:
+            self._start()
+
+    def read(self):
+        """Return (humidity, temperature) read by the child."""
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                if self._process is not None:
+                    logging.warning("Sensor process exited with %s, restarting it",
+                                    self._process.exitcode)
+                    self.restarts += 1
+                    self._stop(0)
+                self._start()
+            self._request += 1
+            request = self._request
+            self.reads += 1
+            try:
+                self._conn.send(request)
+            except OSError:
+                return None, None
+            conn = self._conn
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or not conn.poll(remaining):
+                    break
+                conn.recv_bytes()
+            except (EOFError, OSError):
+                return None, None
+            record = self.record.read()
+            if record.request == request:
+                return record.humidity, record.temperature
+        logging.warning("Sensor process took longer than %s seconds to read", self.timeout)
+        with self._lock:
+            self.timeouts += 1
+            if self._conn is conn:
+                self._stop(0)
+        return None, None
+
+    def latest(self):
+        """Return the last Record written by the child, without waiting."""
+        return self.record.read()
+
+    def close(self):
+        with self._lock:
+            self._stop(self.timeout)
+
+    def _start(self):
+        self.record.reset()
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_serve, name="nightlightpi-sensor", daemon=True,
+            args=(self.sensor, self.record.buffer, child, self.cpus, self.priority))
+        process.start()
+        child.close()
+        self._process = process
+        self._conn = parent
+
+    def _stop(self, timeout):
+        process, conn = self._process, self._conn
+        self._process = self._conn = None
+        if process is None:
+            return
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        conn.close()
+
+
+def _serve(sensor, buffer, conn, cpus, priority):
+    _isolate(cpus, priority)
+    record = SharedReading(buffer)
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:
+            return
+        start = time.monotonic()
+        try:
+            humidity, temperature = sensor.read()
+        except Exception:
+            logging.exception("Sensor read failed")
+            humidity, temperature = None, None
+        record.write(request, humidity, temperature, time.monotonic() - start)
+        try:
+            conn.send_bytes(b"")
+        except OSError:
+            return
+
+
+def _isolate(cpus, priority):
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except (AttributeError, OSError) as e:
+            logging.warning("Could not run the sensor process on CPUs %s: %s", cpus, e)
+    if priority:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        except (AttributeError, OSError) as e:
+            logging.warning("Could not give the sensor process realtime priority %s: %s",
+                            priority, e)
@@ -0,0 +1,451 @@
+# -*- coding: utf-8; -*-
+"""Simulated devices for running NightLightPi without the hardware.
+
+These stand-ins behave like the real drivers closely enough for tests
+and benchmarks, and can inject the faults real hardware suffers from.
+The simulated_* functions are the factories used by the "simulated"
+backends in nightlightpi.backends.
+
+Example:
+    sensor = SimulatedSensor(temperature=19.5, failure_rate=0.2, latency=0.5)
+    humidity, temperature = sensor.read()
+
+"""
+
+__all__ = [
+    "FakeBroker",
+    "NullSensor",
+    "NullSink",
+    "SimulatedGPIO",
+    "SimulatedMQTTClient",
+    "SimulatedSSD1306",
+    "SimulatedSensor",
+    "SimulatedSink",
+]
+
+import random
+import threading
+import time
+from collections import namedtuple
+
+from nightlightpi.router import topic_matches
+
+
+class SimulatedSensor:
+    """Return readings like a DHT sensor, with configurable faults.
+
+Each read takes latency seconds, slept with the sleep function so a
+SimulatedClock's advance can be used instead of really sleeping. With
+hold_gil the latency is instead spent busy in a single C call, which
+holds the GIL the way the DHT driver does. Reads fail at random with
+probability failure_rate, and fail_next forces a number of failures in
+a row.
+
+    """
+
+    def __init__(self, temperature=21.0, humidity=45.0, failure_rate=0.0, latency=0.0,
+                 seed=None, sleep=time.sleep, hold_gil=False):
+        self.temperature = temperature
+        self.humidity = humidity
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.sleep = sleep
+        self.hold_gil = hold_gil
+        self.reads = 0
+        self._forced_failures = 0
+        self._random = random.Random(seed)
+
+    def fail_next(self, count=1):
+        self._forced_failures += count
+
+    def read(self):
+        self.reads += 1
+        if self.latency and self.hold_gil:
+            _hold_gil(self.latency)
+        elif self.latency:
+            self.sleep(self.latency)
+        if self._forced_failures:
+            self._forced_failures -= 1
+            return None, None
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            return None, None
+        return self.humidity, self.temperature
+
+
+_sums_per_second = None
+
+
+def _hold_gil(seconds):
+    # sum over a range runs entirely in C without checking whether another
+    # thread wants the GIL, so it is held until the sum is done.
+    global _sums_per_second
+    if _sums_per_second is None:
+        started = time.perf_counter()
+        sum(range(1000000))
+        _sums_per_second = 1000000 / (time.perf_counter() - started)
+    sum(range(int(seconds * _sums_per_second)))
+
+
+class NullSensor:
+    """A sensor that never returns a reading."""
+
+    def read(self):
+        return None, None
+
+
+class NullSink:
+    """Discard LED strip frames."""
+
+    def write(self, frame):
+        pass
+
+
+class SimulatedSink:
+    """Keep the LED strip frames written to it.
+
+first_write_at holds the time.perf_counter value of the first write,
+which is used to measure how long startup takes.
+
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.last_frame = None
+        self.first_write_at = None
+
+    def write(self, frame):
+        if self.first_write_at is None:
+            self.first_write_at = time.perf_counter()
+        self.frames += 1
+        self.bytes += len(frame)
+        self.last_frame = bytes(frame)
+
+
+class _SimulatedI2C:
+
+    def __init__(self, display):
+        self._display = display
+
+    def writeList(self, register, data):
+        self._display._write_data(data)
+
+
+class SimulatedSSD1306:
+    """Emulate the memory of an SSD1306 driven through Adafruit_SSD1306.
+
+Commands setting the column and page window are interpreted, and data
+written over the fake I2C bus fills the window in horizontal addressing
+mode, so ram always holds what the real display would show.
+
+    """
+
+    width = 128
+    height = 64
+
+    def __init__(self):
+        self._spi = None
+        self._i2c = _SimulatedI2C(self)
+        self.ram = bytearray(self.width * self.height // 8)
+        self.data_bytes = 0
+        self.commands = 0
+        self._pending = []
+        self._window = (0, self.width - 1, 0, self.height // 8 - 1)
+        self._cursor = (0, 0)
+
+    def begin(self):
+        pass
+
+    def command(self, c):
+        self.commands += 1
+        self._pending.append(c)
+        if len(self._pending) == 3 and self._pending[0] == 0x21:
+            first_page, last_page = self._window[2:]
+            self._window = (self._pending[1], self._pending[2], first_page, last_page)
+            self._cursor = (self._pending[1], first_page)
+            self._pending = []
+        elif len(self._pending) == 3 and self._pending[0] == 0x22:
+            first_column, last_column = self._window[:2]
+            self._window = (first_column, last_column, self._pending[1], self._pending[2])
+            self._cursor = (first_column, self._pending[1])
+            self._pending = []
+        elif self._pending[0] not in (0x21, 0x22):
+            self._pending = []
+
+    def _write_data(self, data):
+        first_column, last_column, first_page, last_page = self._window
+        column, page = self._cursor
+        for byte in data:
+            self.ram[page * self.width + column] = byte
+            self.data_bytes += 1
+            column += 1
+            if column > last_column:
+                column = first_column
+                page = first_page if page >= last_page else page + 1
+        self._cursor = (column, page)
+
+
+class SimulatedGPIO:
+    """Stand in for the RPi.GPIO module, with buttons that can be pressed.
+
+Inputs idle high as if pulled up. set_level changes the level of a pin
+and calls the edge callbacks registered for it, on the calling thread,
+honouring bouncetime the way RPi.GPIO does.
+
+    """
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.mode = None
+        self.levels = {}
+        self._callbacks = {}
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, pull_up_down=PUD_OFF, initial=None):
+        self.levels[pin] = self.LOW if pull_up_down == self.PUD_DOWN else self.HIGH
+
+    def input(self, pin):
+        return self.levels.get(pin, self.HIGH)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self._callbacks[pin] = [edge, callback, (bouncetime or 0) / 1000.0, None]
+
+    def add_event_callback(self, pin, callback):
+        self._callbacks[pin][1] = callback
+
+    def remove_event_detect(self, pin):
+        self._callbacks.pop(pin, None)
+
+    def cleanup(self, channel=None):
+        if channel is None:
+            self._callbacks.clear()
+            return
+        for pin in channel if isinstance(channel, (list, tuple)) else (channel,):
+            self._callbacks.pop(pin, None)
+            self.levels.pop(pin, None)
+
+    def set_level(self, pin, level):
+        previous = self.levels.get(pin, self.HIGH)
+        self.levels[pin] = level
+        if previous == level or pin not in self._callbacks:
+            return
+        detect = self._callbacks[pin]
+        edge, callback, bouncetime, last = detect
+        rising = level == self.HIGH
+        if edge == self.RISING and not rising or edge == self.FALLING and rising:
+            return
+        now = self.clock()
+        if last is not None and now - last < bouncetime:
+            return
+        detect[3] = now
+        if callback is not None:
+            callback(pin)
+
+    def press(self, pin):
+        self.set_level(pin, self.LOW)
+
+    def release(self, pin):
+        self.set_level(pin, self.HIGH)
+
+
+SimulatedMessage = namedtuple("SimulatedMessage", ["topic", "payload", "qos", "retain"])
+MessageInfo = namedtuple("MessageInfo", ["rc", "mid"])
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+MQTT_ERR_CONN_LOST = 7
+
+
+class FakeBroker:
+    """An in-process MQTT broker for SimulatedMQTTClient instances.
+
+Messages are delivered synchronously on the publishing thread. kill
+drops every connection and refuses new ones until restart is called.
+
+    """
+
+    def __init__(self):
+        self.running = True
+        self.retained = {}
+        self.published = []
+        self._clients = []
+        self._lock = threading.RLock()
+
+    def kill(self):
+        with self._lock:
+            self.running = False
+            clients, self._clients = self._clients, []
+        for client in clients:
+            client._connection_lost()
+
+    def restart(self):
+        self.running = True
+
+    def _attach(self, client):
+        with self._lock:
+            if client not in self._clients:
+                self._clients.append(client)
+
+    def _detach(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def _publish(self, topic, payload, qos, retain):
+        with self._lock:
+            self.published.append((topic, payload, retain))
+            if retain:
+                self.retained[topic] = payload
+            clients = list(self._clients)
+        for client in clients:
+            client._deliver(topic, payload, qos)
+
+
+class SimulatedMQTTClient:
+    """The parts of the paho-mqtt Client API NightLightPi uses."""
+
+    def __init__(self, broker, client_id=""):
+        self.broker = broker
+        self.client_id = client_id
+        self.userdata = None
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.connected = False
+        self.subscriptions = set()
+        self.published = []
+        self.host = None
+        self.port = None
+        self._lost = threading.Event()
+
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        self.host = host
+        self.port = port
+
+    def connect(self, host, port=1883, keepalive=60):
+        self.connect_async(host, port, keepalive)
+        return self.reconnect()
+
+    def reconnect(self):
+        if not self.broker.running:
+            raise ConnectionRefusedError("Simulated broker is down")
+        self.broker._attach(self)
+        self._lost.clear()
+        self.connected = True
+        if self.on_connect is not None:
+            self.on_connect(self, self.userdata, {}, 0)
+        return MQTT_ERR_SUCCESS
+
+    def loop(self, timeout=1.0):
+        """Wait up to timeout for the connection to be lost.
+
+Messages are delivered as they are published, so there is nothing else
+for the network loop to do.
+
+        """
+        if not self.connected:
+            return MQTT_ERR_NO_CONN
+        self._lost.wait(timeout)
+        return MQTT_ERR_SUCCESS if self.connected else MQTT_ERR_CONN_LOST
+
+    def disconnect(self):
+        self.broker._detach(self)
+        self._lost.set()
+        was_connected, self.connected = self.connected, False
+        if was_connected and self.on_disconnect is not None:
+            self.on_disconnect(self, self.userdata, 0)
+        return MQTT_ERR_SUCCESS
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self, force=False):
+        pass
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions.add(topic)
+        for retained_topic, payload in list(self.broker.retained.items()):
+            if topic_matches(topic, retained_topic):
+                self._deliver(retained_topic, payload, qos, retain=True)
+        return MQTT_ERR_SUCCESS, None
+
+    def unsubscribe(self, topic):
+        self.subscriptions.discard(topic)
+        return MQTT_ERR_SUCCESS, None
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if not self.connected:
+            return MessageInfo(MQTT_ERR_NO_CONN, None)
+        if payload is None:
+            payload = b""
+        elif isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode("utf-8")
+        self.published.append((topic, payload, retain))
+        self.broker._publish(topic, payload, qos, retain)
+        return MessageInfo(MQTT_ERR_SUCCESS, len(self.published))
+
+    def _deliver(self, topic, payload, qos, retain=False):
+        if not self.connected or self.on_message is None:
+            return
+        if any(topic_matches(f, topic) for f in self.subscriptions):
+            self.on_message(self, self.userdata, SimulatedMessage(topic, payload, qos, retain))
+
+    def _connection_lost(self):
+        self.connected = False
+        self._lost.set()
+        if self.on_disconnect is not None:
+            self.on_disconnect(self, self.userdata, 1)
+
+
+_default_broker = None
+
+
+def default_broker():
+    """Return the broker shared by simulated MQTT clients."""
+    global _default_broker
+    if _default_broker is None:
+        _default_broker = FakeBroker()
+    return _default_broker
+
+
+def simulated_strip(config):
+    return SimulatedSink()
+
+
+def simulated_display(config):
+    return SimulatedSSD1306()
+
+
+def simulated_sensor(config):
+    return SimulatedSensor()
+
+
+def simulated_inputs(config):
+    return SimulatedGPIO()
+
+
+def simulated_mqtt(config):
+    return SimulatedMQTTClient(default_broker(), client_id=config.mqtt.user)
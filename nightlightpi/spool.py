@@ -0,0 +1,173 @@
+# -*- coding: utf-8; -*-
+"""Hold sensor readings while the MQTT broker cannot be reached.
+
+Readings taken while disconnected are appended to a spool file as fixed
+size binary records, a double timestamp and float temperature and
+humidity. A header at the start of the file counts the records already
+replayed, so a restart carries on where the replay left off rather than
+sending them again. The spool is bounded, when it fills up the oldest
+half is dropped. Once the connection is back SpoolReplay publishes the spooled
+readings in batches, a limited number of messages per second, as JSON
+arrays of [timestamp, temperature, humidity] on the backlog topic.
+
+Example:
+    spool = Spool("/var/lib/nightlightpi/spool.bin")
+    spool.append(time.time(), 21.5, 40.0)
+    replay = SpoolReplay(spool, client, scheduler, "nightlight/backlog")
+    replay.start()
+
+"""
+
+__all__ = ["Spool", "SpoolReplay"]
+
+import io
+import json
+import logging
+import os
+import struct
+
+
+RECORD = struct.Struct("<dff")
+MAGIC = b"NLPISPL1"
+# Magic and the number of records at the start of the file consumed.
+HEADER = struct.Struct("<8sQ")
+
+MQTT_ERR_SUCCESS = 0
+
+
+class Spool:
+    """An append only file of readings, or a memory buffer without path.
+
+Records are read back with peek and removed with consume, the file is
+emptied once everything in it has been consumed. A record left half
+written by a crash is discarded when the spool is opened, and a file
+written before the header was added is read as unconsumed records.
+
+    """
+
+    def __init__(self, path=None, max_records=10080):
+        self.path = path
+        self.max_records = max(max_records, 2)
+        self.appended = 0
+        self.consumed = 0
+        self.dropped = 0
+        if path is None:
+            self._file = io.BytesIO()
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        self._file.seek(0)
+        header = self._file.read(HEADER.size)
+        if len(header) == HEADER.size and header[:len(MAGIC)] == MAGIC:
+            self._offset = HEADER.unpack(header)[1]
+        else:
+            self._rewrite(header + self._file.read())
+        size = self._file.seek(0, io.SEEK_END) - HEADER.size
+        self._count = size // RECORD.size
+        if size % RECORD.size:
+            self._file.truncate(HEADER.size + self._count * RECORD.size)
+        self._offset = min(self._offset, self._count)
+
+    def __len__(self):
+        return self._count - self._offset
+
+    def append(self, timestamp, temperature, humidity):
+        if len(self) >= self.max_records:
+            self._trim(self.max_records // 2)
+        self._file.seek(0, io.SEEK_END)
+        self._file.write(RECORD.pack(timestamp, temperature, humidity))
+        self._file.flush()
+        self._count += 1
+        self.appended += 1
+
+    def peek(self, limit):
+        """Return up to limit of the oldest records without removing them."""
+        self._file.seek(HEADER.size + self._offset * RECORD.size)
+        return list(RECORD.iter_unpack(self._file.read(limit * RECORD.size)))
+
+    def consume(self, count):
+        """Remove the oldest count records."""
+        count = min(count, len(self))
+        self._offset += count
+        self.consumed += count
+        if self._offset >= self._count:
+            self._rewrite(b"")
+        else:
+            self._file.seek(0)
+            self._file.write(HEADER.pack(MAGIC, self._offset))
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def stats(self):
+        return {"pending": len(self), "appended": self.appended,
+                "consumed": self.consumed, "dropped": self.dropped}
+
+    def _trim(self, keep):
+        self._file.seek(HEADER.size + (self._count - keep) * RECORD.size)
+        newest = self._file.read()
+        self.dropped += len(self) - keep
+        logging.warning("Offline spool is full, dropping the oldest %d readings", len(self) - keep)
+        self._rewrite(newest)
+
+    def _rewrite(self, records):
+        """Replace the contents of the file with records, none consumed."""
+        self._file.truncate(0)
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, 0) + records)
+        self._file.flush()
+        self._count = len(records) // RECORD.size
+        self._offset = 0
+
+
+class SpoolReplay:
+    """Publish what is in a spool from a scheduler job, rate limited.
+
+Each step publishes up to batch_size records as one message, at most
+messages_per_second times a second. Records are only consumed once
+their message has been handed to the client, and the replay stops if
+publishing fails, to be started again on the next connection.
+
+    """
+
+    def __init__(self, spool, client, scheduler, topic, batch_size=50, messages_per_second=5):
+        self.spool = spool
+        self.client = client
+        self.scheduler = scheduler
+        self.topic = topic
+        self.batch_size = batch_size
+        self.interval = 1.0 / messages_per_second
+        self.messages = 0
+        self._job = None
+
+    @property
+    def running(self):
+        return self._job is not None
+
+    def start(self):
+        if self._job is None and len(self.spool):
+            self._job = self.scheduler.call_repeating(self.interval, self.step)
+
+    def stop(self):
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+    def step(self):
+        records = self.spool.peek(self.batch_size)
+        if not records:
+            self.stop()
+            return
+        payload = json.dumps([[timestamp, round(temperature, 2), round(humidity, 2)]
+                              for timestamp, temperature, humidity in records])
+        info = self.client.publish(self.topic, payload, qos=1, retain=False)
+        if getattr(info, "rc", MQTT_ERR_SUCCESS) != MQTT_ERR_SUCCESS:
+            self.stop()
+            return
+        self.messages += 1
+        self.spool.consume(len(records))
+        if not len(self.spool):
+            self.stop()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8; -*-
+"""Share what a light is showing between threads as immutable snapshots.
+
+The latest reading, the light and display modes and the brightness are
+held together in one LightState tuple. A writer never changes a snapshot,
+it publishes a new one with update, which replaces the store's current
+snapshot in a single assignment. Readers take store.current once and use
+it throughout, without any lock, and so always see a temperature with its
+own humidity and a brightness with the mode it was set for, however many
+threads are writing.
+
+Example:
+    store = StateStore(light_mode=0, brightness=50)
+    store.update(temperature=21.5, humidity=40.0)
+    state = store.current
+    print(state.temperature, state.humidity)
+
+"""
+
+__all__ = ["LightState", "StateStore"]
+
+import threading
+from collections import namedtuple
+
+
+LightState = namedtuple("LightState", ["temperature", "humidity", "light_mode",
+                                       "display_mode", "brightness"])
+LightState.__new__.__defaults__ = (None, None, 0, "Temperature", 100)
+
+
+class StateStore:
+    """Hold the current LightState and publish changes to it atomically.
+
+Writers are serialised only among themselves, for as long as it takes to
+build the new tuple, so two updates of different fields cannot lose one
+another. Reading current never blocks.
+
+    """
+
+    def __init__(self, **values):
+        self.current = LightState(**values)
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def update(self, **changes):
+        """Publish a snapshot with the given fields changed and return it."""
+        with self._lock:
+            self.current = state = self.current._replace(**changes)
+            self.version += 1
+        return state
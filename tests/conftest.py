@@ -0,0 +1,35 @@
+# -*- coding: utf-8; -*-
+"""Keep the files the light caches out of the developer's home directory.
+
+Every test building a NightLight would otherwise compile the display
+assets and cache the parsed config under ~/.cache/nightlightpi, and
+spool readings under ~/.local/state/nightlightpi. The config cache is
+turned off and the assets are compiled into a temporary directory
+instead. Each test gets a spool file of its own, so readings spooled by
+one are not replayed by the next. Tests of the caches themselves set
+their own paths.
+
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from nightlightpi.assets import ENVASSETSPATH
+from nightlightpi.config import ENVCACHEPATH
+from nightlightpi.config import ENVSPOOLPATH
+
+
+@pytest.fixture(scope="session", autouse=True)
+def private_caches(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("cache")
+    paths = {ENVCACHEPATH: "", ENVASSETSPATH: str(directory / "assets.bin")}
+    with patch.dict(os.environ, paths):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def private_spool(tmp_path):
+    with patch.dict(os.environ, {ENVSPOOLPATH: str(tmp_path / "spool.bin")}):
+        yield
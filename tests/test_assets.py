@@ -0,0 +1,133 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.assets"""
+
+import os
+import shutil
+import tempfile
+from os.path import join
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi.assets import ENVASSETSPATH
+from nightlightpi.assets import AssetPack
+from nightlightpi.assets import assets_path
+from nightlightpi.assets import config_assets
+from nightlightpi.assets import load_assets
+from nightlightpi.display import image_to_pages
+from nightlightpi.display import open_image
+from nightlightpi.simulated import FakeBroker
+from test_backends import make_config
+
+
+IMAGES = join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "images")
+
+
+class AssetsTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.images = []
+        for name in ("menu_off.ppm", "menu_temperature.ppm", "temperature.ppm"):
+            path = join(self.directory, name)
+            shutil.copy(join(IMAGES, name), path)
+            self.images.append(path)
+        self.path = join(self.directory, "cache", "assets.bin")
+
+    def load(self, paths=None):
+        pack = load_assets(self.images if paths is None else paths, path=self.path)
+        self.addCleanup(pack.close)
+        return pack
+
+    def test_frames_match_the_decoded_images(self):
+        pack = self.load()
+        for path in self.images:
+            self.assertEqual(bytes(pack.frame(path)), image_to_pages(open_image(path)))
+        self.assertIsNone(pack.frame(join(self.directory, "missing.ppm")))
+
+    def test_frames_are_views_of_the_file(self):
+        frame = self.load().frame(self.images[0])
+        self.assertIsInstance(frame, memoryview)
+        self.assertTrue(frame.readonly)
+        self.assertEqual(len(frame), 1024)
+
+    def test_unchanged_pack_is_not_compiled_again(self):
+        self.load()
+        modified = os.stat(self.path).st_mtime_ns
+        with patch("nightlightpi.assets.compile_assets") as compile_assets:
+            self.load()
+        compile_assets.assert_not_called()
+        self.assertEqual(os.stat(self.path).st_mtime_ns, modified)
+
+    def test_changed_image_is_compiled_again(self):
+        self.load().close()
+        shutil.copy(join(IMAGES, "menu_rainbow.ppm"), self.images[0])
+        os.utime(self.images[0], ns=(1, 1))
+        pack = self.load()
+        self.assertEqual(bytes(pack.frame(self.images[0])),
+                         image_to_pages(open_image(join(IMAGES, "menu_rainbow.ppm"))))
+
+    def test_other_images_are_compiled_again(self):
+        self.load(self.images[:1]).close()
+        pack = self.load()
+        self.assertIsNotNone(pack.frame(self.images[2]))
+
+    def test_corrupt_pack_is_compiled_again(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "wb") as f:
+            f.write(b"not a pack")
+        with self.assertRaises(ValueError):
+            AssetPack(self.path)
+        self.assertIsNotNone(self.load().frame(self.images[0]))
+
+    def test_empty_path_disables_the_pack(self):
+        with patch.dict("os.environ", {ENVASSETSPATH: ""}):
+            self.assertIsNone(load_assets(self.images))
+
+    def test_unwritable_pack_falls_back(self):
+        with patch("nightlightpi.assets.compile_assets", side_effect=PermissionError("denied")):
+            self.assertIsNone(load_assets(self.images, path=self.path))
+
+    def test_each_light_of_a_fleet_has_its_own_pack(self):
+        with patch.dict("os.environ", {ENVASSETSPATH: self.path}):
+            self.assertEqual(assets_path(), self.path)
+            self.assertEqual(assets_path("hall"), join(self.directory, "cache", "assets-hall.bin"))
+        with patch.dict("os.environ", {ENVASSETSPATH: ""}):
+            self.assertEqual(assets_path("hall"), "")
+
+    def test_config_assets(self):
+        conf = make_config({})
+        self.assertEqual(config_assets(conf), ["images/menu_off.ppm", "images/menu_rainbow.ppm",
+                                               "images/menu_temperature.ppm", "images/temperature.ppm"])
+
+
+class NightLightAssetsTestCase(TestCase):
+
+    def setUp(self):
+        from nightlightpi.nightlight import NightLight
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patchers = [patch("nightlightpi.simulated.default_broker", return_value=FakeBroker()),
+                    patch.dict("os.environ", {ENVASSETSPATH: join(directory, "assets.bin")})]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.light = NightLight(make_config({"backend": "simulated"}))
+        self.addCleanup(self.light.stop)
+
+    def test_menu_is_shown_from_the_pack(self):
+        with patch.object(self.light, "open_image") as decode:
+            self.light.displayTemperatureMenu()
+        decode.assert_not_called()
+        menu = self.light.config.temp_mode.menu
+        self.assertEqual(bytes(self.light.display.device.ram),
+                         image_to_pages(open_image(menu)))
+
+    def test_menu_is_decoded_without_a_pack(self):
+        self.light.assets.close()
+        self.light.assets = None
+        self.light.display.clear()
+        self.light.displayTemperatureMenu()
+        menu = self.light.config.temp_mode.menu
+        self.assertEqual(bytes(self.light.display.device.ram),
+                         image_to_pages(open_image(menu)))
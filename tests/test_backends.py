@@ -0,0 +1,119 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.backends"""
+
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi import backends
+from nightlightpi.config import load_config
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.simulated import NullSink
+from nightlightpi.simulated import SimulatedGPIO
+from nightlightpi.simulated import SimulatedSink
+
+
+def make_config(hardware, **sections):
+    data = {'display_modes': [{'background': None,
+                               'menu': 'images/menu_off.ppm',
+                               'name': 'Off'},
+                              {'background': 'images/temperature.ppm',
+                               'menu': 'images/menu_temperature.ppm',
+                               'name': 'Temperature'},
+                              {'background': None,
+                               'menu': 'images/menu_rainbow.ppm',
+                               'name': 'Rainbow'}],
+            'inputs': {'button_display': 24, 'button_light': 23},
+            'led_strip': {'brightness': 6, 'length': 10, 'light': 10, 'max_brightness': 30},
+            'mqtt': {'brightness_topic': 'nightlight/brightness',
+                     'display_topic': 'nightlight/display',
+                     'enable': True,
+                     'humidity_topic': 'nightlight/humidity',
+                     'light_topic': 'nightlight/light',
+                     'password': 'PASSWORD',
+                     'port': 8883,
+                     'server': 'SERVER',
+                     'temperature_topic': 'nightlight/temperature',
+                     'user': 'USERNAME'},
+            'temperature': {'sensor_colours': [{'b': 255, 'g': 0, 'r': 20},
+                                              {'b': 10, 'g': 200, 'r': 255},
+                                              {'b': 0, 'g': 128, 'r': 255},
+                                              {'b': 0, 'g': 0, 'r': 255}],
+                            'sensor_ranges': [16, 20, 23.9],
+                            'sensor_type': 'AM2302',
+                            'pin': 22,
+                            'update_seconds': 60},
+            'timing': {'menu_button_pressed_time_in_seconds': 0,
+                       'menu_display': 0,
+                       'speed_in_seconds': 1},
+            'hardware': hardware}
+    data.update(sections)
+    with patch("nightlightpi.config.load_valid_yaml", return_value=data):
+        return load_config()
+
+
+class BackendRegistryTestCase(TestCase):
+
+    def test_every_kind_has_the_standard_backends(self):
+        for kind in backends.KINDS:
+            self.assertEqual(backends.available(kind), ["null", "real", "simulated"])
+
+    def test_unknown_backend_raises(self):
+        conf = make_config({})
+        with self.assertRaises(RuntimeError):
+            backends.create("strip", "bitbang", conf)
+
+    def test_device_overrides_default_backend(self):
+        conf = make_config({"backend": "simulated", "strip": "null"})
+        self.assertEqual(conf.hardware.display, "simulated")
+        self.assertIsInstance(backends.create("strip", conf.hardware.strip, conf), NullSink)
+        self.assertIsInstance(backends.create("inputs", conf.hardware.inputs, conf), SimulatedGPIO)
+
+    def test_null_display_is_disabled(self):
+        conf = make_config({"backend": "null"})
+        self.assertIsNone(backends.create("display", conf.hardware.display, conf))
+
+
+def click(light, pin):
+    """Press and release the button on pin and wait for the light to act on it."""
+    light.GPIO.press(pin)
+    light.commands.drain()
+    time.sleep(light.buttons.debounce)
+    light.GPIO.release(pin)
+    light.commands.drain()
+    # A press of a button which can be double pressed waits this long.
+    scheduler = light.scheduler
+    scheduler.run(until=scheduler.clock.now() + light.buttons.double_press)
+
+
+class SimulatedNightLightTestCase(TestCase):
+
+    def setUp(self):
+        from nightlightpi.nightlight import NightLight
+        self.broker = FakeBroker()
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.light = NightLight(make_config({"backend": "simulated"}))
+        self.addCleanup(self.light.stop)
+        self.assertTrue(self.light.link.wait_connected(5))
+
+    def test_runs_without_hardware(self):
+        sink = self.light.LEDStrip.sink
+        self.assertIsInstance(sink, SimulatedSink)
+        self.assertGreater(sink.frames, 0)
+        self.light.displayTemperatureMenu()
+        self.assertTrue(any(self.light.display.device.ram))
+
+    def test_mqtt_messages_change_modes(self):
+        self.broker._publish("nightlight/display/set", b"Off", 0, False)
+        self.light.commands.drain()
+        self.assertEqual(self.light.displayMode, "Off")
+        self.assertFalse(any(self.light.display.device.ram))
+        self.light.publisher.flush()
+        self.assertEqual(self.broker.retained["nightlight/display"], b"Off")
+
+    def test_light_button_changes_mode(self):
+        click(self.light, 23)
+        self.assertEqual(self.light.light_mode_order[self.light.lightMode], "Rainbow")
+        self.assertTrue(self.light.rainbow.running)
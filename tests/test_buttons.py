@@ -0,0 +1,172 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.buttons"""
+
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi.buttons import ButtonInput
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.scheduler import SimulatedClock
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.simulated import SimulatedGPIO
+from test_backends import make_config
+
+
+PIN = 23
+
+
+class ButtonInputTestCase(TestCase):
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.scheduler = Scheduler(self.clock)
+        self.gpio = SimulatedGPIO()
+        self.gestures = []
+        self.buttons = ButtonInput(self.gpio, self.scheduler,
+                                   lambda name, gesture: self.gestures.append((name, gesture)),
+                                   debounce=0.05, long_press=1.0, double_press=0.4)
+        self.buttons.add("light", PIN, gestures=("press",))
+
+    def advance(self, seconds):
+        self.scheduler.run(until=self.clock.now() + seconds)
+
+    def edges(self, *levels, gap=0.002):
+        """Set the pin to each level in turn, gap seconds apart."""
+        for level in levels:
+            self.gpio.set_level(PIN, level)
+            self.advance(gap)
+
+    def test_press_is_reported_straight_away(self):
+        self.gpio.press(PIN)
+        self.advance(0.001)
+        self.assertEqual(self.gestures, [("light", "press")])
+        self.assertEqual(self.buttons.stats()["latency_last_ms"], 0)
+
+    def test_bounces_are_ignored(self):
+        LOW, HIGH = self.gpio.LOW, self.gpio.HIGH
+        self.edges(LOW, HIGH, LOW, HIGH, LOW)
+        self.advance(0.1)
+        self.edges(HIGH, LOW, HIGH, LOW, HIGH)
+        self.advance(0.5)
+        self.assertEqual(self.gestures, [("light", "press")])
+        # Only edges away from the debounced state count as bounces.
+        self.assertEqual(self.buttons.stats()["bounces"], 4)
+
+    def test_bounce_ending_released_is_noticed(self):
+        LOW, HIGH = self.gpio.LOW, self.gpio.HIGH
+        self.edges(LOW, HIGH)
+        self.advance(0.1)
+        self.assertFalse(self.buttons.buttons[PIN].down)
+        self.advance(2)
+        self.edges(LOW)
+        self.assertEqual(self.gestures, [("light", "press"), ("light", "press")])
+
+    def use(self, *gestures):
+        self.buttons.close()
+        self.buttons.add("light", PIN, gestures)
+
+    def test_long_press_is_not_also_a_press(self):
+        self.use("press", "long")
+        self.gpio.press(PIN)
+        self.advance(1.1)
+        self.assertEqual(self.gestures, [("light", "long")])
+        self.gpio.release(PIN)
+        self.advance(0.1)
+        self.assertEqual(self.gestures, [("light", "long")])
+
+    def test_press_which_may_be_long_is_reported_on_release(self):
+        self.use("press", "long")
+        self.gpio.press(PIN)
+        self.advance(0.2)
+        self.assertEqual(self.gestures, [])
+        self.gpio.release(PIN)
+        self.advance(0.001)
+        self.assertEqual(self.gestures, [("light", "press")])
+        self.advance(2)
+        self.assertEqual(self.gestures, [("light", "press")])
+
+    def test_double_press_is_not_also_a_press(self):
+        self.use("press", "double")
+        for _ in range(3):
+            self.gpio.press(PIN)
+            self.advance(0.1)
+            self.gpio.release(PIN)
+            self.advance(0.1)
+        self.assertEqual(self.gestures, [("light", "double")])
+        # The third press waits to see if it is the first of another pair.
+        self.advance(0.3)
+        self.assertEqual(self.gestures, [("light", "double"), ("light", "press")])
+
+    def test_press_which_may_be_double_waits_for_the_second(self):
+        self.use("press", "double")
+        self.gpio.press(PIN)
+        self.advance(0.3)
+        self.assertEqual(self.gestures, [])
+        self.advance(0.2)
+        self.assertEqual(self.gestures, [("light", "press")])
+
+    def test_all_gestures(self):
+        self.use("press", "double", "long")
+        self.gpio.press(PIN)
+        self.advance(0.1)
+        self.gpio.release(PIN)
+        self.advance(0.1)
+        self.gpio.press(PIN)
+        self.advance(1.5)
+        self.gpio.release(PIN)
+        self.advance(1)
+        self.gpio.press(PIN)
+        self.advance(0.1)
+        self.gpio.release(PIN)
+        self.advance(1)
+        self.assertEqual(self.gestures, [("light", "double"), ("light", "press")])
+        self.gpio.press(PIN)
+        self.advance(1.5)
+        self.assertEqual(self.gestures[-1], ("light", "long"))
+
+    def test_close_stops_reporting(self):
+        self.buttons.close()
+        self.gpio.press(PIN)
+        self.advance(0.1)
+        self.assertEqual(self.gestures, [])
+
+
+class ButtonLatencyTestCase(TestCase):
+
+    def setUp(self):
+        from nightlightpi.nightlight import NightLight
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=FakeBroker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        timing = {'menu_button_pressed_time_in_seconds': 0.01,
+                  'menu_display': 0,
+                  'speed_in_seconds': 1,
+                  'rainbow_fps': 60}
+        self.light = NightLight(make_config({"backend": "simulated"}, timing=timing))
+        self.addCleanup(self.light.stop)
+        self.light.start()
+
+    def test_bouncing_presses_change_mode_once_each_and_quickly(self):
+        GPIO = self.light.GPIO
+        sink = self.light.LEDStrip.sink
+        latencies = []
+        for press in range(6):
+            for level in (GPIO.LOW, GPIO.HIGH, GPIO.LOW, GPIO.HIGH, GPIO.LOW):
+                GPIO.set_level(23, level)
+            time.sleep(0.03)
+            # The light button can be held, so a press is acted on once it
+            # is released.
+            frames = sink.frames
+            started = time.perf_counter()
+            for level in (GPIO.HIGH, GPIO.LOW, GPIO.HIGH):
+                GPIO.set_level(23, level)
+            while sink.frames == frames and time.perf_counter() - started < 1:
+                time.sleep(0.0002)
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.03)
+        self.light.stop()
+        self.light.join()
+        self.assertEqual(self.light.light_mode_order[self.light.lightMode], "Temperature")
+        self.assertEqual(self.light.buttons.stats()["bounces"], 6 * 3)
+        self.assertLess(max(latencies), 0.25)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.colourmap"""
+
+from unittest import TestCase
+
+from nightlightpi.colourmap import ColourMap
+
+
+RANGES = [16, 20, 23.9]
+COLOURS = [(20, 0, 255), (255, 200, 10), (255, 128, 0), (255, 0, 0)]
+
+
+def linear_colour(temperature, ranges, colours):
+    """The lookup lightTemperature used to do, keeping the last match."""
+    if temperature <= ranges[0]:
+        return colours[0]
+    if temperature >= ranges[-1]:
+        return colours[-1]
+    match = None
+    for boundary in range(len(ranges) - 1):
+        if ranges[boundary] < temperature <= ranges[boundary + 1]:
+            match = colours[boundary + 1]
+    return match
+
+
+class BandsTestCase(TestCase):
+
+    def setUp(self):
+        self.colours = ColourMap(RANGES, COLOURS)
+
+    def test_matches_linear_scan(self):
+        for tenth in range(100, 300):
+            t = tenth / 10
+            self.assertEqual(self.colours.colour(t), linear_colour(t, RANGES, COLOURS), t)
+
+    def test_boundaries_belong_to_lower_band(self):
+        self.assertEqual(self.colours.colour(16), COLOURS[0])
+        self.assertEqual(self.colours.colour(20), COLOURS[1])
+        self.assertEqual(self.colours.colour(23.9), COLOURS[3])
+
+    def test_many_bands(self):
+        ranges = list(range(0, 48))
+        colours = [(i, i, i) for i in range(49)]
+        colours_map = ColourMap(ranges, colours)
+        for t in (-5, 0.5, 17.2, 46.9, 60):
+            self.assertEqual(colours_map.colour(t), linear_colour(t, ranges, colours))
+
+
+class GradientTestCase(TestCase):
+
+    def setUp(self):
+        self.colours = ColourMap(RANGES, COLOURS, mode="gradient")
+
+    def test_ends_use_outer_colours(self):
+        self.assertEqual(self.colours.colour(-10), COLOURS[0])
+        self.assertEqual(self.colours.colour(16), COLOURS[0])
+        self.assertEqual(self.colours.colour(23.9), COLOURS[-1])
+        self.assertEqual(self.colours.colour(40), COLOURS[-1])
+
+    def test_band_centres_use_band_colour(self):
+        self.assertEqual(self.colours.colour(18), COLOURS[1])
+        # 21.95 falls between two 0.1 degree table entries.
+        for got, want in zip(self.colours.colour(21.95), COLOURS[2]):
+            self.assertAlmostEqual(got, want, delta=2)
+
+    def test_blends_between_bands(self):
+        r, g, b = self.colours.colour(17)
+        self.assertEqual((r, g, b), (138, 100, 132))
+
+
+class ValidationTestCase(TestCase):
+
+    def test_rejects_unsorted_ranges(self):
+        with self.assertRaises(RuntimeError):
+            ColourMap([20, 16], COLOURS)
+
+    def test_rejects_missing_colours(self):
+        with self.assertRaises(RuntimeError):
+            ColourMap(RANGES, COLOURS[:2])
+
+    def test_rejects_unknown_mode(self):
+        with self.assertRaises(RuntimeError):
+            ColourMap(RANGES, COLOURS, mode="sparkle")
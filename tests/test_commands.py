@@ -0,0 +1,67 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.commands"""
+
+import threading
+from unittest import TestCase
+
+from nightlightpi.commands import CommandQueue
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.scheduler import SimulatedClock
+
+
+class CommandQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.scheduler = Scheduler(self.clock)
+        self.commands = CommandQueue(self.scheduler)
+        self.applied = []
+
+    def record(self, *args):
+        self.applied.append(args)
+
+    def test_superseded_intents_are_collapsed(self):
+        for brightness in range(10):
+            self.commands.submit("brightness", self.record, brightness)
+        self.assertEqual(self.commands.depth, 1)
+        self.scheduler.run(until=1)
+        self.assertEqual(self.applied, [(9,)])
+        stats = self.commands.stats()
+        self.assertEqual(stats["superseded"], 9)
+        self.assertEqual(stats["applied"], 1)
+
+    def test_unkeyed_intents_are_all_applied_in_order(self):
+        self.commands.submit(None, self.record, "press")
+        self.commands.submit("display", self.record, "Off")
+        self.commands.submit(None, self.record, "press")
+        self.scheduler.run(until=1)
+        self.assertEqual(self.applied, [("press",), ("Off",), ("press",)])
+
+    def test_applied_on_the_scheduler_thread(self):
+        threads = []
+        scheduler = Scheduler()
+        commands = CommandQueue(scheduler)
+        loop = threading.Thread(target=scheduler.run)
+        loop.start()
+        commands.submit("light", lambda: threads.append(threading.current_thread()))
+        commands.submit("stop", scheduler.stop)
+        loop.join(5)
+        self.assertEqual(threads, [loop])
+
+    def test_latency_counts_from_first_submission(self):
+        self.commands.submit("light", self.record, 0)
+        self.commands.submit("slow", self.clock.advance, 0.25)
+        self.clock.advance(0.5)
+        self.commands.submit("light", self.record, 1)
+        self.scheduler.run(until=1)
+        stats = self.commands.stats()
+        self.assertAlmostEqual(stats["latency_max_ms"], 750)
+        self.assertEqual(stats["max_depth"], 2)
+        self.assertEqual(stats["depth"], 0)
+
+    def test_failing_intent_does_not_stop_others(self):
+        self.commands.submit("bad", lambda: 1 / 0)
+        self.commands.submit("good", self.record, "ok")
+        with self.assertLogs(level="ERROR"):
+            self.scheduler.run(until=1)
+        self.assertEqual(self.applied, [("ok",)])
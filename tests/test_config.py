@@ -8,13 +8,28 @@ external callers, but it probably shouldn't be.
 
 """
 
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
 
+import yaml
+from pykwalify.errors import SchemaError
+
+import nightlightpi.colourmap
+import nightlightpi.config
 from nightlightpi import errorstrings
 from nightlightpi.config import load_config
+from nightlightpi.config import ENVCACHEPATH
 from nightlightpi.config import ENVCONFIGPATH
+from nightlightpi.config import ENVSPOOLPATH
 from nightlightpi.config import ETCPATH
+from nightlightpi.config import load_valid_yaml
+
+
+SAMPLE_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "docs", "nightlightpi-sample-config.yaml")
 
 
 class LoadConfigTestCase(TestCase):
@@ -24,14 +39,37 @@ class LoadConfigTestCase(TestCase):
         mock_load_yaml.return_value = self.test_config
         with patch.dict("os.environ", {ENVCONFIGPATH: "some.yaml"}):
             conf = load_config()
-        mock_load_yaml.assert_called_once_with("some.yaml")
+        mock_load_yaml.assert_called_once_with("some.yaml", None)
 
     @patch("nightlightpi.config.load_valid_yaml")
     def test_falls_back_to_ETCPATH_when_env_var_not_set(self, mock_load_yaml):
         mock_load_yaml.return_value = self.test_config
         with patch.dict("os.environ", {}):
             conf = load_config()
-        mock_load_yaml.assert_called_once_with(ETCPATH)
+        mock_load_yaml.assert_called_once_with(ETCPATH, None)
+
+    @patch("nightlightpi.config.load_valid_yaml")
+    def test_compiles_colour_map(self, mock_load_yaml):
+        mock_load_yaml.return_value = self.test_config
+        conf = load_config()
+        self.assertEqual(conf.temperature.colour_mode, "bands")
+        self.assertEqual(conf.temperature.colour_map.colour(21.0), (255, 128, 0))
+
+    @patch("nightlightpi.config.load_valid_yaml")
+    def test_spool_defaults_to_the_state_directory(self, mock_load_yaml):
+        mock_load_yaml.return_value = self.test_config
+        environ = {name: value for name, value in os.environ.items() if name != ENVSPOOLPATH}
+        environ["XDG_STATE_HOME"] = "/state"
+        with patch.dict("os.environ", environ, clear=True):
+            conf = load_config()
+        self.assertEqual(conf.spool.path, "/state/nightlightpi/spool.bin")
+
+    @patch("nightlightpi.config.load_valid_yaml")
+    def test_spool_without_path_is_kept_in_memory(self, mock_load_yaml):
+        self.test_config['spool'] = {'path': None}
+        mock_load_yaml.return_value = self.test_config
+        conf = load_config()
+        self.assertIsNone(conf.spool.path)
 
     def setUp(self):
         self.test_config = {'display_modes': [{'background': None,
@@ -43,7 +81,7 @@ class LoadConfigTestCase(TestCase):
                                               {'background': None,
                                                'menu': 'images/menu_rainbow.ppm',
                                                'name': 'Rainbow'}],
-                            'inputs': {'buttons_display': 24, 'buttons_light': 23},
+                            'inputs': {'button_display': 24, 'button_light': 23},
                             'led_strip': {'brightness': 6,
                                           'length': 10,
                                           'light': 10,
@@ -62,7 +100,134 @@ class LoadConfigTestCase(TestCase):
                                                               {'b': 10, 'g': 200, 'r': 255},
                                                               {'b': 0, 'g': 128, 'r': 255},
                                                               {'b': 0, 'g': 0, 'r': 255}],
-                                            'sensor_ranges': [16, 20, 23.9]},
+                                            'sensor_ranges': [16, 20, 23.9],
+                                            'sensor_type': 'AM2302',
+                                            'pin': 22,
+                                            'update_seconds': 60},
                             'timing': {'menu_button_pressed_time_in_seconds': 0,
                                        'menu_display': 0,
                                        'speed_in_seconds': 1}}
+
+
+class ConfigCacheTestCase(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.config_path = os.path.join(tmp.name, "nightlightpi.yaml")
+        self.cache_path = os.path.join(tmp.name, "cache", "config.pickle")
+        shutil.copy(SAMPLE_CONFIG, self.config_path)
+        env = patch.dict("os.environ", {ENVCONFIGPATH: self.config_path,
+                                        ENVCACHEPATH: self.cache_path})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_second_load_uses_cache(self):
+        conf = load_config()
+        self.assertTrue(os.path.exists(self.cache_path))
+        with patch("nightlightpi.config.load_valid_yaml") as mock_load_yaml:
+            cached = load_config()
+        mock_load_yaml.assert_not_called()
+        self.assertEqual(cached.mqtt.temperature_topic, conf.mqtt.temperature_topic)
+        self.assertEqual(cached.temperature.colour_map.colour(21.0), (255, 128, 0))
+
+    def test_changed_file_is_loaded_again(self):
+        load_config()
+        with open(self.config_path, "a") as f:
+            f.write("\n# edited\n")
+        with patch("nightlightpi.config.load_valid_yaml",
+                   wraps=nightlightpi.config.load_valid_yaml) as mock_load_yaml:
+            load_config()
+        mock_load_yaml.assert_called_once_with(self.config_path, self.config_bytes())
+
+    def test_changed_colour_map_module_is_loaded_again(self):
+        module = os.path.join(os.path.dirname(self.cache_path), "colourmap.py")
+        os.makedirs(os.path.dirname(module))
+        shutil.copy(nightlightpi.colourmap.__file__, module)
+        with patch("nightlightpi.colourmap.__file__", module):
+            load_config()
+            os.utime(module, ns=(0, 0))
+            with patch("nightlightpi.config.load_valid_yaml",
+                       wraps=nightlightpi.config.load_valid_yaml) as mock_load_yaml:
+                load_config()
+        mock_load_yaml.assert_called_once_with(self.config_path, self.config_bytes())
+
+    def test_file_written_while_loading_is_loaded_again(self):
+        load_valid_yaml = nightlightpi.config.load_valid_yaml
+
+        def write_then_load(path, config_bytes):
+            with open(path, "w") as f:
+                f.write(config_bytes.decode("utf-8").replace("  length: 10", "  length: 20"))
+            return load_valid_yaml(path, config_bytes)
+
+        with patch("nightlightpi.config.load_valid_yaml", side_effect=write_then_load):
+            self.assertEqual(load_config().led_strip.length, 10)
+        self.assertEqual(load_config().led_strip.length, 20)
+
+    def config_bytes(self):
+        with open(self.config_path, "rb") as f:
+            return f.read()
+
+    def test_empty_cache_path_disables_cache(self):
+        with patch.dict("os.environ", {ENVCACHEPATH: ""}):
+            load_config()
+        self.assertFalse(os.path.exists(self.cache_path))
+
+    def test_corrupt_cache_is_ignored(self):
+        os.makedirs(os.path.dirname(self.cache_path))
+        with open(self.cache_path, "wb") as f:
+            f.write(b"not a pickle")
+        conf = load_config()
+        self.assertEqual(conf.led_strip.length, 10)
+
+    def test_config_objects_use_slots(self):
+        conf = load_config()
+        with self.assertRaises(AttributeError):
+            conf.mqtt.misspelled_topic = "x"
+
+
+class SchemaTestCase(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "nightlightpi.yaml")
+        with open(SAMPLE_CONFIG) as f:
+            self.data = yaml.safe_load(f)
+
+    def validate(self):
+        with open(self.path, "w") as f:
+            yaml.safe_dump(self.data, f)
+        return load_valid_yaml(self.path)
+
+    def test_sample_config_is_valid(self):
+        self.validate()
+
+    def test_fleet_overrides_are_validated(self):
+        self.data["fleet"] = [{"name": "hall", "led_strip": {"length": 20, "spi_device": 1}}]
+        self.validate()
+        self.data["fleet"].append({"name": "porch", "led_strip": {"length": "ten"}})
+        with self.assertRaisesRegex(SchemaError, "porch"):
+            self.validate()
+
+    def test_unknown_fleet_keys_are_rejected(self):
+        self.data["fleet"] = [{"name": "hall", "led_strip": {"spi_devcie": 3}}]
+        with self.assertRaises(SchemaError):
+            self.validate()
+
+    def test_rainbow_fps_must_be_positive(self):
+        self.data["timing"]["rainbow_fps"] = 0
+        with self.assertRaises(SchemaError):
+            self.validate()
+
+    def test_spool_replay_rate_must_be_positive(self):
+        self.data["spool"]["replay_rate"] = 0
+        with self.assertRaises(SchemaError):
+            self.validate()
+
+    def test_history_is_flushed_at_most_once_a_second(self):
+        self.data["history"]["flush_seconds"] = 0
+        with self.assertRaises(SchemaError):
+            self.validate()
+        self.data["history"]["flush_seconds"] = 1
+        self.validate()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.display"""
+
+import os
+from os.path import join
+from unittest import TestCase
+
+from PIL import Image
+
+from nightlightpi.display import DiffingDisplay
+from nightlightpi.display import SSD1306_COLUMNADDR
+from nightlightpi.display import image_to_pages
+
+
+IMAGES = join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "images")
+
+class FakeI2C:
+
+    def __init__(self):
+        self.writes = []
+
+    def writeList(self, register, data):
+        self.writes.append((register, list(data)))
+
+
+class FakeSSD1306:
+    """Record commands and data the way Adafruit_SSD1306 sends them."""
+
+    width = 128
+    height = 64
+
+    def __init__(self):
+        self._spi = None
+        self._i2c = FakeI2C()
+        self.commands = []
+
+    def command(self, c):
+        self.commands.append(c)
+
+    def data_bytes(self):
+        return sum(len(data) for _, data in self._i2c.writes)
+
+
+def adafruit_pages(image):
+    """Pack image the way Adafruit_SSD1306.image does."""
+    pix = image.load()
+    buffer = []
+    for page in range(image.height // 8):
+        for x in range(image.width):
+            bits = 0
+            for bit in range(8):
+                bits = bits << 1
+                bits |= 0 if pix[(x, page * 8 + 7 - bit)] == 0 else 1
+            buffer.append(bits)
+    return bytes(buffer)
+
+
+class ImageToPagesTestCase(TestCase):
+
+    def test_matches_adafruit_packing(self):
+        image = Image.open(join(IMAGES, "temperature.ppm")).convert("1")
+        self.assertEqual(image_to_pages(image), adafruit_pages(image))
+
+    def test_top_row_is_least_significant_bit(self):
+        image = Image.new("1", (128, 64))
+        image.putpixel((5, 8), 255)
+        pages = image_to_pages(image)
+        self.assertEqual(pages[128 + 5], 0x01)
+        self.assertEqual(sum(pages), 1)
+
+
+class DiffingDisplayTestCase(TestCase):
+
+    def setUp(self):
+        self.device = FakeSSD1306()
+        self.display = DiffingDisplay(self.device)
+        self.blank = Image.new("1", (128, 64))
+
+    def test_first_frame_is_sent_in_full(self):
+        self.display.image(self.blank)
+        self.assertEqual(self.device.data_bytes(), 1024)
+        self.assertEqual(self.display.bytes_sent, 1024)
+
+    def test_identical_frame_is_skipped(self):
+        self.display.image(self.blank)
+        self.display.image(self.blank.copy())
+        self.assertEqual(self.device.data_bytes(), 1024)
+        self.assertEqual(self.display.frames_skipped, 1)
+        self.assertEqual(self.display.bytes_avoided, 1024)
+
+    def test_only_changed_columns_of_changed_page_are_sent(self):
+        self.display.image(self.blank)
+        self.device.commands = []
+        changed = self.blank.copy()
+        changed.putpixel((40, 20), 255)
+        changed.putpixel((43, 22), 255)
+        self.display.image(changed)
+        self.assertEqual(self.device.commands, [SSD1306_COLUMNADDR, 40, 43, 0x22, 2, 2])
+        self.assertEqual(self.device.data_bytes(), 1024 + 4)
+        self.assertEqual(self.display.bytes_avoided, 1020)
+
+    def test_invalidate_forces_full_frame(self):
+        self.display.image(self.blank)
+        self.display.invalidate()
+        self.display.image(self.blank)
+        self.assertEqual(self.device.data_bytes(), 2048)
+
+    def test_rejects_wrong_sized_buffer(self):
+        with self.assertRaises(ValueError):
+            self.display.show_buffer(bytes(10))
@@ -0,0 +1,127 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.fleet"""
+
+import json
+import os
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi.assets import ENVASSETSPATH
+from nightlightpi.fleet import Fleet
+from nightlightpi.simulated import FakeBroker
+from test_backends import make_config
+
+
+FLEET = [{"name": "hall", "led_strip": {"length": 4, "light": 4}},
+         {"name": "landing", "topic_prefix": "landing/nightlight"},
+         {"name": "porch", "hardware": {"display": "null"}}]
+
+
+class FleetConfigTestCase(TestCase):
+
+    def test_devices_override_top_level_sections(self):
+        conf = make_config({"backend": "simulated"}, fleet=FLEET)
+        hall, landing, porch = conf.fleet
+        self.assertEqual(hall.name, "hall")
+        self.assertEqual(hall.led_strip.length, 4)
+        self.assertEqual(hall.led_strip.max_brightness, 30)
+        self.assertEqual(landing.led_strip.length, 10)
+        self.assertEqual(porch.hardware.display, "null")
+        self.assertEqual(porch.hardware.strip, "simulated")
+
+    def test_devices_have_their_own_topics(self):
+        conf = make_config({"backend": "simulated"}, fleet=FLEET)
+        hall, landing, _ = conf.fleet
+        self.assertEqual(hall.mqtt.temperature_topic, "nightlight/hall/temperature")
+        self.assertEqual(landing.mqtt.light_topic, "landing/nightlight/light")
+        self.assertEqual(conf.mqtt.light_topic, "nightlight/light")
+        self.assertEqual(hall.fleet, [])
+
+
+class FleetTestCase(TestCase):
+
+    def setUp(self):
+        self.broker = FakeBroker()
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        mqtt = {'brightness_topic': 'nightlight/brightness',
+                'display_topic': 'nightlight/display',
+                'enable': True,
+                'humidity_topic': 'nightlight/humidity',
+                'light_topic': 'nightlight/light',
+                'password': 'PASSWORD',
+                'port': 8883,
+                'server': 'SERVER',
+                'temperature_topic': 'nightlight/temperature',
+                'user': 'USERNAME',
+                'group_topic': 'nightlights'}
+        self.mqtt = mqtt
+        self.fleet = Fleet(make_config({"backend": "simulated"}, fleet=FLEET, mqtt=mqtt))
+        self.addCleanup(self.fleet.stop)
+        self.assertTrue(self.fleet.link.wait_connected(5))
+
+    def drain(self):
+        for light in self.fleet.lights:
+            light.commands.drain()
+
+    def test_lights_share_scheduler_and_connection(self):
+        hall, landing, porch = self.fleet.lights
+        self.assertIs(hall.scheduler, porch.scheduler)
+        self.assertIs(hall.mqttc, self.fleet.mqttc)
+        self.assertIsNot(hall.LEDStrip.sink, landing.LEDStrip.sink)
+        self.assertIsNone(porch.display)
+        self.assertEqual(len(self.fleet.mqttc.subscriptions), 3 * 3 + 3)
+
+    def test_lights_have_their_own_asset_packs(self):
+        packs = os.listdir(os.path.dirname(os.environ[ENVASSETSPATH]))
+        self.assertIn("assets-hall.bin", packs)
+        self.assertIn("assets-landing.bin", packs)
+
+    def test_message_reaches_only_its_light(self):
+        self.broker._publish("landing/nightlight/light/set", b"Off", 0, False)
+        self.drain()
+        modes = [light.light_mode_order[light.lightMode] for light in self.fleet.lights]
+        self.assertEqual(modes, ["Temperature", "Off", "Temperature"])
+
+    def test_group_topic_reaches_every_light(self):
+        self.broker._publish("nightlights/brightness/set", b"12", 0, False)
+        self.drain()
+        for light in self.fleet.lights:
+            self.assertEqual(light.config.led_strip.brightness, 12)
+            light.publisher.flush()
+        self.assertEqual(self.broker.retained["nightlight/hall/brightness"], b"12")
+        self.assertEqual(self.broker.retained["landing/nightlight/brightness"], b"12")
+
+    def test_reloaded_config_reaches_each_light(self):
+        fleet = [dict(FLEET[0], led_strip={"length": 4, "light": 2}),
+                 {"name": "landing", "topic_prefix": "upstairs/nightlight"},
+                 FLEET[2]]
+        new = make_config({"backend": "simulated"}, fleet=fleet, mqtt=self.mqtt)
+        self.fleet.applyConfig(new)
+        hall, landing, _ = self.fleet.lights
+        self.assertEqual(hall.rainbow.stop_led, 2)
+        self.assertIn("upstairs/nightlight/light/set", self.fleet.mqttc.subscriptions)
+        self.assertNotIn("landing/nightlight/light/set", self.fleet.mqttc.subscriptions)
+        self.broker._publish("upstairs/nightlight/light/set", b"Off", 0, False)
+        self.drain()
+        self.assertEqual(landing.light_mode_order[landing.lightMode], "Off")
+
+    def test_metrics_are_published_once_the_broker_is_back(self):
+        self.fleet.config.metrics.topic = "nightlights/metrics"
+        self.broker.kill()
+        deadline = time.monotonic() + 5
+        while self.fleet.link.connected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.fleet.publish_metrics()
+        self.fleet.publisher.flush()
+        self.assertTrue(self.fleet.metrics_held)
+        self.broker.restart()
+        self.assertTrue(self.fleet.link.wait_connected(5))
+        self.fleet.scheduler.run(until=self.fleet.scheduler.clock.now() + 0.5)
+        published = [payload for topic, payload, _ in self.broker.published
+                     if topic == "nightlights/metrics"]
+        self.assertEqual(len(published), 1)
+        self.assertEqual(json.loads(published[0]), self.fleet.metrics.snapshot())
+        self.assertFalse(self.fleet.metrics_held)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.history"""
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi.history import HEADER
+from nightlightpi.history import SensorHistory
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.simulated import SimulatedMessage
+from test_backends import make_config
+
+
+class SensorHistoryTestCase(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "history.bin")
+
+    def test_ring_keeps_newest_readings(self):
+        history = SensorHistory(4)
+        for minute in range(6):
+            history.append(60.0 * minute, 20.0 + minute, 40.0)
+        self.assertEqual(len(history), 4)
+        self.assertEqual([r[1] for r in history.records()], [22.0, 23.0, 24.0, 25.0])
+        self.assertEqual(history.latest(), (300.0, 25.0, 40.0))
+        self.assertEqual(len(history.times), 4)
+
+    def test_records_since(self):
+        history = SensorHistory(10)
+        for minute in range(5):
+            history.append(60.0 * minute, 20.0, 40.0)
+        self.assertEqual(len(history.records(since=120)), 3)
+
+    def test_rollup_min_max_avg(self):
+        history = SensorHistory(10)
+        for timestamp, temperature in ((0, 20.0), (1800, 22.0), (3600, 18.0), (5400, 19.0)):
+            history.append(timestamp, temperature, 50.0)
+        buckets = history.rollup(3600)
+        self.assertEqual([b["start"] for b in buckets], [0, 3600])
+        self.assertEqual(buckets[0]["temperature"], {"min": 20.0, "max": 22.0, "avg": 21.0})
+        self.assertEqual(buckets[1]["count"], 2)
+        self.assertEqual(buckets[1]["humidity"]["avg"], 50.0)
+
+    def test_survives_restart(self):
+        history = SensorHistory(4, self.path)
+        for minute in range(6):
+            history.append(60.0 * minute, 20.0 + minute, 40.0 + minute)
+        history.close()
+        reopened = SensorHistory(4, self.path)
+        self.assertEqual(reopened.records(), history.records())
+        reopened.append(360.0, 26.0, 46.0)
+        self.assertEqual(reopened.records()[0], (180.0, 23.0, 43.0))
+
+    def test_unflushed_readings_are_not_saved(self):
+        history = SensorHistory(4, self.path)
+        history.append(0.0, 20.0, 40.0)
+        history.flush()
+        history.append(60.0, 21.0, 40.0)
+        reopened = SensorHistory(4, self.path)
+        self.assertEqual(len(reopened), 1)
+
+    def test_flush_writes_only_new_records(self):
+        history = SensorHistory(100, self.path)
+        written = history.bytes_written
+        for minute in range(3):
+            history.append(60.0 * minute, 20.0, 40.0)
+        history.flush()
+        self.assertEqual(history.bytes_written - written, 3 * 16 + HEADER.size)
+        history.flush()
+        self.assertEqual(history.flushes, 2)
+
+    def test_different_capacity_starts_over(self):
+        history = SensorHistory(4, self.path)
+        history.append(0.0, 20.0, 40.0)
+        history.close()
+        with self.assertLogs(level="WARNING"):
+            resized = SensorHistory(8, self.path)
+        self.assertEqual(len(resized), 0)
+        self.assertEqual(os.path.getsize(self.path), HEADER.size + 16 * 8)
+
+
+class HistoryQueryTestCase(TestCase):
+
+    def setUp(self):
+        from nightlightpi.nightlight import NightLight
+        self.broker = FakeBroker()
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        conf = make_config({"backend": "simulated"})
+        conf.mqtt.history_topic = "nightlight/history"
+        self.light = NightLight(conf)
+        self.addCleanup(self.light.stop)
+        self.assertTrue(self.light.link.wait_connected(5))
+
+    def test_query_over_mqtt(self):
+        for minute in range(3):
+            self.light.history.append(1000000.0 + 60 * minute, 20.0 + minute, 40.0)
+        self.light.on_mqtt_message(None, None, SimulatedMessage(
+            "nightlight/history/get", b'{"since": 2e9, "bucket": 3600}', 0, False))
+        self.light.commands.drain()
+        self.light.publisher.flush()
+        topic, payload, retain = self.broker.published[-1]
+        self.assertEqual(topic, "nightlight/history")
+        self.assertFalse(retain)
+        rollup = json.loads(payload.decode("utf-8"))
+        self.assertEqual(rollup[0]["temperature"], {"min": 20.0, "max": 22.0, "avg": 21.0})
@@ -0,0 +1,115 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.ledstrip"""
+
+from unittest import TestCase
+
+from nightlightpi.ledstrip import APA102Engine
+from nightlightpi.ledstrip import lit_range
+from nightlightpi.ledstrip import wheel
+
+
+class RecordingSink:
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, frame):
+        self.frames.append(bytes(frame))
+
+
+class APA102EngineTestCase(TestCase):
+
+    def setUp(self):
+        self.sink = RecordingSink()
+        self.strip = APA102Engine(10, self.sink, global_brightness=30)
+
+    def test_pixel_is_in_wire_order_with_scaled_brightness(self):
+        # 6% of 30 rounds up to 2, as in the APA102_Pi library.
+        self.assertEqual(self.strip.pixel((1, 2, 3), 6), bytes([0xE2, 3, 2, 1]))
+
+    def test_colour_order_is_configurable(self):
+        strip = APA102Engine(1, self.sink, order="grb")
+        self.assertEqual(strip.pixel((1, 2, 3)), bytes([0xFF, 3, 1, 2]))
+
+    def test_fill_only_touches_the_range(self):
+        self.strip.fill((255, 0, 0), 2, 4)
+        leds = self.strip.leds()
+        self.assertEqual(leds[8:16], bytes([0xFE, 0, 0, 255]) * 2)
+        self.assertEqual(leds[:8], bytes([0xFE, 0, 0, 0]) * 2)
+        self.assertEqual(leds[16:], bytes([0xFE, 0, 0, 0]) * 6)
+
+    def test_compose_leaves_the_strip_alone(self):
+        self.strip.fill((0, 0, 255))
+        leds = self.strip.compose((255, 0, 0), 2, 4)
+        self.assertEqual(self.strip.leds(), bytes([0xFE, 255, 0, 0]) * 10)
+        self.assertEqual(leds, bytes([0xFE, 0, 0, 255]) * 2)
+        self.strip.swap(leds, 2)
+        expected = bytes([0xFE, 255, 0, 0]) * 2 + leds + bytes([0xFE, 255, 0, 0]) * 6
+        self.assertEqual(self.strip.leds(), expected)
+        self.assertEqual(self.sink.frames[-1][4:-1], expected)
+
+    def test_swap_keeps_leds_written_since_compose(self):
+        leds = self.strip.compose((255, 0, 0), 0, 4)
+        self.strip.fill((0, 255, 0), 4)
+        self.strip.swap(leds)
+        self.assertEqual(self.strip.leds()[16:], bytes([0xFE, 0, 255, 0]) * 6)
+
+    def test_show_sends_one_complete_frame(self):
+        self.strip.fill((0, 255, 0))
+        self.strip.show()
+        self.assertEqual(len(self.sink.frames), 1)
+        frame = self.sink.frames[0]
+        self.assertEqual(frame[:4], bytes(4))
+        self.assertEqual(len(frame), 4 + 40 + 1)
+
+    def test_unchanged_frame_is_not_resent(self):
+        self.strip.fill((0, 255, 0), 0, 4, 6)
+        self.strip.show()
+        self.strip.fill((0, 255, 0), 0, 4, 6)
+        self.strip.show()
+        self.assertEqual(len(self.sink.frames), 1)
+        self.assertEqual(self.strip.frames_skipped, 1)
+
+    def test_brightness_change_is_sent(self):
+        self.strip.fill((0, 255, 0), 0, 4, 6)
+        self.strip.show()
+        self.strip.fill((0, 255, 0), 0, 4, 50)
+        self.strip.show()
+        self.assertEqual(len(self.sink.frames), 2)
+
+    def test_force_and_invalidate_resend_unchanged_frame(self):
+        self.strip.show()
+        self.strip.show(force=True)
+        self.strip.invalidate()
+        self.strip.show()
+        self.assertEqual(len(self.sink.frames), 3)
+        self.assertEqual(self.strip.stats(), {"frames_sent": 3, "frames_skipped": 0})
+
+    def test_set_brightness_keeps_colours(self):
+        self.strip.fill((1, 2, 3))
+        self.strip.set_brightness(50)
+        self.assertEqual(self.strip.leds(), bytes([0xEF, 3, 2, 1]) * 10)
+
+    def test_load_clips_to_strip(self):
+        self.strip.load(bytes([0xFF, 9, 9, 9]) * 4, start=8)
+        self.assertEqual(self.strip.leds()[32:], bytes([0xFF, 9, 9, 9]) * 2)
+
+
+class LitRangeTestCase(TestCase):
+
+    def test_positive_light_counts_from_start(self):
+        self.assertEqual(lit_range(10, 4), (0, 4))
+
+    def test_negative_light_counts_from_end(self):
+        self.assertEqual(lit_range(10, -3), (7, 10))
+
+    def test_zero_lights_nothing(self):
+        self.assertEqual(lit_range(10, 0), (0, 0))
+
+
+class WheelTestCase(TestCase):
+
+    def test_wheel_segments(self):
+        self.assertEqual(wheel(0), (0, 255, 0))
+        self.assertEqual(wheel(85), (255, 0, 0))
+        self.assertEqual(wheel(170), (0, 0, 255))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.link"""
+
+import random
+import time
+from unittest import TestCase
+
+from nightlightpi.link import Backoff
+from nightlightpi.link import MQTTLink
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.simulated import SimulatedMQTTClient
+
+
+class BackoffTestCase(TestCase):
+
+    def test_delays_are_jittered_below_a_doubling_cap(self):
+        backoff = Backoff(1, 10, rng=random.Random(1))
+        delays = [backoff.next() for _ in range(8)]
+        for attempt, delay in enumerate(delays):
+            self.assertLessEqual(delay, min(10, 2 ** attempt))
+        self.assertEqual(len(set(delays)), len(delays))
+
+    def test_reset_starts_again(self):
+        backoff = Backoff(1, 10)
+        for _ in range(5):
+            backoff.next()
+        backoff.reset()
+        self.assertLessEqual(backoff.next(), 1)
+
+
+class MQTTLinkTestCase(TestCase):
+
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.client = SimulatedMQTTClient(self.broker)
+        self.connects = []
+        self.link = MQTTLink(self.client, "localhost", 1883, Backoff(0.01, 0.05),
+                             on_connect=lambda *args: self.connects.append(args[-1]))
+        self.addCleanup(self.link.stop)
+
+    def test_reconnects_after_broker_restart(self):
+        self.link.start()
+        self.assertTrue(self.link.wait_connected(5))
+        self.broker.kill()
+        time.sleep(0.2)
+        self.assertFalse(self.link.connected)
+        self.assertGreater(self.link.failures, 0)
+        self.broker.restart()
+        self.assertTrue(self.link.wait_connected(5))
+        self.assertEqual(self.connects, [0, 0])
+        self.assertEqual(self.link.backoff.attempt, 0)
+
+    def test_keeps_trying_when_broker_starts_late(self):
+        self.broker.kill()
+        self.link.start()
+        self.assertFalse(self.link.wait_connected(0.1))
+        self.broker.restart()
+        self.assertTrue(self.link.wait_connected(5))
@@ -0,0 +1,152 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.logs"""
+
+import io
+import json
+import logging
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi import logs
+from nightlightpi.logs import LogPipeline
+from nightlightpi.logs import RateLimitFilter
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.simulated import SimulatedMessage
+from test_backends import make_config
+
+
+def record(msg, level=logging.INFO, *args):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+class RateLimitFilterTestCase(TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.limiter = RateLimitFilter(rate=2, burst=3, clock=lambda: self.now)
+
+    def passed(self, count, msg="Received %s"):
+        return sum(self.limiter.filter(record(msg)) for _ in range(count))
+
+    def test_burst_then_rate(self):
+        self.assertEqual(self.passed(10), 3)
+        self.assertEqual(self.limiter.suppressed, 7)
+        self.now += 1.0
+        self.assertEqual(self.passed(10), 2)
+
+    def test_next_record_let_through_counts_the_suppressed(self):
+        self.passed(5)
+        self.now += 0.5
+        allowed = record("Received %s")
+        self.assertTrue(self.limiter.filter(allowed))
+        self.assertEqual(allowed.suppressed, 2)
+
+    def test_each_message_is_limited_separately(self):
+        self.passed(10)
+        self.assertEqual(self.passed(10, "Brightness: %s"), 3)
+
+    def test_errors_are_never_limited(self):
+        errors = sum(self.limiter.filter(record("Failed", logging.ERROR)) for _ in range(10))
+        self.assertEqual(errors, 10)
+
+
+class LogPipelineTestCase(TestCase):
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.pipeline = LogPipeline(logging.INFO, ring_size=5, rate=1000, burst=1000,
+                                    handlers=[logging.StreamHandler(self.stream)])
+        self.root_handlers = logging.getLogger().handlers[:]
+        self.pipeline.start()
+        self.addCleanup(self.pipeline.stop)
+
+    def test_records_are_written_and_kept(self):
+        logging.info("Light Mode: %s", "Rainbow")
+        logging.debug("Not logged")
+        self.pipeline.stop()
+        self.assertEqual(self.stream.getvalue(), "INFO: Light Mode: Rainbow\n")
+        self.assertEqual([r["message"] for r in self.pipeline.ring.recent()],
+                         ["INFO: Light Mode: Rainbow"])
+        self.assertEqual(logging.getLogger().handlers, self.root_handlers)
+
+    def test_messages_are_formatted_on_the_writer_thread(self):
+        threads = []
+
+        class Argument:
+            def __str__(self):
+                threads.append(threading.current_thread())
+                return "argument"
+
+        logging.info("Formatting %s", Argument())
+        self.pipeline.stop()
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_bad_format_string_does_not_stop_the_writer(self):
+        logging.info("Brightness: %d", "x")
+        logging.info("Light Mode: %s", "Rainbow")
+        # flush would wait forever on a dead writer thread.
+        flushed = threading.Thread(target=self.pipeline.flush, daemon=True)
+        flushed.start()
+        flushed.join(5)
+        self.assertFalse(flushed.is_alive())
+        self.assertEqual([r["message"] for r in self.pipeline.ring.recent()],
+                         ["INFO: Brightness: %d ('x',)", "INFO: Light Mode: Rainbow"])
+        self.assertEqual(self.pipeline.stats()["pending"], 0)
+
+    def test_ring_keeps_the_latest(self):
+        for count in range(8):
+            logging.warning("Message %d", count)
+        self.pipeline.stop()
+        self.assertEqual([r["message"] for r in self.pipeline.ring.recent(2)],
+                         ["WARNING: Message 6", "WARNING: Message 7"])
+        self.assertEqual(len(self.pipeline.ring.recent(level=logging.ERROR)), 0)
+
+    def test_full_queue_drops_rather_than_blocks(self):
+        self.pipeline.stop()
+        pipeline = LogPipeline(queue_size=2, handlers=[])
+        for count in range(5):
+            pipeline.handler.handle(record("Message %d", logging.INFO, count))
+        self.assertEqual(pipeline.stats()["dropped"], 3)
+
+
+class LogsQueryTestCase(TestCase):
+
+    def setUp(self):
+        from nightlightpi.nightlight import NightLight
+        self.broker = FakeBroker()
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        conf = make_config({"backend": "simulated"})
+        conf.mqtt.logs_topic = "nightlight/logs"
+        self.light = NightLight(conf)
+        self.addCleanup(self.light.stop)
+        self.assertTrue(self.light.link.wait_connected(5))
+        logs.start_logging(logging.INFO, handlers=[])
+        self.addCleanup(logs.stop_logging)
+
+    def query(self, request):
+        self.light.on_mqtt_message(None, None, SimulatedMessage(
+            "nightlight/logs/get", request, 0, False))
+        logs._pipeline.flush()
+        self.light.commands.drain()
+        self.light.publisher.flush()
+        topic, payload, retain = self.broker.published[-1]
+        self.assertEqual(topic, "nightlight/logs")
+        self.assertFalse(retain)
+        return json.loads(payload.decode("utf-8"))
+
+    def test_recent_messages_over_mqtt(self):
+        logging.warning("Unknown light mode '%s'", "Disco")
+        records = self.query(b'{"count": 5, "level": "warning"}')
+        self.assertEqual([r["message"] for r in records],
+                         ["WARNING: Unknown light mode 'Disco'"])
+        self.assertEqual(records[0]["level"], "WARNING")
+
+    def test_bad_request_is_ignored(self):
+        self.light.on_mqtt_message(None, None, SimulatedMessage(
+            "nightlight/logs/get", b'{"level": "LOUD"}', 0, False))
+        with self.assertLogs(level="WARNING"):
+            self.light.commands.drain()
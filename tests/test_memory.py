@@ -0,0 +1,129 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.memory"""
+
+import gc
+import os
+import tempfile
+import tracemalloc
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi import memory
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.scheduler import SimulatedClock
+from nightlightpi.sensor import Reading
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.simulated import SimulatedMessage
+from test_backends import make_config
+
+
+class MemoryReportTestCase(TestCase):
+
+    def test_rss_is_reported(self):
+        self.assertGreater(memory.rss_kib(), 0)
+
+    def test_allocations_are_charged_to_the_calling_module(self):
+        from nightlightpi.history import SensorHistory
+        tracemalloc.start(memory.FRAMES)
+        try:
+            history = SensorHistory(capacity=4096)
+            subsystems = memory.by_subsystem(tracemalloc.take_snapshot())
+        finally:
+            tracemalloc.stop()
+        self.assertGreaterEqual(subsystems["history"], 4096 * 16 / 1024)
+        self.assertNotIn("memory", subsystems)
+        del history
+
+    def test_report_leaves_the_running_light_alone(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        conf = make_config({"backend": "simulated"})
+        conf.history.path = os.path.join(tmp.name, "history.bin")
+        conf.spool.path = os.path.join(tmp.name, "spool.bin")
+        conf.metrics.enable = True
+        conf.metrics.port = 1
+        # One frame per allocation keeps the snapshots quick.
+        with patch("nightlightpi.simulated.default_broker", return_value=FakeBroker()), \
+                patch("nightlightpi.memory.FRAMES", 1):
+            result = memory.report(conf, seconds=0.1, warmup=0.1)
+        self.assertIn("steady", result)
+        self.assertEqual(os.listdir(tmp.name), [])
+
+
+class SteadyStateTestCase(TestCase):
+    """Run the light through many simulated seconds of sensor readings,
+MQTT messages and button presses.
+
+    """
+
+    CYCLES = 2000
+
+    def make_light(self, low_memory, length=60):
+        from nightlightpi.nightlight import NightLight
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=FakeBroker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        conf = make_config({"backend": "simulated", "mqtt": "null"},
+                           memory={"low_memory": low_memory})
+        conf.led_strip.length = conf.led_strip.light = length
+        conf.led_strip.rainbow_spread = True
+        light = NightLight(conf, scheduler=Scheduler(SimulatedClock()))
+        self.addCleanup(light.stop)
+        return light
+
+    def cycle(self, light, count):
+        topic = light.config.mqtt.brightness_topic + "/set"
+        temperature = 15 + count % 100 / 10
+        light.getData(Reading(temperature, 40 + count % 20, count))
+        if count % 50 == 0:
+            # Rebuilds the rainbow frames, so not too often
+            message = SimulatedMessage(topic, str(count % 100).encode("ascii"), 0, False)
+            light.on_mqtt_message(None, None, message)
+            light.commands.drain()
+        if count % 10 == 0:
+            light.lightButtonPressed()
+        if count % 30 == 0:
+            light.displayButtonPressed()
+        scheduler = light.scheduler
+        scheduler.run(until=scheduler.clock.now() + 1)
+
+    def traced_growth(self, light):
+        for count in range(self.CYCLES // 10):
+            self.cycle(light, count)
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        for count in range(self.CYCLES):
+            self.cycle(light, count)
+        gc.collect()
+        return (tracemalloc.get_traced_memory()[0] - before) / 1024
+
+    def assert_steady(self, low_memory):
+        light = self.make_light(low_memory)
+        tracemalloc.start()
+        try:
+            growth = self.traced_growth(light)
+        finally:
+            tracemalloc.stop()
+        self.assertLess(growth, 32)
+
+    def test_memory_does_not_grow(self):
+        self.assert_steady(False)
+
+    def test_memory_does_not_grow_in_low_memory_mode(self):
+        self.assert_steady(True)
+
+    def test_low_memory_mode_uses_less(self):
+        used = {}
+        for low_memory in (False, True):
+            gc.collect()
+            tracemalloc.start()
+            try:
+                light = self.make_light(low_memory, length=300)
+                self.cycle(light, 0)
+                gc.collect()
+                used[low_memory] = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            light.stop()
+        # The precomputed rainbow alone is 256 frames of 300 LEDs.
+        self.assertLess(used[True], used[False] - 256 * 300 * 4)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.metrics"""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi.metrics import Metrics
+from nightlightpi.metrics import MetricsServer
+from nightlightpi.metrics import TimedLock
+from nightlightpi.simulated import FakeBroker
+from test_backends import make_config
+
+
+class MetricsTestCase(TestCase):
+
+    def test_render_counters_timers_and_collected_values(self):
+        metrics = Metrics()
+        metrics.counter("frames_total", "Frames").inc(3)
+        timer = metrics.timer("write_seconds", "Writes", light="hall")
+        timer.observe(0.5)
+        timer.observe(0.25)
+        metrics.collect("depth", "Queue depth", lambda: 2)
+        text = metrics.render()
+        self.assertIn("# TYPE frames_total counter\nframes_total 3\n", text)
+        self.assertIn('write_seconds_count{light="hall"} 2\n', text)
+        self.assertIn('write_seconds_sum{light="hall"} 0.75\n', text)
+        self.assertIn('# TYPE write_seconds_max gauge\nwrite_seconds_max{light="hall"} 0.5\n', text)
+        self.assertIn("depth 2\n", text)
+
+    def test_same_name_and_labels_share_a_metric(self):
+        metrics = Metrics()
+        self.assertIs(metrics.counter("a", "A", light="hall"), metrics.counter("a", "A", light="hall"))
+        self.assertIsNot(metrics.counter("a", "A", light="hall"), metrics.counter("a", "A", light="porch"))
+
+    def test_snapshot(self):
+        metrics = Metrics()
+        with metrics.timer("t", "T").time():
+            pass
+        metrics.counter("c", "C", light="hall").inc()
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["c"], {"light=hall": 1})
+        self.assertEqual(snapshot["t"][""]["count"], 1)
+        json.dumps(snapshot)
+
+    def test_disabled_metrics_do_nothing(self):
+        metrics = Metrics(enabled=False)
+        counter = metrics.counter("c", "C")
+        counter.inc()
+        with metrics.timer("t", "T").time():
+            pass
+        metrics.collect("g", "G", lambda: 1)
+        self.assertIsInstance(metrics.lock("l", "L"), type(threading.Lock()))
+        self.assertEqual(metrics.render(), "")
+
+    def test_timed_lock_records_waits(self):
+        metrics = Metrics()
+        lock = metrics.lock("wait_seconds", "Waits")
+        self.assertIsInstance(lock, TimedLock)
+        lock.acquire()
+        releaser = threading.Timer(0.05, lock.release)
+        releaser.start()
+        with lock:
+            pass
+        releaser.join()
+        value = metrics.snapshot()["wait_seconds"][""]
+        self.assertEqual(value["count"], 2)
+        self.assertGreaterEqual(value["max"], 0.04)
+
+
+class MetricsServerTestCase(TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.counter("requests_total", "Requests").inc()
+        self.server = MetricsServer(self.metrics, port=0)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.url = "http://{0}:{1}".format(*self.server.address)
+
+    def test_serves_metrics(self):
+        with urllib.request.urlopen(self.url + "/metrics", timeout=5) as response:
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+            self.assertIn("requests_total 1", response.read().decode("utf-8"))
+
+    def test_other_paths_are_not_found(self):
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            urllib.request.urlopen(self.url + "/", timeout=5)
+        self.assertEqual(raised.exception.code, 404)
+
+
+class NightLightMetricsTestCase(TestCase):
+
+    def setUp(self):
+        from nightlightpi.nightlight import NightLight
+        self.broker = FakeBroker()
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics = {"enable": True, "port": 0, "topic": "nightlight/metrics", "publish_seconds": 60}
+        self.light = NightLight(make_config({"backend": "simulated"}, metrics=metrics))
+        self.addCleanup(self.light.stop)
+        self.assertTrue(self.light.link.wait_connected(5))
+
+    def test_hot_paths_are_timed(self):
+        self.light.setStripRGB((1, 2, 3))
+        self.light.displayTemperatureMenu()
+        self.broker._publish("nightlight/light/set", b"Off", 0, False)
+        snapshot = self.light.metrics.snapshot()
+        self.assertGreater(snapshot["nightlight_strip_write_seconds"][""]["count"], 0)
+        self.assertGreater(snapshot["nightlight_strip_lock_wait_seconds"][""]["count"], 0)
+        self.assertGreater(snapshot["nightlight_display_write_seconds"][""]["count"], 0)
+        self.assertEqual(snapshot["nightlight_mqtt_messages_received_total"][""], 1)
+        self.assertEqual(snapshot["nightlight_mqtt_connected"][""], True)
+
+    def test_endpoint_is_served(self):
+        url = "http://{0}:{1}/metrics".format(*self.light.metrics_server.address)
+        with urllib.request.urlopen(url, timeout=5) as response:
+            self.assertIn("nightlight_sensor_reads_total 0", response.read().decode("utf-8"))
+
+    def test_metrics_are_published(self):
+        self.light.publishMetrics()
+        self.light.publisher.flush()
+        published = [payload for topic, payload, _ in self.light.mqttc.published
+                     if topic == "nightlight/metrics"]
+        self.assertIn("nightlight_strip_write_seconds", json.loads(published[-1]))
+
+    def test_disabled_by_default(self):
+        from nightlightpi.nightlight import NightLight
+        light = NightLight(make_config({"backend": "simulated", "mqtt": "null"}))
+        self.addCleanup(light.stop)
+        self.assertFalse(light.metrics.enabled)
+        self.assertIsNone(light.metrics_server)
+        light.setStripRGB((1, 2, 3))
+        self.assertEqual(light.metrics.render(), "")
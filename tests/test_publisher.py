@@ -0,0 +1,74 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.publisher"""
+
+from unittest import TestCase
+
+from nightlightpi.publisher import Publisher
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.scheduler import SimulatedClock
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.simulated import SimulatedMQTTClient
+
+
+class PublisherTestCase(TestCase):
+
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.client = SimulatedMQTTClient(self.broker)
+        self.client.connect("localhost")
+        self.scheduler = Scheduler(SimulatedClock())
+        self.publisher = Publisher(self.client, self.scheduler, window=0.5)
+
+    def test_waits_for_window_before_sending(self):
+        self.publisher.publish("nightlight/light", "Rainbow")
+        self.scheduler.run(until=0.4)
+        self.assertEqual(self.broker.published, [])
+        self.scheduler.run(until=0.6)
+        self.assertEqual(self.broker.published, [("nightlight/light", b"Rainbow", True)])
+
+    def test_coalesces_updates_to_same_topic(self):
+        for brightness in range(10):
+            self.publisher.publish("nightlight/brightness", brightness)
+        self.scheduler.run(until=1)
+        self.assertEqual(self.broker.published, [("nightlight/brightness", b"9", True)])
+        stats = self.publisher.stats()
+        self.assertEqual(stats["enqueued"], 10)
+        self.assertEqual(stats["coalesced"], 9)
+        self.assertEqual(stats["sent"], 1)
+
+    def test_batches_readings_into_one_flush(self):
+        self.publisher.publish_many({"nightlight/temperature": "21.5",
+                                     "nightlight/humidity": "40.0"})
+        self.scheduler.run(until=1)
+        self.assertEqual(self.broker.retained, {"nightlight/temperature": b"21.5",
+                                                "nightlight/humidity": b"40.0"})
+        self.assertEqual(self.publisher.stats()["flushes"], 1)
+
+    def test_drops_payload_equal_to_retained_value(self):
+        self.publisher.publish("nightlight/display", "Off")
+        self.publisher.flush()
+        self.publisher.publish("nightlight/display", "Off")
+        self.publisher.flush()
+        self.assertEqual(len(self.broker.published), 1)
+        self.assertEqual(self.publisher.stats()["duplicates"], 1)
+
+    def test_value_changed_back_within_window_is_dropped(self):
+        self.publisher.publish("nightlight/display", "Off")
+        self.publisher.flush()
+        self.publisher.publish("nightlight/display", "Temperature")
+        self.publisher.publish("nightlight/display", "Off")
+        self.scheduler.run(until=1)
+        self.assertEqual(len(self.broker.published), 1)
+        self.assertEqual(self.publisher.stats()["pending"], 0)
+
+    def test_counts_failures_when_disconnected(self):
+        self.broker.kill()
+        self.publisher.publish("nightlight/light", "Off")
+        self.publisher.flush()
+        self.assertEqual(self.publisher.stats()["failed"], 1)
+        # Not remembered as retained, so it is sent again once connected.
+        self.broker.restart()
+        self.client.reconnect()
+        self.publisher.publish("nightlight/light", "Off")
+        self.publisher.flush()
+        self.assertEqual(self.broker.retained["nightlight/light"], b"Off")
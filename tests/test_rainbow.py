@@ -0,0 +1,84 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.rainbow"""
+
+from unittest import TestCase
+
+from nightlightpi.ledstrip import APA102Engine
+from nightlightpi.ledstrip import wheel
+from nightlightpi.rainbow import RainbowAnimation
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.scheduler import SimulatedClock
+
+
+class CountingSink:
+
+    def __init__(self):
+        self.writes = 0
+
+    def write(self, frame):
+        self.writes += 1
+
+
+class RainbowAnimationTestCase(TestCase):
+
+    def setUp(self):
+        self.sink = CountingSink()
+        self.strip = APA102Engine(8, self.sink, global_brightness=31)
+        self.scheduler = Scheduler(SimulatedClock())
+
+    def test_solid_rainbow_shows_wheel_colours(self):
+        rainbow = RainbowAnimation(self.strip, 0, 4)
+        rainbow.step()
+        rainbow.step()
+        expected = self.strip.pixel(wheel(1)) * 4 + self.strip.pixel((0, 0, 0)) * 4
+        self.assertEqual(self.strip.leds(), expected)
+
+    def test_spread_rainbow_offsets_each_led(self):
+        rainbow = RainbowAnimation(self.strip, spread=True)
+        rainbow.step()
+        leds = self.strip.leds()
+        for led in range(8):
+            self.assertEqual(leds[4 * led:4 * led + 4], self.strip.pixel(wheel(32 * led)))
+
+    def test_runs_at_target_frame_rate(self):
+        rainbow = RainbowAnimation(self.strip, fps=30)
+        rainbow.start(self.scheduler)
+        self.scheduler.run(until=9.99)
+        stats = rainbow.stats()
+        self.assertEqual(stats["frames"], 300)
+        self.assertAlmostEqual(stats["achieved_fps"], 30, delta=0.5)
+
+    def test_sweep_covers_the_wheel_then_slows_down(self):
+        rainbow = RainbowAnimation(self.strip, fps=1, sweep_fps=64)
+        rainbow.start(self.scheduler, sweep=1.0)
+        self.scheduler.run(until=0.99)
+        self.assertEqual(self.sink.writes, 64)
+        # Back at the start of the wheel, then one frame a second.
+        self.scheduler.run(until=5.05)
+        self.assertEqual(self.sink.writes, 64 + 5)
+        self.assertEqual(rainbow.position, 5)
+        self.assertTrue(rainbow.running)
+
+    def test_stop_cancels_animation(self):
+        rainbow = RainbowAnimation(self.strip, fps=10)
+        rainbow.start(self.scheduler)
+        self.scheduler.call_later(1.05, rainbow.stop)
+        self.scheduler.run(until=5)
+        self.assertEqual(rainbow.frames_shown, 11)
+        self.assertFalse(rainbow.running)
+
+    def test_set_brightness_rebuilds_frames(self):
+        rainbow = RainbowAnimation(self.strip, brightness=100)
+        rainbow.set_brightness(10)
+        rainbow.step()
+        self.assertEqual(self.strip.leds()[0], 0xE0 | 4)
+
+    def test_frames_built_as_shown_match_precomputed(self):
+        precomputed = RainbowAnimation(self.strip, 1, 7, spread=True, brightness=50)
+        built = RainbowAnimation(self.strip, 1, 7, spread=True, brightness=50, precompute=False)
+        self.assertIsNone(built.frames)
+        for position in range(256):
+            built.step()
+            leds = self.strip.leds()
+            precomputed.step()
+            self.assertEqual(leds, self.strip.leds())
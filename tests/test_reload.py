@@ -0,0 +1,260 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.reload"""
+
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+import yaml
+
+from nightlightpi.config import ENVCACHEPATH
+from nightlightpi.config import load_config
+from nightlightpi.reload import ConfigWatcher
+from nightlightpi.reload import diff_config
+from nightlightpi.reload import keep_restart_fields
+from nightlightpi.simulated import FakeBroker
+from test_backends import click
+from test_backends import make_config
+from test_config import SAMPLE_CONFIG
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class DiffConfigTestCase(TestCase):
+
+    def test_same_config_has_no_changes(self):
+        self.assertEqual(diff_config(make_config({}), make_config({})), [])
+
+    def test_changed_sections_are_named(self):
+        old = make_config({})
+        new = make_config({}, led_strip={'brightness': 12, 'length': 10, 'light': 10,
+                                         'max_brightness': 30},
+                          inputs={'button_display': 25, 'button_light': 23})
+        self.assertEqual(diff_config(old, new), ["led_strip", "inputs"])
+
+    def test_fleet_membership_is_compared_by_name(self):
+        old = make_config({}, fleet=[{"name": "hall"}])
+        new = make_config({}, fleet=[{"name": "hall"}, {"name": "porch"}])
+        self.assertIn("fleet", diff_config(old, new))
+
+    def test_restart_fields_are_kept(self):
+        running = make_config({})
+        new = make_config({"backend": "simulated"},
+                          led_strip={'brightness': 12, 'length': 20, 'light': 10,
+                                     'max_brightness': 30})
+        kept = keep_restart_fields(running, new)
+        self.assertIn("led_strip.length", kept)
+        self.assertIn("hardware.strip", kept)
+        self.assertEqual(new.led_strip.length, 10)
+        self.assertEqual(new.led_strip.brightness, 12)
+        self.assertEqual(new.hardware.strip, "real")
+
+
+class ConfigWatcherTestCase(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "nightlightpi.yaml")
+        with open(self.path, "w") as f:
+            f.write("first\n")
+        self.changed = threading.Event()
+
+    def watch(self, **kwargs):
+        watcher = ConfigWatcher(self.path, self.changed.set, **kwargs)
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        return watcher
+
+    def replace(self, text):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+
+    def test_inotify_sees_atomic_replace(self):
+        watcher = self.watch()
+        if watcher.mode != "inotify":
+            self.skipTest("inotify is not available")
+        self.replace("second\n")
+        self.assertTrue(self.changed.wait(5))
+        self.assertEqual(watcher.stats(), {"mode": "inotify", "changes": 1})
+
+    def test_inotify_sees_write_in_place(self):
+        watcher = self.watch()
+        if watcher.mode != "inotify":
+            self.skipTest("inotify is not available")
+        with open(self.path, "a") as f:
+            f.write("second\n")
+        self.assertTrue(self.changed.wait(5))
+
+    def test_inotify_ignores_other_files(self):
+        watcher = self.watch()
+        if watcher.mode != "inotify":
+            self.skipTest("inotify is not available")
+        with open(os.path.join(os.path.dirname(self.path), "other.yaml"), "w") as f:
+            f.write("other\n")
+        self.assertFalse(self.changed.wait(0.2))
+
+    def test_polling_sees_changes(self):
+        watcher = self.watch(use_inotify=False, poll_interval=0.01)
+        self.assertEqual(watcher.mode, "poll")
+        self.replace("second, and longer\n")
+        self.assertTrue(self.changed.wait(5))
+
+    def test_stop_closes_its_files(self):
+        before = len(os.listdir("/proc/self/fd"))
+        for use_inotify in (True, False, True):
+            watcher = ConfigWatcher(self.path, self.changed.set, poll_interval=0.01,
+                                    use_inotify=use_inotify)
+            watcher.start()
+            watcher.stop()
+            watcher.stop()
+        self.assertEqual(len(os.listdir("/proc/self/fd")), before)
+
+    def test_stop_from_on_change(self):
+        stopped = threading.Event()
+
+        def on_change():
+            watcher.stop()
+            stopped.set()
+
+        before = len(os.listdir("/proc/self/fd"))
+        watcher = ConfigWatcher(self.path, on_change, poll_interval=0.01, use_inotify=False)
+        watcher.start()
+        thread = watcher._thread
+        self.replace("second, and longer\n")
+        self.assertTrue(stopped.wait(5))
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(os.listdir("/proc/self/fd")), before)
+
+
+class ApplyConfigTestCase(TestCase):
+
+    def setUp(self):
+        from nightlightpi.nightlight import NightLight
+        self.broker = FakeBroker()
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.light = NightLight(make_config({"backend": "simulated"}))
+        self.addCleanup(self.light.stop)
+        self.assertTrue(self.light.link.wait_connected(5))
+        self.light.getData(type("Reading", (), {"temperature": 21.0, "humidity": 40.0})())
+
+    def test_brightness_and_colours_are_applied(self):
+        sink = self.light.LEDStrip.sink
+        new = make_config({"backend": "simulated"},
+                          led_strip={'brightness': 50, 'length': 10, 'light': 10,
+                                     'max_brightness': 30},
+                          temperature={'sensor_colours': [{'b': 0, 'g': 0, 'r': 1},
+                                                          {'b': 0, 'g': 0, 'r': 2},
+                                                          {'b': 0, 'g': 0, 'r': 3},
+                                                          {'b': 0, 'g': 0, 'r': 4}],
+                                       'sensor_ranges': [16, 20, 23.9],
+                                       'sensor_type': 'AM2302',
+                                       'pin': 22,
+                                       'update_seconds': 30})
+        frames = sink.frames
+        self.light.applyConfig(new)
+        self.assertEqual(sink.frames, frames + 1)
+        self.assertEqual(self.light.stripColour, (3, 0, 0))
+        self.assertEqual(self.light.config.led_strip.brightness, 50)
+        self.assertEqual(self.light.rainbow.brightness, 50)
+        self.assertEqual(self.light.sensor.interval, 30)
+        self.assertEqual(self.light.reloads, 1)
+
+    def test_brightness_set_over_mqtt_is_kept(self):
+        self.light.setBrightness("20")
+        new = make_config({"backend": "simulated"},
+                          led_strip={'brightness': 6, 'length': 10, 'light': 10,
+                                     'max_brightness': 25})
+        self.light.applyConfig(new)
+        self.assertEqual(self.light.config.led_strip.brightness, 20)
+        self.assertEqual(self.light.LEDStrip.global_brightness, 25)
+
+    def test_unchanged_config_does_nothing(self):
+        frames = self.light.LEDStrip.sink.frames
+        self.light.applyConfig(make_config({"backend": "simulated"}))
+        self.assertEqual(self.light.LEDStrip.sink.frames, frames)
+        self.assertEqual(self.light.reloads, 0)
+
+    def test_changed_topics_are_resubscribed(self):
+        mqtt = {'brightness_topic': 'nightlight/brightness',
+                'display_topic': 'nightlight/screen',
+                'enable': True,
+                'humidity_topic': 'nightlight/humidity',
+                'light_topic': 'nightlight/light',
+                'password': 'PASSWORD',
+                'port': 8883,
+                'server': 'SERVER',
+                'temperature_topic': 'nightlight/temperature',
+                'user': 'USERNAME'}
+        self.light.applyConfig(make_config({"backend": "simulated"}, mqtt=mqtt))
+        subscriptions = self.light.mqttc.subscriptions
+        self.assertIn("nightlight/screen/set", subscriptions)
+        self.assertNotIn("nightlight/display/set", subscriptions)
+        self.broker._publish("nightlight/screen/set", b"Off", 0, False)
+        self.light.commands.drain()
+        self.assertEqual(self.light.displayMode, "Off")
+
+    def test_changed_buttons_are_registered(self):
+        self.light.applyConfig(make_config({"backend": "simulated"},
+                                           inputs={'button_display': 25, 'button_light': 23}))
+        click(self.light, 25)
+        self.assertEqual(self.light.displayMode, "Off")
+
+
+class ReloadFileTestCase(TestCase):
+
+    def setUp(self):
+        from nightlightpi.nightlight import NightLight
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "nightlightpi.yaml")
+        with open(SAMPLE_CONFIG) as f:
+            self.data = yaml.safe_load(f)
+        self.data["hardware"] = {"backend": "simulated"}
+        self.write(self.data)
+        env = patch.dict("os.environ", {ENVCACHEPATH: ""})
+        env.start()
+        self.addCleanup(env.stop)
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=FakeBroker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.light = NightLight(load_config(self.path))
+        self.addCleanup(self.light.stop)
+        self.light.watchConfig(self.path, use_inotify=False, poll_interval=0.01)
+
+    def write(self, data):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            yaml.safe_dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def test_edited_file_is_applied(self):
+        self.data["led_strip"]["max_brightness"] = 20
+        self.write(self.data)
+        self.assertTrue(wait_for(lambda: self.light.watcher.changes))
+        self.light.commands.drain()
+        self.assertEqual(self.light.LEDStrip.global_brightness, 20)
+        self.assertEqual(self.light.reloads, 1)
+
+    def test_invalid_file_is_ignored(self):
+        with open(self.path, "w") as f:
+            f.write("led_strip: [\n")
+        self.assertTrue(wait_for(lambda: self.light.watcher.changes))
+        self.light.commands.drain()
+        self.assertEqual(self.light.reloads, 0)
+        self.assertEqual(self.light.config.led_strip.max_brightness, 30)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.renderer"""
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from PIL import ImageChops
+
+from benchmarks.bench_renderer import BACKGROUND
+from benchmarks.bench_renderer import render_uncached
+from nightlightpi.renderer import TemperatureRenderer
+
+
+class TemperatureRendererTestCase(TestCase):
+
+    def setUp(self):
+        self.renderer = TemperatureRenderer(BACKGROUND)
+
+    def test_frame_matches_uncached_rendering(self):
+        for temperature, humidity in [(21.5, 48.0), (-3.2, 99.9), (100.0, 5.0)]:
+            cached = self.renderer.render(temperature, humidity)
+            expected = render_uncached(temperature, humidity)
+            diff = ImageChops.difference(cached.convert("L"), expected.convert("L"))
+            self.assertIsNone(diff.getbbox())
+
+    def test_render_does_not_touch_disk_or_fonts(self):
+        with patch("nightlightpi.renderer.Image.open") as mock_open, \
+                patch("nightlightpi.renderer.ImageFont.truetype") as mock_truetype:
+            self.renderer.render(19.0, 55.5)
+        mock_open.assert_not_called()
+        mock_truetype.assert_not_called()
+
+    def test_render_leaves_background_untouched(self):
+        before = self.renderer.background.tobytes()
+        self.renderer.render(19.0, 55.5)
+        self.assertEqual(self.renderer.background.tobytes(), before)
+
+    def test_unexpected_characters_are_cached_on_first_use(self):
+        self.renderer.large.measure("nan")
+        self.assertIn("n", self.renderer.large.glyphs)
+
+    def test_fonts_can_be_dropped_after_drawing_glyphs(self):
+        renderer = TemperatureRenderer(BACKGROUND, keep_fonts=False)
+        self.assertIsNone(renderer.large.font)
+        expected = self.renderer.render(21.5, 48.0).tobytes()
+        self.assertEqual(renderer.render(21.5, 48.0).tobytes(), expected)
+        renderer.large.measure("nan")
+        self.assertIn("n", renderer.large.glyphs)
+        self.assertIsNone(renderer.large.font)
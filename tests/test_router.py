@@ -0,0 +1,61 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.router"""
+
+from unittest import TestCase
+
+from nightlightpi.config import MQTTConfig
+from nightlightpi.router import TopicRouter
+from nightlightpi.router import topic_matches
+
+
+class TopicMatchesTestCase(TestCase):
+
+    def test_wildcards(self):
+        self.assertTrue(topic_matches("nightlight/+/set", "nightlight/light/set"))
+        self.assertTrue(topic_matches("nightlight/#", "nightlight/light/set"))
+        self.assertFalse(topic_matches("nightlight/+", "nightlight/light/set"))
+        self.assertFalse(topic_matches("nightlight/light/set", "nightlight/light"))
+
+
+class TopicRouterTestCase(TestCase):
+
+    def setUp(self):
+        self.mqtt = MQTTConfig()
+        self.mqtt.display_topic = "nightlight/display"
+        self.mqtt.light_topic = "nightlight/light"
+        self.mqtt.brightness_topic = "nightlight/brightness"
+        self.calls = []
+        handlers = {command: (lambda topic, payload, command=command:
+                              self.calls.append((command, topic, payload)))
+                    for command in ("display", "light", "brightness")}
+        self.handlers = handlers
+
+    def test_routes_set_topics_from_config(self):
+        router = TopicRouter.from_config(self.mqtt, self.handlers)
+        self.assertEqual(router.topics(), ["nightlight/display/set", "nightlight/light/set",
+                                           "nightlight/brightness/set"])
+        self.assertTrue(router.dispatch("nightlight/light/set", "Rainbow"))
+        self.assertEqual(self.calls, [("light", "nightlight/light/set", "Rainbow")])
+
+    def test_unknown_topic_is_not_dispatched(self):
+        router = TopicRouter.from_config(self.mqtt, self.handlers)
+        self.assertFalse(router.dispatch("nightlight/light", "Rainbow"))
+        self.assertEqual(router.stats()["unmatched"], 1)
+
+    def test_group_topic_reaches_same_handler(self):
+        self.mqtt.group_topic = "nightlights"
+        router = TopicRouter.from_config(self.mqtt, self.handlers)
+        self.assertIn("nightlights/brightness/set", router.topics())
+        router.dispatch("nightlights/brightness/set", "10")
+        self.assertEqual(self.calls, [("brightness", "nightlights/brightness/set", "10")])
+
+    def test_wildcard_routes_are_cached(self):
+        router = TopicRouter(max_routes=2)
+        router.add("lights/+/light/set", self.handlers["light"])
+        router.add("lights/#", self.handlers["display"])
+        for light in ("hall", "landing", "hall", "bedroom"):
+            router.dispatch("lights/{0}/light/set".format(light), "Off")
+        self.assertEqual(len(self.calls), 8)
+        self.assertEqual(self.calls[0][0], "light")
+        self.assertEqual(self.calls[1][0], "display")
+        self.assertLessEqual(router.stats()["routes"], 2)
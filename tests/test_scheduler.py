@@ -0,0 +1,85 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.scheduler"""
+
+import threading
+import time
+from unittest import TestCase
+
+from benchmarks import bench_scheduler
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.scheduler import SimulatedClock
+
+
+class SchedulerTestCase(TestCase):
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.scheduler = Scheduler(self.clock)
+        self.calls = []
+
+    def record(self, name):
+        self.calls.append((name, self.clock.now()))
+
+    def test_runs_jobs_in_deadline_order(self):
+        self.scheduler.call_later(5, self.record, "late")
+        self.scheduler.call_later(1, self.record, "early")
+        self.scheduler.call_soon(self.record, "now")
+        self.scheduler.run(until=10)
+        self.assertEqual(self.calls, [("now", 0), ("early", 1), ("late", 5)])
+
+    def test_repeating_job_runs_every_interval(self):
+        self.scheduler.call_repeating(2, self.record, "tick")
+        self.scheduler.run(until=7)
+        self.assertEqual([t for _, t in self.calls], [0, 2, 4, 6])
+
+    def test_cancelled_job_does_not_run(self):
+        job = self.scheduler.call_repeating(1, self.record, "tick")
+        self.scheduler.call_later(2.5, job.cancel)
+        self.scheduler.run(until=10)
+        self.assertEqual([t for _, t in self.calls], [0, 1, 2])
+
+    def test_failing_job_does_not_stop_the_loop(self):
+        self.scheduler.call_soon(lambda: 1 / 0)
+        self.scheduler.call_later(1, self.record, "after")
+        with self.assertLogs(level="ERROR"):
+            self.scheduler.run(until=2)
+        self.assertEqual(self.calls, [("after", 1)])
+
+    def test_sleeps_between_deadlines(self):
+        self.scheduler.call_repeating(1, self.record, "tick")
+        self.scheduler.run(until=60)
+        self.assertEqual(len(self.calls), 60)
+        self.assertLessEqual(self.scheduler.wakeups, 61)
+
+
+class SchedulerThreadingTestCase(TestCase):
+
+    def test_call_soon_wakes_sleeping_loop(self):
+        scheduler = Scheduler()
+        woken = threading.Event()
+        scheduler.call_later(60, woken.set)
+        loop = threading.Thread(target=scheduler.run)
+        loop.start()
+        try:
+            time.sleep(0.05)
+            start = time.monotonic()
+            scheduler.call_soon(woken.set)
+            self.assertTrue(woken.wait(1))
+            self.assertLess(time.monotonic() - start, 0.5)
+        finally:
+            scheduler.stop()
+            loop.join(1)
+        self.assertFalse(loop.is_alive())
+
+
+class IdleCPUTestCase(TestCase):
+
+    def test_simulated_hour_is_near_idle(self):
+        results = bench_scheduler.run_simulated(minutes=60)
+        self.assertEqual(results["frames"], 3600)
+        self.assertLess(results["duty_cycle"], 0.01)
+
+    def test_realtime_loop_is_near_idle(self):
+        results = bench_scheduler.run_realtime(seconds=1.0)
+        self.assertGreater(results["frames"], 10)
+        self.assertLess(results["cpu_fraction"], 0.2)
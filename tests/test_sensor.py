@@ -0,0 +1,91 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.sensor"""
+
+import threading
+from unittest import TestCase
+
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.scheduler import SimulatedClock
+from nightlightpi.sensor import SensorService
+from nightlightpi.simulated import SimulatedSensor
+
+
+class SimulatedSensorServiceTestCase(TestCase):
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.scheduler = Scheduler(self.clock)
+        self.sensor = SimulatedSensor(temperature=19.5, humidity=40.0, sleep=self.clock.advance)
+        self.readings = []
+        self.stale = []
+        self.service = SensorService(self.sensor, self.scheduler, 60,
+                                     on_reading=self.readings.append,
+                                     on_stale=lambda: self.stale.append(self.clock.now()),
+                                     timeout=5, retry_delay=2, threaded=False)
+        self.service.start()
+
+    def test_reads_every_interval(self):
+        self.scheduler.run(until=181)
+        self.assertEqual([r.timestamp for r in self.readings], [0, 60, 120, 180])
+        self.assertEqual(self.readings[0].temperature, 19.5)
+
+    def test_backs_off_exponentially_on_failure(self):
+        self.sensor.fail_next(4)
+        self.scheduler.run(until=100)
+        # Retries after 2, 4, 8 and 16 seconds, then succeeds.
+        self.assertEqual(self.sensor.reads, 6)
+        self.assertEqual(self.readings[0].timestamp, 30)
+        self.assertEqual(self.service.failures, 4)
+        self.assertEqual(self.service.consecutive_failures, 0)
+
+    def test_backoff_is_capped(self):
+        self.sensor.fail_next(100)
+        self.scheduler.run(until=1000)
+        self.assertEqual(self.service.consecutive_failures, self.sensor.reads)
+        # Reads at 0, 2, 6, 14, 30 and 62 seconds, then once a minute.
+        self.assertEqual(self.sensor.reads, 6 + (1000 - 62) // 60)
+
+    def test_slow_read_counts_as_timeout(self):
+        self.sensor.latency = 10
+        self.scheduler.run(until=30)
+        self.assertEqual(self.readings, [])
+        self.assertGreater(self.service.timeouts, 0)
+
+    def test_caches_last_good_reading_with_age(self):
+        self.scheduler.run(until=61)
+        self.sensor.fail_next(100)
+        self.scheduler.run(until=100)
+        self.assertEqual(self.service.last_good.timestamp, 60)
+        self.assertEqual(self.service.age(), 40)
+        self.assertFalse(self.service.is_stale())
+
+    def test_signals_stale_data_once(self):
+        self.scheduler.run(until=1)
+        self.sensor.fail_next(100)
+        self.scheduler.run(until=1000)
+        self.assertEqual(len(self.stale), 1)
+        self.assertTrue(self.service.is_stale())
+        self.assertGreater(self.stale[0], 180)
+
+
+class ThreadedSensorServiceTestCase(TestCase):
+
+    def test_slow_sensor_does_not_block_the_scheduler(self):
+        scheduler = Scheduler()
+        sensor = SimulatedSensor(latency=0.3)
+        got_reading = threading.Event()
+        service = SensorService(sensor, scheduler, 60, on_reading=lambda r: got_reading.set(),
+                                timeout=1)
+        ticks = []
+        scheduler.call_repeating(0.02, ticks.append, 1)
+        loop = threading.Thread(target=scheduler.run)
+        service.start()
+        loop.start()
+        try:
+            self.assertTrue(got_reading.wait(2))
+        finally:
+            service.stop()
+            scheduler.stop()
+            loop.join(1)
+        self.assertGreater(len(ticks), 5)
+        self.assertEqual(service.last_good.temperature, 21.0)
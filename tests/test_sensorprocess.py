@@ -0,0 +1,133 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.sensorprocess"""
+
+import os
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi.sensorprocess import ProcessSensor
+from nightlightpi.sensorprocess import SharedReading
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.simulated import SimulatedSensor
+from test_backends import make_config
+
+
+class SharedReadingTestCase(TestCase):
+
+    def test_round_trip(self):
+        record = SharedReading(bytearray(SharedReading.size))
+        record.write(3, 45.5, None, 0.25)
+        latest = record.read()
+        self.assertEqual(latest.sequence, 2)
+        self.assertEqual((latest.request, latest.humidity, latest.temperature, latest.elapsed),
+                         (3, 45.5, None, 0.25))
+
+    def test_reader_waits_for_a_write_in_progress(self):
+        buffer = bytearray(SharedReading.size)
+        record = SharedReading(buffer)
+        record.write(1, 40.0, 20.0, 0.1)
+        buffer[0] += 1
+        sleeps = []
+
+        def finish_write(seconds):
+            sleeps.append(seconds)
+            buffer[0] += 1
+
+        with patch("nightlightpi.sensorprocess.time.sleep", side_effect=finish_write):
+            self.assertEqual(record.read().sequence, 4)
+        self.assertEqual(sleeps, [0])
+
+    def test_write_interrupted_by_a_killed_writer(self):
+        buffer = bytearray(SharedReading.size)
+        record = SharedReading(buffer)
+        record.write(1, 40.0, 20.0, 0.1)
+        buffer[0] += 1
+        with patch("nightlightpi.sensorprocess.time.sleep"):
+            self.assertEqual(record.read(retries=5).request, 0)
+        record.reset()
+        self.assertEqual(record.read(), (4, 0, None, None, 0.0))
+        record.write(2, 41.0, 21.0, 0.1)
+        self.assertEqual(record.read().sequence, 6)
+
+
+class ProcessSensorTestCase(TestCase):
+
+    def make_sensor(self, sensor, **kwargs):
+        process_sensor = ProcessSensor(sensor, **kwargs)
+        self.addCleanup(process_sensor.close)
+        return process_sensor
+
+    def test_reads_in_a_child_process(self):
+        sensor = self.make_sensor(SimulatedSensor(temperature=19.5, humidity=40.0))
+        self.assertEqual(sensor.read(), (40.0, 19.5))
+        self.assertNotEqual(sensor.pid, os.getpid())
+        self.assertEqual(sensor.latest().request, 1)
+
+    def test_driver_holding_the_gil_does_not_stall_other_threads(self):
+        sensor = self.make_sensor(SimulatedSensor(latency=0.5, hold_gil=True))
+        sensor.start()
+        ticks = []
+        done = threading.Event()
+
+        def tick():
+            while not done.is_set():
+                ticks.append(time.perf_counter())
+                time.sleep(0.005)
+
+        ticker = threading.Thread(target=tick)
+        ticker.start()
+        try:
+            self.assertEqual(sensor.read(), (45.0, 21.0))
+        finally:
+            done.set()
+            ticker.join()
+        self.assertLess(max(b - a for a, b in zip(ticks, ticks[1:])), 0.25)
+
+    def test_failed_read(self):
+        sensor = self.make_sensor(SimulatedSensor(failure_rate=1.0))
+        self.assertEqual(sensor.read(), (None, None))
+
+    def test_slow_read_times_out_and_replaces_the_child(self):
+        sensor = self.make_sensor(SimulatedSensor(latency=5.0), timeout=0.5)
+        sensor.start()
+        started = time.monotonic()
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(sensor.read(), (None, None))
+        self.assertLess(time.monotonic() - started, 2.0)
+        self.assertEqual(sensor.timeouts, 1)
+        self.assertIsNone(sensor.pid)
+        # A write cut short by the kill is cleared for the next child.
+        sensor.record.buffer[0] |= 1
+        sensor.sensor.latency = 0
+        self.assertEqual(sensor.read(), (45.0, 21.0))
+
+    def test_child_is_restarted_if_it_dies(self):
+        sensor = self.make_sensor(SimulatedSensor())
+        sensor.read()
+        sensor._process.terminate()
+        sensor._process.join()
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(sensor.read(), (45.0, 21.0))
+        self.assertEqual(sensor.restarts, 1)
+
+    def test_close_stops_the_child(self):
+        sensor = self.make_sensor(SimulatedSensor())
+        sensor.read()
+        process = sensor._process
+        sensor.close()
+        self.assertFalse(process.is_alive())
+        self.assertEqual(process.exitcode, 0)
+
+    def test_light_reads_from_the_child_when_isolated(self):
+        from nightlightpi.nightlight import NightLight
+        conf = make_config({"backend": "simulated"})
+        conf.temperature.isolate = True
+        with patch("nightlightpi.simulated.default_broker", return_value=FakeBroker()):
+            light = NightLight(conf)
+        self.addCleanup(light.stop)
+        self.assertIs(light.sensor.sensor, light.sensor_process)
+        self.assertEqual(light.sensor_process.read(), (45.0, 21.0))
+        light.stop()
+        self.assertIsNone(light.sensor_process.pid)
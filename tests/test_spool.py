@@ -0,0 +1,171 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.spool"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi.scheduler import Scheduler
+from nightlightpi.scheduler import SimulatedClock
+from nightlightpi.sensor import Reading
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.simulated import SimulatedMQTTClient
+from nightlightpi.spool import HEADER
+from nightlightpi.spool import RECORD
+from nightlightpi.spool import Spool
+from nightlightpi.spool import SpoolReplay
+from test_backends import make_config
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class SpoolTestCase(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "spool.bin")
+
+    def test_peek_and_consume_oldest_first(self):
+        spool = Spool()
+        for minute in range(5):
+            spool.append(60.0 * minute, 20.0 + minute, 40.0)
+        self.assertEqual([r[1] for r in spool.peek(2)], [20.0, 21.0])
+        spool.consume(2)
+        self.assertEqual(len(spool), 3)
+        self.assertEqual(spool.peek(10)[0][1], 22.0)
+
+    def test_survives_restart_and_empties_when_consumed(self):
+        spool = Spool(self.path)
+        for minute in range(3):
+            spool.append(60.0 * minute, 20.0, 40.0)
+        spool.close()
+        self.assertEqual(os.path.getsize(self.path), HEADER.size + 3 * RECORD.size)
+        spool = Spool(self.path)
+        self.assertEqual(len(spool), 3)
+        spool.consume(3)
+        self.assertEqual(os.path.getsize(self.path), HEADER.size)
+
+    def test_consumed_records_are_not_replayed_after_restart(self):
+        spool = Spool(self.path)
+        for minute in range(3):
+            spool.append(60.0 * minute, 20.0 + minute, 40.0)
+        spool.consume(2)
+        spool.close()
+        spool = Spool(self.path)
+        self.assertEqual(spool.peek(5), [(120.0, 22.0, 40.0)])
+        spool.append(180.0, 23.0, 40.0)
+        spool.consume(1)
+        spool.close()
+        self.assertEqual(Spool(self.path).peek(5), [(180.0, 23.0, 40.0)])
+
+    def test_file_without_header_is_read(self):
+        with open(self.path, "wb") as f:
+            f.write(RECORD.pack(1.0, 20.0, 40.0) + RECORD.pack(2.0, 21.0, 40.0))
+        spool = Spool(self.path)
+        spool.consume(1)
+        spool.close()
+        self.assertEqual(Spool(self.path).peek(5), [(2.0, 21.0, 40.0)])
+
+    def test_half_written_record_is_dropped(self):
+        with open(self.path, "wb") as f:
+            f.write(RECORD.pack(1.0, 20.0, 40.0) + b"\x00\x01")
+        spool = Spool(self.path)
+        self.assertEqual(spool.peek(5), [(1.0, 20.0, 40.0)])
+
+    def test_bounded_by_dropping_oldest(self):
+        spool = Spool(self.path, max_records=10)
+        for minute in range(25):
+            spool.append(float(minute), 20.0, 40.0)
+        self.assertLessEqual(len(spool), 10)
+        self.assertEqual(spool.peek(100)[-1][0], 24.0)
+        self.assertEqual(spool.stats()["dropped"], 25 - len(spool))
+        self.assertLessEqual(os.path.getsize(self.path), HEADER.size + 10 * RECORD.size)
+
+
+class SpoolReplayTestCase(TestCase):
+
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.client = SimulatedMQTTClient(self.broker)
+        self.client.connect("localhost")
+        self.scheduler = Scheduler(SimulatedClock())
+        self.spool = Spool()
+        for minute in range(5):
+            self.spool.append(60.0 * minute, 20.0, 40.0)
+
+    def test_replays_in_rate_limited_batches(self):
+        replay = SpoolReplay(self.spool, self.client, self.scheduler, "nightlight/backlog",
+                             batch_size=2, messages_per_second=2)
+        replay.start()
+        self.scheduler.run(until=0.9)
+        self.assertEqual(len(self.broker.published), 2)
+        self.scheduler.run(until=5)
+        batches = [json.loads(payload.decode("utf-8")) for _, payload, _ in self.broker.published]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[2][0], [240.0, 20.0, 40.0])
+        self.assertEqual(len(self.spool), 0)
+        self.assertFalse(replay.running)
+
+    def test_stops_and_keeps_records_when_publish_fails(self):
+        replay = SpoolReplay(self.spool, self.client, self.scheduler, "nightlight/backlog", batch_size=2)
+        self.broker.kill()
+        replay.start()
+        self.scheduler.run(until=5)
+        self.assertEqual(len(self.spool), 5)
+        self.assertFalse(replay.running)
+
+
+class OfflineNightLightTestCase(TestCase):
+
+    def setUp(self):
+        from nightlightpi.nightlight import NightLight
+        self.broker = FakeBroker()
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        mqtt = {'brightness_topic': 'nightlight/brightness',
+                'display_topic': 'nightlight/display',
+                'enable': True,
+                'humidity_topic': 'nightlight/humidity',
+                'light_topic': 'nightlight/light',
+                'password': 'PASSWORD',
+                'port': 8883,
+                'server': 'SERVER',
+                'temperature_topic': 'nightlight/temperature',
+                'user': 'USERNAME',
+                'publish_window_seconds': 0,
+                'reconnect_min_seconds': 0.01,
+                'reconnect_max_seconds': 0.05}
+        self.light = NightLight(make_config({"backend": "simulated"}, mqtt=mqtt,
+                                            spool={"replay_batch": 2, "replay_rate": 50}))
+        self.loop = threading.Thread(target=self.light.scheduler.run)
+        self.loop.start()
+        self.addCleanup(self.loop.join)
+        self.addCleanup(self.light.stop)
+        self.assertTrue(self.light.link.wait_connected(5))
+
+    def test_readings_during_outage_are_replayed(self):
+        self.broker.kill()
+        self.assertTrue(wait_for(lambda: not self.light.link.connected))
+        for minute in range(5):
+            reading = Reading(20.0 + minute, 40.0, minute)
+            self.light.scheduler.call_soon(self.light.getData, reading)
+        self.assertTrue(wait_for(lambda: len(self.light.spool) == 5))
+        self.broker.restart()
+        self.assertTrue(wait_for(lambda: len(self.light.spool) == 0))
+        backlog = [json.loads(payload.decode("utf-8")) for topic, payload, _ in self.broker.published
+                   if topic == "nightlight/backlog"]
+        self.assertEqual([r[1] for batch in backlog for r in batch], [20.0, 21.0, 22.0, 23.0, 24.0])
+        self.assertTrue(wait_for(lambda: self.broker.retained.get("nightlight/temperature") == b"24.0"))
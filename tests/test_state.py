@@ -0,0 +1,112 @@
+# -*- coding: utf-8; -*-
+"""Unit tests for nightlightpi.state"""
+
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from nightlightpi.simulated import FakeBroker
+from nightlightpi.state import LightState
+from nightlightpi.state import StateStore
+from test_backends import make_config
+
+
+class StateStoreTestCase(TestCase):
+
+    def test_defaults(self):
+        self.assertEqual(StateStore().current, LightState(None, None, 0, "Temperature", 100))
+
+    def test_update_publishes_a_new_snapshot(self):
+        store = StateStore(brightness=50)
+        before = store.current
+        after = store.update(temperature=21.5, humidity=40.0)
+        self.assertIs(store.current, after)
+        self.assertEqual((after.temperature, after.humidity, after.brightness), (21.5, 40.0, 50))
+        self.assertIsNone(before.temperature)
+        self.assertEqual(store.version, 1)
+
+    def test_readers_never_see_a_torn_reading(self):
+        store = StateStore(temperature=0, humidity=1000)
+        stopping = threading.Event()
+        torn = []
+
+        def write(offset):
+            for value in range(offset, offset + 20000):
+                store.update(temperature=value, humidity=value + 1000)
+
+        def read():
+            while not stopping.is_set():
+                state = store.current
+                if state.humidity != state.temperature + 1000:
+                    torn.append(state)
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        writers = [threading.Thread(target=write, args=(offset,)) for offset in (0, 100000, 200000)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        stopping.set()
+        reader.join()
+        self.assertEqual(torn, [])
+        self.assertEqual(store.version, 60000)
+
+    def test_concurrent_updates_of_different_fields_are_kept(self):
+        store = StateStore()
+
+        def write(field):
+            for value in range(10000):
+                store.update(**{field: value})
+
+        writers = [threading.Thread(target=write, args=(field,))
+                   for field in ("temperature", "humidity", "brightness")]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        state = store.current
+        self.assertEqual((state.temperature, state.humidity, state.brightness), (9999, 9999, 9999))
+
+
+class NightLightStateTestCase(TestCase):
+
+    def setUp(self):
+        from nightlightpi.nightlight import NightLight
+        patcher = patch("nightlightpi.simulated.default_broker", return_value=FakeBroker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.light = NightLight(make_config({"backend": "simulated"}))
+        self.addCleanup(self.light.stop)
+
+    def test_modes_are_kept_in_the_snapshot(self):
+        self.light.setDisplayMode("Off")
+        self.light.setLightMode(self.light.light_mode_index["Off"])
+        state = self.light.state.current
+        self.assertEqual((state.display_mode, state.light_mode), ("Off", 2))
+        self.assertEqual(self.light.displayMode, "Off")
+
+    def test_brightness_is_kept_in_the_snapshot(self):
+        self.light.setBrightness("20")
+        self.assertEqual(self.light.state.current.brightness, 20)
+        self.assertEqual(self.light.config.led_strip.brightness, 20)
+
+    def test_strip_lock_is_only_held_to_swap_the_frame(self):
+        strip = self.light.LEDStrip
+        lock = self.light.LEDStrip_lock
+        compose = strip.compose
+        swap = strip.swap
+        held = {}
+
+        def composing(*args):
+            held["compose"] = lock.locked()
+            return compose(*args)
+
+        def swapping(*args):
+            held["swap"] = lock.locked()
+            return swap(*args)
+
+        with patch.object(strip, "compose", composing), patch.object(strip, "swap", swapping):
+            self.light.setStripRGB((255, 0, 0))
+        self.assertEqual(held, {"compose": False, "swap": True})
+        self.assertEqual(strip.leds()[:4], strip.pixel((255, 0, 0), 6))